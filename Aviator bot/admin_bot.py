@@ -1,236 +1,181 @@
 import os
+import re
+import html
+import shutil
 import asyncio
-import random
 import logging
-import svgwrite
-from aiogram import Dispatcher, Bot, types
-from aiogram.filters import Command, CommandStart, BaseFilter
+from aiogram import Dispatcher, Bot, Router, F, types
+from aiogram.filters import Command, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import FSInputFile, BotCommand, BufferedInputFile
-from config import CHAT_ID, TOTAL_DIR
-from database import get_user, get_all_users, get_all_countries, get_users_by_country
-from user_bot import load_language_messages, get_user_language
+from config import CHAT_ID, ADMIN_MAX_TARGETS, ADMIN_INTERACTIVE_TARGETS, PROFILER_INTERVAL_MS, PROFILE_MAX_SECONDS
+from database import stream_users, find_users, get_deliveries
+from delivery import delivery, send_total, send_error, send_total_series, get_random_total_gif, broadcast, INTERACTIVE, BULK
+from reachability import reachability, ACTIVE
+from segments import Segment, parse_segment, segment_stats, iter_segment, SEGMENT_HELP
+from profiler import SamplingProfiler, collapsed, top_functions
+import metrics
 
 logger = logging.getLogger(__name__)
 
-# Фильтр для проверки админского чата
-class AdminChatFilter(BaseFilter):
-    async def __call__(self, obj: types.Message) -> bool:
-        try:
-            chat_id = obj.chat.id
-            is_admin_chat = str(chat_id) == str(CHAT_ID)
-            logger.debug(f"AdminChatFilter: chat_id={chat_id}, CHAT_ID={CHAT_ID}, is_admin_chat={is_admin_chat}")
-            return is_admin_chat
-        except Exception as e:
-            logger.error(f"Ошибка в AdminChatFilter: {e}", exc_info=True)
-            return False
+# Фоновые задачи команд (рассылки, массовые отправки, серии): ссылки держатся до завершения
+_background = set()
 
 # Определение состояний FSM (только для рассылки)
 class AdminStates(StatesGroup):
     awaiting_broadcast_message = State()
     awaiting_broadcast_media = State()
 
-# Валидация идентификатора пользователя
-async def validate_identifier(identifier: str) -> tuple[int, tuple] | tuple[None, None]:
-    """Валидирует user_id или username, возвращает user_id и user_data."""
-    try:
-        identifier = identifier.strip()
-        if not identifier:
-            logger.debug("Пустой идентификатор")
-            return None, None
-        user_data = None
-        if identifier.startswith('@'):
-            username = identifier[1:]
-            user_data = await get_user_by_username(username)
-            logger.debug(f"Поиск по username: {username}, результат={user_data}")
-        else:
-            try:
-                user_id = int(identifier)
-                if user_id <= 0:
-                    logger.debug(f"ID должен быть положительным: {identifier}")
-                    return None, None
-                user_data = get_user(user_id)
-                logger.debug(f"Поиск по user_id: {user_id}, результат={user_data}")
-            except ValueError:
-                logger.debug(f"Некорректный user_id: {identifier}")
-                return None, None
-        if not user_data:
-            logger.debug(f"Пользователь не найден для идентификатора: {identifier}")
-            return None, None
-        user_id = int(user_data[0])
-        return user_id, user_data
-    except Exception as e:
-        logger.error(f"Ошибка в validate_identifier для identifier={identifier}: {e}", exc_info=True)
-        return None, None
-
-# Функция отправки тотала
-async def send_total(bot: Bot, user_id: int, gif_path: str) -> bool:
-    """Отправляет одиночный тотал пользователю под спойлером."""
-    logger.info(f"Попытка отправки тотала: user_id={user_id}, gif_path={gif_path}")
-    try:
-        if not gif_path or not os.path.exists(gif_path):
-            logger.error(f"GIF не найден: {gif_path}")
-            return False
-
-        user = get_user(user_id)
-        if not user:
-            logger.error(f"Пользователь {user_id} не найден")
-            return False
-
-        country = user[3] or "Unknown"
-        lang_code = get_user_language(country)
-        messages = load_language_messages(lang_code)
-        message_text = random.choice(messages["total"]) or "Ваш тотал готов!"
-
-        def escape_markdown_v2(text: str) -> str:
-            chars = r'_[]()~`>#+-=|{}.!'
-            for char in chars:
-                text = text.replace(char, f'\\{char}')
-            return text
-
-        message_text = escape_markdown_v2(message_text)
-        with open(gif_path, 'rb') as file:
-            animation = BufferedInputFile(file.read(), filename=os.path.basename(gif_path))
-        await bot.send_animation(
-            chat_id=user_id,
-            animation=animation,
-            caption=f"||{message_text}||",
-            parse_mode="MarkdownV2",
-            has_spoiler=True
-        )
-        logger.info(f"Тотал успешно отправлен пользователю user_id={user_id}")
-        return True
-    except aiogram.exceptions.TelegramForbiddenError:
-        logger.warning(f"Пользователь {user_id} заблокировал бота")
-        return False
-    except aiogram.exceptions.TelegramRetryAfter as e:
-        logger.warning(f"Лимит Telegram, ожидание {e.retry_after} секунд")
-        await asyncio.sleep(e.retry_after)
-        return await send_total(bot, user_id, gif_path)
-    except Exception as e:
-        logger.error(f"Ошибка отправки тотала пользователю user_id={user_id}: {e}", exc_info=True)
-        return False
-
-# Получение случайного GIF
-def get_random_total_gif() -> str | None:
-    """Возвращает путь к случайному GIF."""
-    try:
-        if not os.path.exists(TOTAL_DIR):
-            logger.error(f"Папка {TOTAL_DIR} не найдена")
-            return None
-
-        gif_files = [f for f in os.listdir(TOTAL_DIR) if f.lower().endswith((".gif", ".mp4"))]
-        if not gif_files:
-            logger.error(f"Нет GIF или MP4 в папке {TOTAL_DIR}")
-            return None
-
-        gif_path = os.path.join(TOTAL_DIR, random.choice(gif_files))
-        logger.debug(f"Выбран GIF: {gif_path}")
-        return gif_path
-    except Exception as e:
-        logger.error(f"Ошибка получения случайного GIF: {e}", exc_info=True)
-        return None
-
-# Функция отправки ошибки
-async def send_error(bot: Bot, user_id: int) -> bool:
-    """Отправляет сообщение об ошибке пользователю."""
-    logger.info(f"Попытка отправки ошибки: user_id={user_id}")
-    try:
-        user = get_user(user_id)
-        if not user:
-            logger.error(f"Пользователь {user_id} не найден")
-            return False
-
-        country = user[3] or "Unknown"
-        lang_code = get_user_language(country)
-        messages = load_language_messages(lang_code)
-        message_text = random.choice(messages["error"]) or "Произошла ошибка. Попробуйте позже."
-        await bot.send_message(user_id, message_text)
-        logger.info(f"Ошибка отправлена user_id={user_id}")
-        return True
-    except aiogram.exceptions.TelegramForbiddenError:
-        logger.warning(f"Пользователь {user_id} заблокировал бота")
-        return False
-    except aiogram.exceptions.TelegramRetryAfter as e:
-        logger.warning(f"Лимит Telegram, ожидание {e.retry_after} секунд")
-        await asyncio.sleep(e.retry_after)
-        return await send_error(bot, user_id)
-    except Exception as e:
-        logger.error(f"Ошибка отправки ошибки user_id={user_id}: {e}", exc_info=True)
-        return False
-
-# Функция отправки серии тоталов
-async def send_total_series(bot: Bot, user_id: int, delay: int = 60, count: int = 10):
-    """Отправляет серию из 10 тоталов пользователю с интервалом в 1 минуту."""
-    logger.info(f"Запуск серии из {count} тоталов с интервалом {delay}с для user_id={user_id}")
-    try:
-        for i in range(count):
-            gif_path = get_random_total_gif()
-            if not gif_path:
-                logger.warning(f"Нет GIF для тотала {i+1}/{count}, user_id={user_id}")
-                continue
-            success = await send_total(bot, user_id, gif_path)
-            if success:
-                logger.info(f"Тотал {i+1}/{count} отправлен, user_id={user_id}")
+# Разбор списка идентификаторов пользователей
+def parse_identifiers(text: str) -> tuple[list[int], list[str], list[tuple[int, int]], list[str]]:
+    """Разбирает ID, @username и диапазоны ID вида 100-200 (через запятую или пробел).
+
+    Пустой диапазон (начало больше конца) и диапазон шире ADMIN_MAX_TARGETS
+    отклоняются сразу, до запроса к БД, и попадают в invalid.
+    """
+    ids, usernames, ranges, invalid = [], [], [], []
+    for token in re.split(r"[,\s]+", text.strip()):
+        if not token:
+            continue
+        if token.startswith('@') and len(token) > 1:
+            usernames.append(token[1:].lower())
+        elif re.fullmatch(r"\d+-\d+", token):
+            start, end = map(int, token.split('-'))
+            if not start:
+                invalid.append(token)
+            elif start > end:
+                invalid.append(f"{token} (пустой диапазон)")
+            elif end - start >= ADMIN_MAX_TARGETS:
+                invalid.append(f"{token} (диапазон шире {ADMIN_MAX_TARGETS})")
             else:
-                logger.error(f"Ошибка тотала {i+1}/{count}, user_id={user_id}")
-            if i < count - 1:  # Не ждем после последнего тотала
-                await asyncio.sleep(delay)
-    except Exception as e:
-        logger.error(f"Ошибка серии, user_id={user_id}: {e}", exc_info=True)
+                ranges.append((start, end))
+        elif token.isdigit() and int(token) > 0:
+            ids.append(int(token))
+        else:
+            invalid.append(token)
+    logger.debug(f"Идентификаторы: ids={ids}, usernames={usernames}, ranges={ranges}, invalid={invalid}")
+    return ids, usernames, ranges, invalid
+
+# Поиск получателей одним запросом
+def resolve_identifiers(text: str) -> tuple[list[tuple], list[str]]:
+    """Возвращает найденных пользователей и список ненайденных/некорректных идентификаторов."""
+    ids, usernames, ranges, invalid = parse_identifiers(text)
+    # Одна строка сверх лимита — чтобы отличить «ровно лимит» от «больше лимита», не читая остальные
+    users = {int(user[0]): user for user in find_users(ids, usernames, ranges, ADMIN_MAX_TARGETS + 1)}
+    found_usernames = {user[1].lower() for user in users.values() if user[1]}
+    missing = invalid
+    missing += [str(user_id) for user_id in ids if user_id not in users]
+    missing += [f"@{username}" for username in usernames if username not in found_usernames]
+    return list(users.values()), missing
+
+# Параллельная отправка нескольким получателям
+async def fan_out(users: list[tuple], send) -> tuple[list[int], list[int]]:
+    """Вызывает send(user, lane) для всех получателей; параллелизм ограничивает сервис доставки.
+
+    Несколько получателей — интерактивная полоса, больше ADMIN_INTERACTIVE_TARGETS — bulk.
+    """
+    lane = INTERACTIVE if len(users) <= ADMIN_INTERACTIVE_TARGETS else BULK
+    results = await asyncio.gather(*(send(user, lane) for user in users))
+    sent = [int(user[0]) for user, ok in zip(users, results) if ok]
+    failed = [int(user[0]) for user, ok in zip(users, results) if not ok]
+    return sent, failed
+
+# Запуск долгой отправки в фоне
+def detach(coro) -> asyncio.Task:
+    """Запускает задачу отдельно от обработчика: апдейты админа не ждут окончания отправки."""
+    task = asyncio.create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_finished)
+    return task
+
+def _finished(task: asyncio.Task):
+    _background.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error(f"Ошибка фоновой задачи {task.get_coro().__qualname__}: {task.exception()}", exc_info=task.exception())
+
+# Сводный отчет по команде
+def format_report(title: str, sent: list[int], failed: list[int], missing: list[str],
+                  unreachable: list[int] = (), limit: int = 50) -> str:
+    """Формирует один ответ с итогами отправки по всем получателям."""
+    def listing(items: list[str]) -> str:
+        text = ", ".join(items[:limit])
+        if len(items) > limit:
+            text += f" и ещё {len(items) - limit}"
+        return text
+
+    lines = [f"{title}: {len(sent)}/{len(sent) + len(failed)}"]
+    if failed:
+        lines.append(f"❌ Не доставлено: {listing([f'<code>{user_id}</code>' for user_id in failed])}")
+    if missing:
+        lines.append(f"❓ Не найдены: {listing([html.escape(item) for item in missing])}")
+    if unreachable:
+        lines.append(f"🚫 Заблокировали бота: {listing([f'<code>{user_id}</code>' for user_id in unreachable])}")
+    return "\n".join(lines)
 
 # Генерация SVG с пользователями
-def generate_users_svg(users: list) -> str | None:
-    """Генерирует SVG-файл с данными пользователей."""
+def generate_users_svg(path: str = "users.svg") -> int | None:
+    """Выгружает пользователей в SVG-файл и возвращает их число; None — ошибка.
+
+    Строки читаются из БД пачками (stream_users) и сразу пишутся в файл, поэтому память
+    не растет с числом пользователей. Высота документа известна только в конце: строки
+    пишутся во временный файл и затем копируются в итоговый после заголовка.
+    """
+    body_path = f"{path}.part"
+    count = 0
     try:
-        dwg = svgwrite.Drawing("users.svg", profile="tiny", size=("800px", f"{len(users) * 30 + 50}px"))
-        dwg.add(dwg.rect(insert=(0, 0), size=("100%", "100%"), fill="white"))
-        dwg.add(dwg.text("Users List", insert=(10, 20), font_size="16", font_family="Arial", fill="black"))
-
-        for i, user in enumerate(users):
-            telegram_id, username, phone, country = user
-            text = f"ID: {telegram_id}, Username: @{username or 'None'}, Country: {country or 'N/A'}"
-            dwg.add(dwg.text(text, insert=(10, 40 + i * 30), font_size="14", font_family="Arial", fill="black"))
-
-        dwg.save()
-        logger.info("SVG-файл сгенерирован: users.svg")
-        return "users.svg"
+        with open(body_path, "w", encoding="utf-8") as body:
+            def consume(rows):
+                nonlocal count
+                for telegram_id, username, phone, country in rows:
+                    text = html.escape(f"ID: {telegram_id}, Username: @{username or 'None'}, Country: {country or 'N/A'}")
+                    body.write(f'<text fill="black" font-family="Arial" font-size="14" x="10" y="{40 + count * 30}">{text}</text>')
+                    count += 1
+
+            if not stream_users(consume):
+                return None
+        with open(path, "w", encoding="utf-8") as f, open(body_path, encoding="utf-8") as body:
+            f.write(
+                '<?xml version="1.0" encoding="utf-8" ?>\n'
+                f'<svg baseProfile="full" height="{count * 30 + 50}px" version="1.1" width="800px" '
+                'xmlns="http://www.w3.org/2000/svg" xmlns:ev="http://www.w3.org/2001/xml-events" '
+                'xmlns:xlink="http://www.w3.org/1999/xlink"><defs />'
+                '<rect fill="white" height="100%" width="100%" x="0" y="0" />'
+                '<text fill="black" font-family="Arial" font-size="16" x="10" y="20">Users List</text>'
+            )
+            shutil.copyfileobj(body, f)
+            f.write("</svg>")
+        logger.info(f"SVG-файл сгенерирован: {path}, пользователей: {count}")
+        return count
     except Exception as e:
         logger.error(f"Ошибка генерации SVG: {e}", exc_info=True)
         return None
-
-# Поиск пользователя по username
-async def get_user_by_username(username: str) -> tuple | None:
-    """Ищет пользователя по username в базе данных."""
-    try:
-        users = get_all_users()
-        for user in users:
-            telegram_id, user_username, phone, country = user
-            if user_username and user_username.lower() == username.lower():
-                logger.debug(f"Найден пользователь: telegram_id={telegram_id}, username={user_username}")
-                return user
-        logger.debug(f"Пользователь не найден для username={username}")
-        return None
-    except Exception as e:
-        logger.error(f"Ошибка в get_user_by_username для username={username}: {e}", exc_info=True)
-        return None
+    finally:
+        if os.path.exists(body_path):
+            os.remove(body_path)
 
 # Регистрация админских обработчиков
 def register_admin_handlers(dp: Dispatcher, bot: Bot):
     logger.info("Регистрация админских обработчиков")
 
+    # Все обработчики роутера видят только админский чат: фильтр проверяется один раз на апдейт
+    router = Router(name="admin")
+    router.message.filter(F.chat.id == CHAT_ID)
+
     # Установка команд для автозаполнения
     async def set_bot_commands():
         commands = [
             BotCommand(command="hello", description="Открыть админ-панель"),
             BotCommand(command="help", description="Показать список команд"),
-            BotCommand(command="send_total", description="Отправить тотал: /send_total <id/username>"),
-            BotCommand(command="send_series", description="Отправить серию тоталов: /send_series <id/username>"),
-            BotCommand(command="send_error", description="Отправить ошибку: /send_error <id/username>"),
+            BotCommand(command="send_total", description="Отправить тотал: /send_total <id/@username/from-to ...>"),
+            BotCommand(command="send_series", description="Отправить серию тоталов: /send_series <id/@username/from-to ...>"),
+            BotCommand(command="send_error", description="Отправить ошибку: /send_error <id/@username/from-to ...>"),
             BotCommand(command="get_all_users", description="Получить список пользователей в SVG"),
-            BotCommand(command="broadcast", description="Рассылка по стране: /broadcast <country>"),
+            BotCommand(command="broadcast", description="Рассылка по сегменту: /broadcast <country | условия>"),
             BotCommand(command="clean", description="Очистить все FSM-состояния"),
+            BotCommand(command="stats", description="Показать метрики бота"),
+            BotCommand(command="deliveries", description="История доставок: /deliveries <id/username>"),
+            BotCommand(command="profile", description="Профилировать бота: /profile <seconds>"),
             BotCommand(command="start", description="Запустить бота (используйте /help)")
         ]
         await bot.set_my_commands(commands)
@@ -240,299 +185,374 @@ def register_admin_handlers(dp: Dispatcher, bot: Bot):
     asyncio.create_task(set_bot_commands())
 
     # Команда /hello
-    @dp.message(AdminChatFilter(), Command("hello"))
+    @router.message(Command("hello"))
     async def cmd_hello(message: types.Message):
         try:
-            await message.reply("📋 Добро пожаловать в админ-панель! Используйте /help для списка команд.")
+            await delivery.call(INTERACTIVE, message.reply, "📋 Добро пожаловать в админ-панель! Используйте /help для списка команд.")
         except Exception as e:
             logger.error(f"Ошибка в /hello: {e}", exc_info=True)
-            await message.reply("❌ Ошибка. Обратитесь в поддержку.")
+            await delivery.call(INTERACTIVE, message.reply, "❌ Ошибка. Обратитесь в поддержку.")
 
     # Команда /help
-    @dp.message(AdminChatFilter(), Command("help"))
+    @router.message(Command("help"))
     async def cmd_help(message: types.Message):
         try:
             help_text = (
                 "📋 Список команд админ-панели:\n\n"
                 "/hello - Открыть админ-панель\n"
                 "/help - Показать этот список\n"
-                "/send_total <id/username> - Отправить одиночный тотал\n"
-                "/send_series <id/username> - Отправить серию тоталов (10 штук)\n"
-                "/send_error <id/username> - Отправить сообщение об ошибке\n"
+                "/send_total <id/@username/from-to ...> - Отправить одиночный тотал\n"
+                "/send_series <id/@username/from-to ...> - Отправить серию тоталов (10 штук)\n"
+                "/send_error <id/@username/from-to ...> - Отправить сообщение об ошибке\n"
+                "Получателей можно перечислить через запятую или пробел, from-to — диапазон ID.\n"
                 "/get_all_users - Получить список пользователей в SVG\n"
-                "/broadcast <country> - Запустить рассылку по стране\n"
-                "/clean - Очистить все FSM-состояния"
+                "/broadcast <country | условия> - Рассылка по стране или сегменту (country=, lang=, since=, until=, status=)\n"
+                "/clean - Очистить все FSM-состояния\n"
+                "/stats - Показать метрики бота\n"
+                "/deliveries <id/username> - Последние доставки пользователю\n"
+                "/profile <seconds> - Снять профиль работы бота"
             )
-            await message.reply(help_text)
+            await delivery.call(INTERACTIVE, message.reply, help_text)
         except Exception as e:
             logger.error(f"Ошибка в /help: {e}", exc_info=True)
-            await message.reply("❌ Ошибка. Обратитесь в поддержку.")
+            await delivery.call(INTERACTIVE, message.reply, "❌ Ошибка. Обратитесь в поддержку.")
 
     # Команда /start
-    @dp.message(AdminChatFilter(), CommandStart())
+    @router.message(CommandStart())
     async def cmd_start_admin(message: types.Message):
         try:
-            await message.reply("❌ Используйте /help для списка команд.")
+            await delivery.call(INTERACTIVE, message.reply, "❌ Используйте /help для списка команд.")
         except Exception as e:
             logger.error(f"Ошибка в /start: {e}", exc_info=True)
-            await message.reply("❌ Ошибка. Обратитесь в поддержку.")
+            await delivery.call(INTERACTIVE, message.reply, "❌ Ошибка. Обратитесь в поддержку.")
 
     # Команда /clean
-    @dp.message(AdminChatFilter(), Command("clean"))
+    @router.message(Command("clean"))
     async def cmd_clean(message: types.Message, state: FSMContext):
         try:
             await state.clear()
-            await message.reply("✅ Все FSM-состояния очищены.")
+            await delivery.call(INTERACTIVE, message.reply, "✅ Все FSM-состояния очищены.")
             logger.info("FSM-состояния очищены по команде /clean")
         except Exception as e:
             logger.error(f"Ошибка в /clean: {e}", exc_info=True)
-            await message.reply("❌ Ошибка. Обратитесь в поддержку.")
+            await delivery.call(INTERACTIVE, message.reply, "❌ Ошибка. Обратитесь в поддержку.")
+
+    # Разбор получателей команды и проверка лимита
+    async def command_targets(message: types.Message, command: str) -> tuple[list[tuple], list[str], list[int]] | None:
+        args = message.text.split(maxsplit=1)
+        if len(args) < 2:
+            await delivery.call(INTERACTIVE, message.reply, f"❌ Укажите ID или username: /{command} <id/@username/from-to ...>")
+            return None
+        users, missing = await asyncio.to_thread(resolve_identifiers, args[1])
+        if not users:
+            await delivery.call(INTERACTIVE, message.reply, "❌ Пользователи не найдены или некорректные ID/username.")
+            return None
+        if len(users) > ADMIN_MAX_TARGETS:
+            await delivery.call(INTERACTIVE, message.reply, f"❌ Слишком много получателей: больше {ADMIN_MAX_TARGETS}.")
+            return None
+        unreachable = [int(user[0]) for user in users if not reachability.is_reachable(int(user[0]))]
+        reachability.skipped(len(unreachable))
+        users = [user for user in users if reachability.is_reachable(int(user[0]))]
+        return users, missing, unreachable
+
+    # Ключ идемпотентности: повторная доставка того же апдейта не отправит сообщение второй раз
+    def command_key(message: types.Message, kind: str, user: tuple) -> str:
+        return f"{kind}:{message.chat.id}:{message.message_id}:{user[0]}"
+
+    # Отправка получателям команды и отчет
+    async def deliver(message: types.Message, command: str, title: str, users: list[tuple], send,
+                      missing: list[str], unreachable: list[int]):
+        """Несколько получателей — сразу в обработчике; bulk-отправка — в фоне с отчетом отдельным сообщением."""
+        async def run():
+            try:
+                sent, failed = await fan_out(users, send)
+                await delivery.call(INTERACTIVE, message.reply, format_report(title, sent, failed, missing, unreachable), parse_mode="HTML")
+            except Exception as e:
+                logger.error(f"Ошибка в /{command}: {e}", exc_info=True)
+                await delivery.call(INTERACTIVE, message.reply, "❌ Ошибка. Попробуйте снова.")
+
+        if len(users) <= ADMIN_INTERACTIVE_TARGETS:
+            await run()
+            return
+        detach(run())
+        await delivery.call(INTERACTIVE, message.reply, f"⏳ Отправка {len(users)} получателям запущена, отчет придет отдельным сообщением.")
 
     # Команда /send_total
-    @dp.message(AdminChatFilter(), Command("send_total"))
+    @router.message(Command("send_total"))
     async def cmd_send_total(message: types.Message):
         try:
-            args = message.text.split(maxsplit=1)
-            if len(args) < 2:
-                await message.reply("❌ Укажите ID или username: /send_total <id/username>")
-                return
-            identifier = args[1].strip()
-            user_id, user_data = await validate_identifier(identifier)
-            if not user_data:
-                await message.reply("❌ Пользователь не найден или некорректный ID/username.")
+            targets = await command_targets(message, "send_total")
+            if not targets:
                 return
+            users, missing, unreachable = targets
 
-            gif_path = get_random_total_gif()
-            if not gif_path:
-                await message.reply("❌ Нет доступных GIF.")
+            if not get_random_total_gif():
+                await delivery.call(INTERACTIVE, message.reply, "❌ Нет доступных GIF.")
                 return
 
-            success = await send_total(bot, user_id, gif_path)
-            if success:
-                await message.reply(f"✅ Тотал отправлен пользователю <code>{user_id}</code>", parse_mode="HTML")
-                await bot.send_message(
-                    CHAT_ID,
-                    f"📤 Тотал отправлен пользователю <code>{user_id}</code>",
-                    parse_mode="HTML"
-                )
-            else:
-                await message.reply(f"❌ Ошибка отправки тотала <code>{user_id}</code>", parse_mode="HTML")
+            async def send(user: tuple, lane: str) -> bool:
+                return await send_total(int(user[0]), user=user, lane=lane, key=command_key(message, "total", user))
+
+            await deliver(message, "send_total", "📤 Тотал отправлен", users, send, missing, unreachable)
         except Exception as e:
             logger.error(f"Ошибка в /send_total: {e}", exc_info=True)
-            await message.reply("❌ Ошибка. Попробуйте снова.")
+            await delivery.call(INTERACTIVE, message.reply, "❌ Ошибка. Попробуйте снова.")
 
     # Команда /send_series
-    @dp.message(AdminChatFilter(), Command("send_series"))
+    @router.message(Command("send_series"))
     async def cmd_send_series(message: types.Message):
         try:
-            args = message.text.split(maxsplit=1)
-            if len(args) < 2:
-                await message.reply("❌ Укажите ID или username: /send_series <id/username>")
-                return
-            identifier = args[1].strip()
-            user_id, user_data = await validate_identifier(identifier)
-            if not user_data:
-                await message.reply("❌ Пользователь не найден или некорректный ID/username.")
+            targets = await command_targets(message, "send_series")
+            if not targets:
                 return
+            users, missing, unreachable = targets
 
-            await message.reply(f"✅ Серия запланирована для <code>{user_id}</code>", parse_mode="HTML")
-            await bot.send_message(CHAT_ID, f"📦 Серия тоталов запланирована для <code>{user_id}</code>", parse_mode="HTML")
-            asyncio.create_task(send_total_series(bot, user_id))
+            for user in users:
+                detach(send_total_series(int(user[0]), user=user, key=command_key(message, "series", user)))
+            scheduled = [int(user[0]) for user in users]
+            await delivery.call(INTERACTIVE, message.reply,
+                format_report("📦 Серия запланирована", scheduled, [], missing, unreachable), parse_mode="HTML"
+            )
         except Exception as e:
             logger.error(f"Ошибка в /send_series: {e}", exc_info=True)
-            await message.reply("❌ Ошибка. Попробуйте снова.")
+            await delivery.call(INTERACTIVE, message.reply, "❌ Ошибка. Попробуйте снова.")
 
     # Команда /send_error
-    @dp.message(AdminChatFilter(), Command("send_error"))
+    @router.message(Command("send_error"))
     async def cmd_send_error(message: types.Message):
+        try:
+            targets = await command_targets(message, "send_error")
+            if not targets:
+                return
+            users, missing, unreachable = targets
+
+            async def send(user: tuple, lane: str) -> bool:
+                return await send_error(int(user[0]), user, lane=lane, key=command_key(message, "error", user))
+
+            await deliver(message, "send_error", "⚠️ Ошибка отправлена", users, send, missing, unreachable)
+        except Exception as e:
+            logger.error(f"Ошибка в /send_error: {e}", exc_info=True)
+            await delivery.call(INTERACTIVE, message.reply, "❌ Ошибка. Попробуйте снова.")
+
+    # Команда /stats
+    @router.message(Command("stats"))
+    async def cmd_stats(message: types.Message):
+        try:
+            await delivery.call(INTERACTIVE, message.reply, f"<pre>{html.escape(metrics.format_snapshot())}</pre>", parse_mode="HTML")
+        except Exception as e:
+            logger.error(f"Ошибка в /stats: {e}", exc_info=True)
+            await delivery.call(INTERACTIVE, message.reply, "❌ Ошибка. Обратитесь в поддержку.")
+
+    # Команда /deliveries
+    @router.message(Command("deliveries"))
+    async def cmd_deliveries(message: types.Message):
         try:
             args = message.text.split(maxsplit=1)
             if len(args) < 2:
-                await message.reply("❌ Укажите ID или username: /send_error <id/username>")
+                await delivery.call(INTERACTIVE, message.reply, "❌ Укажите ID или username: /deliveries <id/username>")
+                return
+            users, _ = await asyncio.to_thread(resolve_identifiers, args[1])
+            if len(users) != 1:
+                await delivery.call(INTERACTIVE, message.reply, "❌ Укажите одного существующего пользователя.")
                 return
-            identifier = args[1].strip()
-            user_id, user_data = await validate_identifier(identifier)
-            if not user_data:
-                await message.reply("❌ Пользователь не найден или некорректный ID/username.")
+            user_id = int(users[0][0])
+            rows = await asyncio.to_thread(get_deliveries, user_id)
+            if not rows:
+                await delivery.call(INTERACTIVE, message.reply, f"📭 Доставок пользователю <code>{user_id}</code> нет.", parse_mode="HTML")
                 return
+            lines = [
+                f"{created_at:%Y-%m-%d %H:%M:%S} {kind} {status}" + (f" ({html.escape(error)})" if error else "")
+                for kind, asset, status, error, created_at in rows
+            ]
+            await delivery.call(INTERACTIVE, message.reply, f"📬 Доставки <code>{user_id}</code>:\n" + "\n".join(lines), parse_mode="HTML")
+        except Exception as e:
+            logger.error(f"Ошибка в /deliveries: {e}", exc_info=True)
+            await delivery.call(INTERACTIVE, message.reply, "❌ Ошибка. Обратитесь в поддержку.")
 
-            success = await send_error(bot, user_id)
-            if success:
-                await message.reply(f"✅ Ошибка отправлена пользователю <code>{user_id}</code>", parse_mode="HTML")
-                await bot.send_message(
-                    CHAT_ID,
-                    f"⚠️ Ошибка отправлена пользователю <code>{user_id}</code>",
-                    parse_mode="HTML"
-                )
-            else:
-                await message.reply(f"❌ Ошибка отправки <code>{user_id}</code>", parse_mode="HTML")
+    # Команда /profile
+    profiler = SamplingProfiler(PROFILER_INTERVAL_MS)
+    # Текущее профилирование: окно идет в фоне, обработчик отвечает сразу
+    profiling = {"task": None}
+
+    async def run_profile(message: types.Message, seconds: int):
+        try:
+            stacks = await profiler.profile(seconds)
+            if not stacks:
+                await delivery.call(INTERACTIVE, message.reply, "🚫 Нет сэмплов.")
+                return
+            await delivery.call(INTERACTIVE, bot.send_document,
+                CHAT_ID,
+                document=BufferedInputFile(collapsed(stacks).encode(), filename="profile.collapsed"),
+                caption=f"🔥 Профиль за {seconds}с: {profiler.samples} сэмплов (flamegraph.pl / speedscope)"
+            )
+            # Отчет файлом: таблица функций длиннее лимита сообщения Telegram
+            await delivery.call(INTERACTIVE, bot.send_document,
+                CHAT_ID,
+                document=BufferedInputFile(top_functions(stacks).encode(), filename="profile_top.txt"),
+                caption="📊 Самые затратные функции"
+            )
         except Exception as e:
-            logger.error(f"Ошибка в /send_error: {e}", exc_info=True)
-            await message.reply("❌ Ошибка. Попробуйте снова.")
+            logger.error(f"Ошибка профилирования: {e}", exc_info=True)
+            await delivery.call(INTERACTIVE, message.reply, "❌ Ошибка профилирования.")
+
+    @router.message(Command("profile"))
+    async def cmd_profile(message: types.Message):
+        try:
+            args = message.text.split(maxsplit=1)
+            if len(args) < 2 or not args[1].strip().isdigit() or not 0 < int(args[1]) <= PROFILE_MAX_SECONDS:
+                await delivery.call(INTERACTIVE, message.reply, f"❌ Укажите длительность: /profile <1-{PROFILE_MAX_SECONDS}>")
+                return
+            if profiling["task"] and not profiling["task"].done():
+                await delivery.call(INTERACTIVE, message.reply, "⏳ Профилирование уже идет.")
+                return
+            seconds = int(args[1])
+            profiling["task"] = asyncio.create_task(run_profile(message, seconds))
+            await delivery.call(INTERACTIVE, message.reply, f"⏱ Профилирую {seconds}с, результат придет отдельным сообщением.")
+        except Exception as e:
+            logger.error(f"Ошибка в /profile: {e}", exc_info=True)
+            await delivery.call(INTERACTIVE, message.reply, "❌ Ошибка. Обратитесь в поддержку.")
 
     # Команда /get_all_users
-    @dp.message(AdminChatFilter(), Command("get_all_users"))
+    @router.message(Command("get_all_users"))
     async def cmd_get_all_users(message: types.Message):
         try:
-            users = get_all_users()
-            if not users:
-                await message.reply("🚫 Нет пользователей.")
+            count = await asyncio.to_thread(generate_users_svg)
+            if count is None:
+                await delivery.call(INTERACTIVE, message.reply, "❌ Ошибка генерации SVG.")
                 return
-            svg_file = generate_users_svg(users)
-            if not svg_file:
-                await message.reply("❌ Ошибка генерации SVG.")
+            if not count:
+                await delivery.call(INTERACTIVE, message.reply, "🚫 Нет пользователей.")
                 return
-            await bot.send_document(
+            await delivery.call(INTERACTIVE, bot.send_document,
                 CHAT_ID,
-                document=FSInputFile(path=svg_file, filename="users.svg"),
+                document=FSInputFile(path="users.svg", filename="users.svg"),
                 caption="📊 Список пользователей"
             )
-            await message.reply("✅ SVG-файл отправлен.")
+            await delivery.call(INTERACTIVE, message.reply, "✅ SVG-файл отправлен.")
         except Exception as e:
             logger.error(f"Ошибка в /get_all_users: {e}", exc_info=True)
-            await message.reply("❌ Ошибка. Обратитесь в поддержку.")
+            await delivery.call(INTERACTIVE, message.reply, "❌ Ошибка. Обратитесь в поддержку.")
 
     # Команда /broadcast
-    @dp.message(AdminChatFilter(), Command("broadcast"))
+    @router.message(Command("broadcast"))
     async def start_broadcast(message: types.Message, state: FSMContext):
         try:
             args = message.text.split(maxsplit=1)
+            countries = await segment_stats.countries()
+            countries_text = "\n".join([f"- {c}" for c in countries]) if countries else "Нет стран."
             if len(args) < 2:
-                countries = get_all_countries()
-                countries_text = "\n".join([f"- {c}" for c in countries]) if countries else "Нет стран."
-                await message.reply(f"❌ Укажите страну: /broadcast <country>\nДоступные страны:\n{countries_text}")
+                await delivery.call(INTERACTIVE, message.reply, f"❌ Укажите сегмент.\n{SEGMENT_HELP}\nДоступные страны:\n{countries_text}")
                 return
-            country = args[1].strip()
-            countries = get_all_countries()
-            if country not in countries:
+            try:
+                segment = parse_segment(args[1])
+            except ValueError as e:
+                await delivery.call(INTERACTIVE, message.reply, f"❌ {e}\n{SEGMENT_HELP}")
+                return
+            unknown = [country for country in segment.countries if country not in countries]
+            if unknown:
+                # Страна могла появиться после загрузки агрегатов
+                segment_stats.invalidate()
+                countries = await segment_stats.countries()
                 countries_text = "\n".join([f"- {c}" for c in countries]) if countries else "Нет стран."
-                await message.reply(f"❌ Страна не найдена. Доступные страны:\n{countries_text}")
+                unknown = [country for country in segment.countries if country not in countries]
+            if unknown:
+                await delivery.call(INTERACTIVE, message.reply, f"❌ Страна не найдена: {', '.join(unknown)}. Доступные страны:\n{countries_text}")
+                return
+            size = await segment_stats.preview(segment)
+            if not size:
+                await delivery.call(INTERACTIVE, message.reply, f"🚫 Нет пользователей в сегменте ({segment.describe()}).")
                 return
-            await state.update_data(country=country)
+            await state.update_data(segment=args[1].strip())
             await state.set_state(AdminStates.awaiting_broadcast_message)
-            await message.reply(f"📝 Введите сообщение для рассылки в {country}:")
-            logger.debug(f"FSM: Установлено состояние awaiting_broadcast_message, country={country}")
+            await delivery.call(INTERACTIVE, message.reply, f"🎯 Сегмент: {segment.describe()}\n👥 Получателей: ≈{size}\n\n📝 Введите сообщение для рассылки:")
+            logger.debug(f"FSM: Установлено состояние awaiting_broadcast_message, segment={segment.describe()}")
         except Exception as e:
             logger.error(f"Ошибка в /broadcast: {e}", exc_info=True)
-            await message.reply("❌ Ошибка. Попробуйте снова.")
+            await delivery.call(INTERACTIVE, message.reply, "❌ Ошибка. Попробуйте снова.")
             await state.clear()
 
-    @dp.message(AdminChatFilter(), AdminStates.awaiting_broadcast_message)
+    @router.message(AdminStates.awaiting_broadcast_message)
     async def process_broadcast_message(message: types.Message, state: FSMContext):
         try:
             broadcast_message = message.text.strip() if message.text else ""
             logger.debug(f"process_broadcast_message: message={broadcast_message}")
             if not broadcast_message:
-                await message.reply("❌ Сообщение не может быть пустым.")
+                await delivery.call(INTERACTIVE, message.reply, "❌ Сообщение не может быть пустым.")
                 return
             await state.update_data(message=broadcast_message)
             await state.set_state(AdminStates.awaiting_broadcast_media)
-            await message.reply(
-                f"🌍 Страна: {state.get_data().get('country')}\n\n📝 Сообщение:\n{broadcast_message}\n\n"
+            data = await state.get_data()
+            await delivery.call(INTERACTIVE, message.reply,
+                f"🎯 Сегмент: {parse_segment(data.get('segment')).describe()}\n\n📝 Сообщение:\n{broadcast_message}\n\n"
                 "📸 Отправьте фото или видео (или напишите 'пропустить' для отправки без медиа):"
             )
             logger.debug(f"FSM: Установлено состояние awaiting_broadcast_media")
         except Exception as e:
             logger.error(f"Ошибка в process_broadcast_message: {e}", exc_info=True)
-            await message.reply("❌ Ошибка. Попробуйте снова.")
+            await delivery.call(INTERACTIVE, message.reply, "❌ Ошибка. Попробуйте снова.")
             await state.clear()
 
-    @dp.message(AdminChatFilter(), AdminStates.awaiting_broadcast_media)
+    # Рассылка идет в фоне: админ может выполнять другие команды, итог придет отдельным сообщением
+    async def run_broadcast(message: types.Message, segment: Segment, text: str, media: dict | None, skipped: int):
+        try:
+            key = f"broadcast:{message.chat.id}:{message.message_id}"
+            success_count, total = await broadcast(iter_segment(segment), text, media, key=key)
+            if not total:
+                await delivery.call(INTERACTIVE, message.reply, f"🚫 Нет пользователей в сегменте ({segment.describe()}).")
+                return
+            await delivery.call(INTERACTIVE, message.reply,
+                f"✅ Рассылка завершена ({segment.describe()}): отправлено {success_count}/{total} сообщений, "
+                f"пропущено недоступных: {skipped}."
+            )
+        except Exception as e:
+            logger.error(f"Ошибка рассылки: {e}", exc_info=True)
+            await delivery.call(INTERACTIVE, message.reply, "❌ Ошибка рассылки.")
+
+    @router.message(AdminStates.awaiting_broadcast_media)
     async def process_broadcast_media(message: types.Message, state: FSMContext):
         try:
             data = await state.get_data()
             logger.debug(f"process_broadcast_media: data={data}")
             media = None
-            media_filename = None
             if message.photo:
-                photo = message.photo[-1]
-                file = await bot.get_file(photo.file_id)
-                file_content = await bot.download_file(file.file_path)
-                media_filename = f"photo_{photo.file_id}.jpg"
-                media = {"type": "photo", "content": file_content.read(), "filename": media_filename}
-                logger.debug(f"Получено фото: file_id={photo.file_id}, filename={media_filename}")
+                # file_id пригоден для повторной отправки этим же ботом — файл не скачиваем
+                media = {"type": "photo", "file_id": message.photo[-1].file_id}
+                logger.debug(f"Получено фото: file_id={media['file_id']}")
             elif message.video:
-                video = message.video
-                file = await bot.get_file(video.file_id)
-                file_content = await bot.download_file(file.file_path)
-                media_filename = f"video_{video.file_id}.mp4"
-                media = {"type": "video", "content": file_content.read(), "filename": media_filename}
-                logger.debug(f"Получено видео: file_id={video.file_id}, filename={media_filename}")
+                media = {"type": "video", "file_id": message.video.file_id}
+                logger.debug(f"Получено видео: file_id={media['file_id']}")
             elif message.text and message.text.strip().lower() == "пропустить":
                 logger.debug("Медиа пропущено")
             else:
-                await message.reply("❌ Отправьте фото, видео или напишите 'пропустить'.")
+                await delivery.call(INTERACTIVE, message.reply, "❌ Отправьте фото, видео или напишите 'пропустить'.")
                 return
 
-            country = data.get("country")
+            segment = parse_segment(data.get("segment"))
             broadcast_message = data.get("message")
-            user_ids = get_users_by_country(country)
-            if not user_ids:
-                await message.reply(f"🚫 Нет пользователей в стране {country}.")
-                await state.clear()
-                return
-
-            success_count = 0
-            for user_id in user_ids:
-                try:
-                    user = get_user(user_id)
-                    if not user:
-                        logger.warning(f"Пользователь {user_id} не найден при рассылке")
-                        continue
-                    user_country = user[3] or "Unknown"
-                    lang_code = get_user_language(user_country)
-                    messages = load_language_messages(lang_code)
-                    localized_message = broadcast_message
-                    if media:
-                        media_file = BufferedInputFile(media["content"], filename=media["filename"])
-                        if media["type"] == "photo":
-                            await bot.send_photo(user_id, photo=media_file, caption=localized_message)
-                        elif media["type"] == "video":
-                            await bot.send_video(user_id, video=media_file, caption=localized_message)
-                    else:
-                        await bot.send_message(user_id, localized_message)
-                    success_count += 1
-                    await asyncio.sleep(0.05)
-                except aiogram.exceptions.TelegramForbiddenError:
-                    logger.warning(f"Пользователь {user_id} заблокировал бота при рассылке")
-                    continue
-                except aiogram.exceptions.TelegramRetryAfter as e:
-                    logger.warning(f"Лимит Telegram, ожидание {e.retry_after} секунд")
-                    await asyncio.sleep(e.retry_after)
-                    continue
-                except Exception as e:
-                    logger.error(f"Ошибка отправки пользователю {user_id}: {e}", exc_info=True)
-                    continue
-            await message.reply(
-                f"✅ Рассылка завершена в {country}: отправлено {success_count}/{len(user_ids)} сообщений."
-            )
-            await bot.send_message(
-                CHAT_ID,
-                f"🌍 Рассылка завершена в {country}: отправлено {success_count}/{len(user_ids)} сообщений."
-            )
+            # Недоступные пропускаются сегментом по умолчанию (status=active); их число — из кеша агрегатов
+            skipped = 0
+            if segment.statuses == (ACTIVE,):
+                everyone = Segment(segment.countries, segment.languages, segment.since, segment.until, statuses=())
+                skipped = max(await segment_stats.preview(everyone) - await segment_stats.preview(segment), 0)
+                reachability.skipped(skipped)
+
+            # Состояние сбрасывается до запуска: следующее сообщение админа не начнет вторую рассылку
             await state.clear()
+            detach(run_broadcast(message, segment, broadcast_message, media, skipped))
+            await delivery.call(INTERACTIVE, message.reply, f"🚀 Рассылка запущена ({segment.describe()}), итог придет отдельным сообщением.")
         except Exception as e:
             logger.error(f"Ошибка в process_broadcast_media: {e}", exc_info=True)
-            await message.reply("❌ Ошибка. Попробуйте снова.")
+            await delivery.call(INTERACTIVE, message.reply, "❌ Ошибка. Попробуйте снова.")
             await state.clear()
 
-    # Обработка любых текстовых сообщений
-    @dp.message(AdminChatFilter())
-    async def catch_unhandled_fsm_messages(message: types.Message, state: FSMContext):
+    # Сообщения без подходящего обработчика (состояния рассылки обрабатываются выше)
+    @router.message()
+    async def catch_unhandled_messages(message: types.Message, state: FSMContext):
         try:
-            current_state = await state.get_state()
-            logger.debug(f"catch_unhandled_fsm_messages: text='{message.text}', state={current_state}")
-            if current_state == AdminStates.awaiting_broadcast_message:
-                await process_broadcast_message(message, state)
-                return
-            elif current_state == AdminStates.awaiting_broadcast_media:
-                await process_broadcast_media(message, state)
-                return
-            await message.reply("❌ Используйте /help для списка команд.")
+            await delivery.call(INTERACTIVE, message.reply, "❌ Используйте /help для списка команд.")
             await state.clear()
         except Exception as e:
-            logger.error(f"Ошибка в catch_unhandled_fsm_messages: {e}", exc_info=True)
-            await message.reply("❌ Ошибка. Используйте /help.")
-            await state.clear()
+            logger.error(f"Ошибка в catch_unhandled_messages: {e}", exc_info=True)
 
+    dp.include_router(router)
     logger.info("Все админские обработчики зарегистрированы")
\ No newline at end of file
@@ -1,6 +1,7 @@
 import asyncio
 import random
 from aiogram.types import Message
+from delivery import delivery, REGISTRATION
 
 async def loading_animation(message: Message):
     """Анимация загрузки перед логами (одно сообщение)"""
@@ -11,18 +12,18 @@ async def loading_animation(message: Message):
         "🛡️ Confirming access..."
     ]
 
-    loading_msg = await message.answer("<pre>⏳ Starting process...</pre>", parse_mode="HTML")
+    loading_msg = await delivery.call(REGISTRATION, message.answer, "<pre>⏳ Starting process...</pre>", parse_mode="HTML")
 
     for stage in stages:
         try:
             await asyncio.sleep(2)
-            await loading_msg.edit_text(f"<pre>{stage}</pre>", parse_mode="HTML")
+            await delivery.call(REGISTRATION, loading_msg.edit_text, f"<pre>{stage}</pre>", parse_mode="HTML")
         except Exception as e:
-            await message.answer(f"Error: {str(e)}")
+            await delivery.call(REGISTRATION, message.answer, f"Error: {str(e)}")
             break
 
     await asyncio.sleep(1)
-    await loading_msg.delete()
+    await delivery.call(REGISTRATION, loading_msg.delete)
 
 async def fake_console_logs(message: Message):
     """Выводит консольные логи + внизу анимацию загрузки (%)"""
@@ -66,27 +67,27 @@ async def fake_console_logs(message: Message):
     ]
 
     log_text = "<pre>[SYSTEM] Starting process...</pre>"
-    log_message = await message.answer(log_text, parse_mode="HTML")
+    log_message = await delivery.call(REGISTRATION, message.answer, log_text, parse_mode="HTML")
 
     # Создаем сообщение для анимации загрузки
-    loading_msg = await message.answer("<pre>⏳ Loading... 0%</pre>", parse_mode="HTML")
+    loading_msg = await delivery.call(REGISTRATION, message.answer, "<pre>⏳ Loading... 0%</pre>", parse_mode="HTML")
 
     for i, log in enumerate(logs):
         try:
             await asyncio.sleep(random.randint(1, 3))
             log_text += f"\n{log}"
-            await log_message.edit_text(f"<pre>{log_text}</pre>", parse_mode="HTML")
+            await delivery.call(REGISTRATION, log_message.edit_text, f"<pre>{log_text}</pre>", parse_mode="HTML")
 
             # Обновляем анимацию загрузки внизу
             progress = (i + 1) * 100 // len(logs)  # Вычисляем процент
-            await loading_msg.edit_text(f"<pre>⏳ Loading... {progress}%</pre>", parse_mode="HTML")
+            await delivery.call(REGISTRATION, loading_msg.edit_text, f"<pre>⏳ Loading... {progress}%</pre>", parse_mode="HTML")
         except Exception as e:
-            await message.answer(f"Error during log processing: {str(e)}")
+            await delivery.call(REGISTRATION, message.answer, f"Error during log processing: {str(e)}")
             break
 
     await asyncio.sleep(1)
-    await loading_msg.edit_text("<pre>✅ Loading complete!</pre>", parse_mode="HTML")
+    await delivery.call(REGISTRATION, loading_msg.edit_text, "<pre>✅ Loading complete!</pre>", parse_mode="HTML")
 
     # Удаляем логи через 5 секунд, оставляя только "Loading complete!"
     await asyncio.sleep(5)
-    await log_message.delete()
+    await delivery.call(REGISTRATION, log_message.delete)
@@ -0,0 +1,99 @@
+"""Микробенчмарк маршрутизации апдейтов: накладные расходы диспетчера на один апдейт.
+
+Сравнивает прежнюю схему (все обработчики на Dispatcher, у каждого свой фильтр
+чата с приведением к строке и DEBUG-логом, callback-кнопки через lambda) с
+роутерами по типу чата и CallbackRegistry. Обработчики пустые, поэтому
+измеряется только стоимость маршрутизации.
+
+Запуск: python bench_dispatch.py [число апдейтов]
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+from datetime import datetime
+from aiogram import Bot, Dispatcher, Router, F, types
+from aiogram.filters import Command, BaseFilter
+from routing import CallbackRegistry
+
+ADMIN_CHAT_ID = -1001234567890
+USER_ID = 123456789
+HANDLER_COUNTS = (10, 50, 200)
+
+logger = logging.getLogger("bench_dispatch")
+
+class LegacyAdminChatFilter(BaseFilter):
+    async def __call__(self, obj: types.Message) -> bool:
+        is_admin_chat = str(obj.chat.id) == str(ADMIN_CHAT_ID)
+        logger.debug(f"AdminChatFilter: chat_id={obj.chat.id}, is_admin_chat={is_admin_chat}")
+        return is_admin_chat
+
+class LegacyNotAdminChatFilter(BaseFilter):
+    async def __call__(self, message: types.Message) -> bool:
+        return str(message.chat.id) != str(ADMIN_CHAT_ID)
+
+async def noop(event, **kwargs):
+    pass
+
+def legacy_dispatcher(count: int) -> Dispatcher:
+    dp = Dispatcher()
+    for i in range(count):
+        dp.message.register(noop, LegacyAdminChatFilter(), Command(f"admin{i}"))
+        dp.callback_query.register(noop, lambda c, i=i: c.data == f"button{i}")
+    dp.message.register(noop, LegacyNotAdminChatFilter(), Command("start"))
+    return dp
+
+def router_dispatcher(count: int) -> Dispatcher:
+    dp = Dispatcher()
+    admin = Router(name="admin")
+    admin.message.filter(F.chat.id == ADMIN_CHAT_ID)
+    user = Router(name="user")
+    user.message.filter(F.chat.type == "private")
+    callbacks = CallbackRegistry()
+    for i in range(count):
+        admin.message.register(noop, Command(f"admin{i}"))
+        callbacks(f"button{i}")(noop)
+    user.message.register(noop, Command("start"))
+    callbacks.attach(user)
+    dp.include_router(admin)
+    dp.include_router(user)
+    return dp
+
+def make_updates(count: int) -> list[types.Update]:
+    chat = types.Chat(id=USER_ID, type="private")
+    user = types.User(id=USER_ID, is_bot=False, first_name="Bench")
+    message = types.Message(message_id=1, date=datetime.now(), chat=chat, from_user=user, text="/start")
+    updates = []
+    for i in range(count):
+        if i % 2:
+            updates.append(types.Update(update_id=i, message=message))
+        else:
+            callback = types.CallbackQuery(
+                id=str(i), from_user=user, chat_instance="bench", message=message, data=f"button{i % 7}"
+            )
+            updates.append(types.Update(update_id=i, callback_query=callback))
+    return updates
+
+async def measure(dp: Dispatcher, bot: Bot, updates: list[types.Update]) -> float:
+    for update in updates[:100]:
+        await dp.feed_update(bot, update)
+    started = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - started) / len(updates) * 1e6
+
+async def main(total: int):
+    bot = Bot(token="42:BENCH")
+    updates = make_updates(total)
+    print(f"{'обработчиков':>12} | {'старая схема, мкс':>18} | {'роутеры, мкс':>13}")
+    for count in HANDLER_COUNTS:
+        legacy = await measure(legacy_dispatcher(count), bot, updates)
+        routed = await measure(router_dispatcher(count), bot, updates)
+        print(f"{count:>12} | {legacy:>18.1f} | {routed:>13.1f}")
+    await bot.session.close()
+
+if __name__ == "__main__":
+    # DEBUG-уровень как в main.py, вывод в никуда: учитывается стоимость форматирования логов
+    logging.basicConfig(level=logging.DEBUG, handlers=[logging.StreamHandler(open(os.devnull, "w"))])
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
@@ -0,0 +1,163 @@
+"""Бенчмарк памяти массовых операций на 100 тыс. и 1 млн пользователей.
+
+Заполняет локальную SQLite-базу (DB_BACKEND=sqlite, файлы в каталоге временных
+файлов, переиспользуются между запусками) синтетическими пользователями и
+выполняет каждую операцию в отдельном процессе, чтобы пиковый RSS не смешивался
+между операциями:
+
+  export            /get_all_users: generate_users_svg() (stream_users и запись файла)
+  broadcast_plan    выборка получателей рассылки страницами (segments.iter_segment)
+  username_lookup   разбор 1000 @username/ID и поиск одним запросом (resolve_identifiers)
+  registered_index  загрузка индекса регистраций для /start
+
+Для каждой операции печатается пик tracemalloc и прирост пикового RSS. Превышение
+бюджета (BUDGET_MB) или ошибка операции — код выхода 1, чтобы бенчмарк можно было
+запускать как проверку регрессий. Бюджеты выведены из того, что операции нужно
+держать в памяти, а не из замеров.
+
+Измеряется SQLite-бэкенд. На Postgres export и registered_index читают таблицу
+серверным курсором пачками того же размера (stream_users, stream_registered),
+поэтому их пик от бэкенда не зависит; время запросов здесь не сравнивается.
+
+Запуск: python bench_memory.py [число пользователей ...]
+.env не нужен: config.py требует CHAT_ID, поэтому без него бенчмарк подставляет 0.
+"""
+import os
+import sys
+import json
+import random
+import sqlite3
+import tempfile
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+# config.py при импорте делает int(os.getenv("CHAT_ID")); админский чат бенчмарку не нужен
+os.environ.setdefault("CHAT_ID", "0")
+
+SIZES = (100_000, 1_000_000)
+COUNTRIES = ("Russia", "Spain", "United States", "United Kingdom", "Kazakhstan", "Germany", "Unknown")
+LOOKUP_COUNT = 1000
+
+# Бюджет пика tracemalloc, МБ: постоянная часть + МБ на каждые 100 тыс. пользователей.
+# Цель — ни одна массовая операция не держит в памяти всю таблицу пользователей:
+#   export            одна пачка stream_users (DB_BATCH_SIZE * 10 строк), документ сразу на диске
+#   broadcast_plan    держит одну страницу получателей, от числа пользователей не зависит
+#   username_lookup   зависит только от LOOKUP_COUNT: токены, запрос и найденные строки
+#   registered_index  9 байт на пользователя (ID int64 + код языка) с двукратным запасом
+#                     на рост массивов при загрузке: ~1.8 МБ на 100 тыс.
+BUDGET_MB = {
+    "export": (12.0, 0.0),
+    "broadcast_plan": (2.0, 0.0),
+    "username_lookup": (5.0, 0.0),
+    "registered_index": (5.0, 1.8),
+}
+
+def db_path(size: int) -> str:
+    return os.path.join(tempfile.gettempdir(), f"aviator-bench-{size}.sqlite3")
+
+def seed(size: int):
+    """Создает базу на size пользователей, если ее еще нет."""
+    path = db_path(size)
+    if os.path.exists(path):
+        return
+    from storage_sqlite import SQLiteStorage
+    SQLiteStorage(path)
+    rng = random.Random(size)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO users (telegram_id, username, phone, country, status, registered_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    1_000_000 + i * 7, f"user{i}", f"+7900{i:07d}", rng.choice(COUNTRIES),
+                    "active" if rng.random() > 0.05 else "blocked",
+                    (start + timedelta(minutes=i)).isoformat(),
+                )
+                for i in range(size)
+            )
+        )
+    conn.close()
+    print(f"Создана база {path}: {size} пользователей")
+
+def rss_mb(field: str) -> float:
+    """VmRSS/VmHWM текущего процесса из /proc (Linux), МБ."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def run_operation(name: str, size: int):
+    """Выполняется в дочернем процессе: одна операция, результат — JSON в stdout."""
+    import asyncio
+    import tracemalloc
+
+    os.chdir(tempfile.mkdtemp())
+    if name == "export":
+        from admin_bot import generate_users_svg
+
+        def operation():
+            if generate_users_svg() != size:
+                raise RuntimeError("generate_users_svg выгрузил не всех пользователей")
+    elif name == "broadcast_plan":
+        from segments import Segment, iter_segment
+
+        async def plan():
+            return sum([len(page) async for page in iter_segment(Segment())])
+        operation = lambda: asyncio.run(plan())
+    elif name == "username_lookup":
+        from admin_bot import resolve_identifiers
+        rng = random.Random(0)
+        tokens = [f"@user{rng.randrange(size)}" for _ in range(LOOKUP_COUNT // 2)]
+        tokens += [str(1_000_000 + rng.randrange(size) * 7) for _ in range(LOOKUP_COUNT // 2)]
+        operation = lambda: resolve_identifiers(" ".join(tokens))
+    elif name == "registered_index":
+        from registered_index import RegisteredIndex
+        operation = lambda: asyncio.run(RegisteredIndex(60).refresh())
+    else:
+        raise ValueError(f"Неизвестная операция: {name}")
+
+    rss_before = rss_mb("VmRSS")
+    tracemalloc.start()
+    operation()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(json.dumps({"peak_mb": peak / 2**20, "rss_mb": rss_mb("VmHWM") - rss_before}))
+
+def measure(name: str, size: int) -> dict:
+    env = dict(os.environ, DB_BACKEND="sqlite", SQLITE_PATH=db_path(size), TRACE_EXPORT="")
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run", name, str(size)],
+        env=env, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode:
+        raise RuntimeError(f"{name} ({size}): {result.stderr.strip().splitlines()[-1]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main(sizes: list[int]) -> int:
+    failures = 0
+    print(f"{'пользователей':>13} | {'операция':<17} | {'tracemalloc, МБ':>15} | {'RSS, МБ':>8} | {'бюджет, МБ':>10}")
+    for size in sizes:
+        seed(size)
+        for name, (base, per_100k) in BUDGET_MB.items():
+            try:
+                result = measure(name, size)
+            except RuntimeError as e:
+                failures += 1
+                print(f"{size:>13} | {name:<17} | ошибка: {e}")
+                continue
+            budget = base + per_100k * size / 100_000
+            over = result["peak_mb"] > budget
+            failures += over
+            print(
+                f"{size:>13} | {name:<17} | {result['peak_mb']:>15.1f} | {result['rss_mb']:>8.1f} | "
+                f"{budget:>10.1f}{'  ПРЕВЫШЕН' if over else ''}"
+            )
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--run":
+        run_operation(sys.argv[2], int(sys.argv[3]))
+    else:
+        sys.exit(main([int(arg) for arg in sys.argv[1:]] or list(SIZES)))
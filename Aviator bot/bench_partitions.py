@@ -0,0 +1,125 @@
+"""Бенчмарк запросов сегментов рассылки: обычная таблица users против секционированной (migrate_partitions.py).
+
+Работает с Postgres из config (DB_*), но только в отдельной схеме bench_partitions:
+схема создается заново, заполняется синтетическими пользователями с неравномерным
+распределением по странам, затем запросы, которые выполняет бот, измеряются до и
+после partition_users():
+
+  segment_counts        агрегаты для предпросмотра и списка стран /broadcast (get_segment_counts)
+  page:<сегмент>        первая страница получателей сегмента (get_segment_page)
+  get_users             поиск LOOKUP_COUNT случайных пользователей по telegram_id (get_users):
+                        ключ секционирования в условии не участвует, проверяется каждая секция
+
+По окончании схема удаляется.
+
+Запуск: python bench_partitions.py [число пользователей] [повторов на запрос]
+"""
+import sys
+import time
+import random
+import statistics
+from datetime import date
+from database import get_db_connection, SEGMENT_COUNTS, SEGMENT_PAGE
+from migrate_partitions import partition_users
+from segments import Segment, compile_segment
+
+SCHEMA = "bench_partitions"
+# Страны с весами: несколько крупных и длинный хвост мелких (в секцию по умолчанию)
+COUNTRIES = [("Russia", 30), ("Kazakhstan", 15), ("Uzbekistan", 12), ("India", 10), ("Brazil", 8), ("Turkey", 6)]
+COUNTRIES += [(f"Country{i}", 1) for i in range(19)]
+# Отдельные секции получают крупные страны, остальные — секция по умолчанию
+PARTITIONED = 6
+PAGE_SIZE = 1000
+LOOKUP_COUNT = 1000
+
+SEGMENTS = {
+    "page:крупная страна": Segment(countries=["Russia"]),
+    "page:мелкая страна": Segment(countries=["Country7"]),
+    "page:две страны": Segment(countries=["Kazakhstan", "Country3"]),
+    "page:страна и даты": Segment(countries=["India"], since=date(2024, 6, 1), until=date(2024, 9, 1)),
+}
+
+def seed(cur, size: int):
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {SCHEMA}")
+    cur.execute(f"SET search_path TO {SCHEMA}")
+    cur.execute("SET statement_timeout = 0")
+    cur.execute("""
+        CREATE TABLE users (
+            telegram_id BIGINT PRIMARY KEY,
+            username VARCHAR(255),
+            phone VARCHAR(50),
+            country VARCHAR(100),
+            status VARCHAR(16) NOT NULL DEFAULT 'active',
+            last_error_at TIMESTAMPTZ,
+            registered_at TIMESTAMPTZ DEFAULT now()
+        )
+    """)
+    weighted = [country for country, weight in COUNTRIES for _ in range(weight)]
+    cur.execute("""
+        INSERT INTO users (telegram_id, username, phone, country, status, registered_at)
+        SELECT 1000000 + g * 7, 'user' || g, '+7900' || g,
+               (%(weighted)s::text[])[1 + floor(random() * cardinality(%(weighted)s::text[]))::int],
+               CASE WHEN random() < 0.05 THEN 'blocked' ELSE 'active' END,
+               timestamptz '2024-01-01' + g * interval '1 minute'
+        FROM generate_series(1, %(size)s) AS g
+    """, {"weighted": weighted, "size": size})
+    cur.execute("CREATE INDEX users_unreachable_idx ON users (telegram_id) WHERE status <> 'active'")
+    cur.execute("CREATE INDEX users_segment_idx ON users (country, status, registered_at)")
+    cur.execute("VACUUM ANALYZE users")
+
+def timed(cur, repeats: int, query: str, params=None) -> float:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        cur.execute(query, params)
+        cur.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+def measure(cur, repeats: int, ids: list[int]) -> dict:
+    # Как в get_segment_counts; без секций настройка ни на что не влияет
+    cur.execute("SET enable_partitionwise_aggregate = on")
+    results = {"segment_counts": timed(cur, repeats, SEGMENT_COUNTS)}
+    for name, segment in SEGMENTS.items():
+        where, params = compile_segment(segment, "postgres")
+        results[name] = timed(cur, repeats, SEGMENT_PAGE.format(where=where), [0, *params, PAGE_SIZE])
+    results["get_users"] = timed(
+        cur, repeats, "SELECT telegram_id, username, phone, country FROM users WHERE telegram_id = ANY(%s)", (ids,)
+    )
+    return results
+
+def main(size: int, repeats: int) -> int:
+    conn = get_db_connection()
+    if not conn:
+        print("Нет подключения к БД (DB_* в .env)")
+        return 1
+    # ID из seed(): 1000000 + g * 7
+    ids = [1_000_000 + g * 7 for g in random.Random(0).sample(range(1, size + 1), min(LOOKUP_COUNT, size))]
+    # VACUUM нельзя выполнять внутри транзакции
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            print(f"Заполнение {SCHEMA}.users: {size} пользователей...")
+            seed(cur, size)
+            before = measure(cur, repeats, ids)
+        conn.autocommit = False
+        partition_users(conn, PARTITIONED, drop_old=True)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"SET search_path TO {SCHEMA}")
+            cur.execute("VACUUM ANALYZE users")
+            after = measure(cur, repeats, ids)
+            print(f"{'запрос':<24} | {'без секций, мс':>14} | {'с секциями, мс':>14}")
+            for name in before:
+                print(f"{name:<24} | {before[name]:>14.2f} | {after[name]:>14.2f}")
+            cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+        return 0
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+    ))
@@ -0,0 +1,121 @@
+"""Бенчмарк профилей среды выполнения (RUNTIME_PROFILE): standard против fast (uvloop + orjson).
+
+Каждый профиль запускается в отдельном процессе, потому что event loop и JSON
+выбираются при импорте. Внутри процесса поднимается локальная заглушка Bot API:
+
+  updates/s    getUpdates пачками по 100 апдейтов (разбор JSON ответа сессией) и
+               прогон каждого апдейта через Dispatcher с пустым обработчиком /start
+  sends/s      конкурентные sendMessage через TunedSession, как при рассылке
+               (сериализация запроса и разбор ответа)
+
+Запуск: python bench_runtime.py [число апдейтов] [число отправок]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import subprocess
+
+PROFILES = ("standard", "fast")
+TOKEN = "42:BENCH"
+BATCH = 100
+CONCURRENCY = 200
+
+def make_app():
+    from aiohttp import web
+
+    def update(update_id: int) -> dict:
+        return {"update_id": update_id, "message": {
+            "message_id": update_id, "date": 1700000000, "text": "/start",
+            "chat": {"id": 1000 + update_id % 500, "type": "private", "first_name": "Bench"},
+            "from": {"id": 1000 + update_id % 500, "is_bot": False, "first_name": "Bench", "language_code": "ru"},
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        }}
+
+    async def get_updates(request):
+        data = await request.post()
+        offset = int(data.get("offset", 0))
+        body = json.dumps({"ok": True, "result": [update(offset + i) for i in range(BATCH)]})
+        return web.Response(text=body, content_type="application/json")
+
+    async def send_message(request):
+        data = await request.post()
+        return web.json_response({"ok": True, "result": {
+            "message_id": 1, "date": int(time.time()), "text": data["text"],
+            "chat": {"id": int(data["chat_id"]), "type": "private"},
+        }})
+
+    app = web.Application()
+    app.router.add_post(f"/bot{TOKEN}/getUpdates", get_updates)
+    app.router.add_post(f"/bot{TOKEN}/sendMessage", send_message)
+    return app
+
+async def measure(updates: int, sends: int) -> dict:
+    from aiohttp import web
+    from aiogram import Bot, Dispatcher, types
+    from aiogram.filters import CommandStart
+    from transport import create_session
+
+    runner = web.AppRunner(make_app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    bot = Bot(token=TOKEN, session=create_session(pool_size=CONCURRENCY, api_url=f"http://127.0.0.1:{port}"))
+    dp = Dispatcher()
+
+    @dp.message(CommandStart())
+    async def start(message: types.Message):
+        pass
+
+    started = time.perf_counter()
+    offset = 0
+    while offset < updates:
+        for update in await bot.get_updates(offset=offset, limit=BATCH):
+            await dp.feed_update(bot, update)
+        offset += BATCH
+    updates_per_second = offset / (time.perf_counter() - started)
+
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def send(i: int):
+        async with semaphore:
+            await bot.send_message(1000 + i % 500, f"Рассылка №{i} 🎯 " + "текст " * 20)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(i) for i in range(sends)))
+    sends_per_second = sends / (time.perf_counter() - started)
+
+    await bot.session.close()
+    await runner.cleanup()
+    return {"updates": updates_per_second, "sends": sends_per_second}
+
+def run_profile(profile: str, updates: int, sends: int) -> dict:
+    env = dict(os.environ, RUNTIME_PROFILE=profile, TRACE_EXPORT="")
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run", str(updates), str(sends)],
+        env=env, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode:
+        raise RuntimeError(f"{profile}: {result.stderr.strip().splitlines()[-1]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main(updates: int, sends: int):
+    print(f"{updates} апдейтов, {sends} отправок")
+    print(f"{'профиль':<10} | {'среда':<30} | {'апдейтов/с':>10} | {'отправок/с':>10}")
+    for profile in PROFILES:
+        result = run_profile(profile, updates, sends)
+        print(f"{profile:<10} | {result['runtime']:<30} | {result['updates']:>10.0f} | {result['sends']:>10.0f}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--run":
+        import runtime
+        result = runtime.run(measure(int(sys.argv[2]), int(sys.argv[3])))
+        result["runtime"] = runtime.describe().split(": ", 1)[1]
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        main(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 5000,
+        )
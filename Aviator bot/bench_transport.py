@@ -0,0 +1,71 @@
+"""Бенчмарк HTTP-транспорта Bot API: пропускная способность при разных размерах пула соединений.
+
+Поднимает локальную заглушку Bot API (aiohttp) с искусственной задержкой ответа и
+отправляет через TunedSession заданное число sendMessage с высокой конкурентностью,
+как широковещательная рассылка. Лимит RateLimiter не участвует — измеряется только
+транспорт.
+
+Запуск: python bench_transport.py [число запросов] [задержка ответа, мс]
+"""
+import sys
+import time
+import asyncio
+from aiohttp import web
+from aiogram import Bot
+from transport import create_session
+
+POOL_SIZES = (5, 25, 100, 200)
+CONCURRENCY = 500
+TOKEN = "42:BENCH"
+
+def make_app(latency: float) -> web.Application:
+    async def send_message(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        data = await request.post()
+        return web.json_response({"ok": True, "result": {
+            "message_id": 1, "date": int(time.time()),
+            "chat": {"id": int(data["chat_id"]), "type": "private"}, "text": data["text"],
+        }})
+
+    app = web.Application()
+    app.router.add_post(f"/bot{TOKEN}/sendMessage", send_message)
+    return app
+
+async def measure(base_url: str, pool_size: int, total: int) -> tuple[float, float]:
+    bot = Bot(token=TOKEN, session=create_session(pool_size=pool_size, api_url=base_url))
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            await bot.send_message(i, "bench")
+            latencies.append(time.perf_counter() - started)
+
+    await bot.send_message(0, "warmup")
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+    await bot.session.close()
+    latencies.sort()
+    return total / elapsed, latencies[int(len(latencies) * 0.95)] * 1000
+
+async def main(total: int, latency_ms: float):
+    runner = web.AppRunner(make_app(latency_ms / 1000))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+    print(f"{total} запросов, задержка ответа {latency_ms} мс, конкурентность {CONCURRENCY}")
+    print(f"{'пул':>5} | {'запросов/с':>11} | {'p95, мс':>8}")
+    for pool_size in POOL_SIZES:
+        rps, p95 = await measure(base_url, pool_size, total)
+        print(f"{pool_size:>5} | {rps:>11.0f} | {p95:>8.1f}")
+    await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 20,
+    ))
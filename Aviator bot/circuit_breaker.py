@@ -0,0 +1,66 @@
+import time
+import logging
+import threading
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class CircuitBreaker:
+    """Размыкатель цепи для внешней зависимости (Postgres).
+
+    После failure_threshold ошибок подряд цепь размыкается: allow() сразу
+    возвращает False, и вызывающий код не ждет таймаутов. Через reset_timeout
+    секунд пропускается один пробный вызов (half-open): успех замыкает цепь,
+    ошибка снова размыкает ее. Если пробный вызов не сообщил результат, через
+    reset_timeout пропускается следующий. Потокобезопасен — БД вызывается и из to_thread.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+        metrics.register_gauge(f"{name}.breaker_open", lambda: int(self.state != CLOSED))
+
+    def ready(self) -> bool:
+        """Можно ли сейчас обращаться к зависимости (без резервирования пробного вызова)."""
+        return self.state == CLOSED or time.monotonic() - self._opened_at >= self.reset_timeout
+
+    def allow(self) -> bool:
+        """Разрешает вызов; в состоянии half-open — только один пробный одновременно."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self.reset_timeout:
+                metrics.inc(f"{self.name}.fast_fail")
+                return False
+            # Следующий пробный вызов — не раньше чем через reset_timeout
+            self.state = HALF_OPEN
+            self._opened_at = now
+            logger.info(f"{self.name}: пробный вызов после {self.reset_timeout}с")
+            return True
+
+    def success(self):
+        if self.state == CLOSED and not self._failures:
+            return
+        with self._lock:
+            if self.state != CLOSED:
+                logger.warning(f"{self.name}: цепь замкнута, зависимость снова доступна")
+            self.state = CLOSED
+            self._failures = 0
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self._failures >= self.failure_threshold):
+                if self.state == CLOSED:
+                    logger.error(f"{self.name}: цепь разомкнута после {self._failures} ошибок подряд")
+                    metrics.inc(f"{self.name}.breaker_trips")
+                self.state = OPEN
+                self._opened_at = time.monotonic()
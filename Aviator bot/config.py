@@ -13,6 +13,117 @@ DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "1000"))  # ID в одном запросе = ANY(...)
+
+# Хранилище: "postgres" (по умолчанию) или "sqlite" — встроенная база в файле SQLITE_PATH (режим WAL)
+DB_BACKEND = os.getenv("DB_BACKEND", "postgres").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "aviator.sqlite3")
+
+# Защита от недоступной БД: таймауты подключения и запроса; после N ошибок подряд запросы к основному серверу
+# сразу отклоняются на M секунд (затем один пробный). Пока БД недоступна, чтения идут из кеша пользователей,
+# а регистрации копятся в очереди и записываются после восстановления
+DB_CONNECT_TIMEOUT_SECONDS = int(os.getenv("DB_CONNECT_TIMEOUT_SECONDS", "3"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+DB_BREAKER_FAILURES = int(os.getenv("DB_BREAKER_FAILURES", "3"))
+DB_BREAKER_RESET_SECONDS = float(os.getenv("DB_BREAKER_RESET_SECONDS", "15"))
+DB_USER_CACHE_SIZE = int(os.getenv("DB_USER_CACHE_SIZE", "10000"))
+DB_WRITE_QUEUE_SIZE = int(os.getenv("DB_WRITE_QUEUE_SIZE", "1000"))
+DB_REPLAY_INTERVAL_SECONDS = float(os.getenv("DB_REPLAY_INTERVAL_SECONDS", "5"))
+
+# Число крупнейших стран с отдельной секцией users при миграции migrate_partitions.py
+DB_PARTITION_COUNTRIES = int(os.getenv("DB_PARTITION_COUNTRIES", "8"))
+
+# Реплики для чтения (DSN через запятую). Реплика с отставанием больше DB_REPLICA_MAX_LAG_SECONDS
+# исключается; чтения пользователя в течение этого же времени после записи идут на основной сервер
+DB_REPLICA_DSNS = [dsn.strip() for dsn in os.getenv("DB_REPLICA_DSNS", "").split(",") if dsn.strip()]
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "5"))
+DB_REPLICA_CHECK_SECONDS = float(os.getenv("DB_REPLICA_CHECK_SECONDS", "30"))
+
+# HTTP-транспорт Bot API: адрес локального сервера Bot API или заглушки (пусто — api.telegram.org),
+# пул соединений (общий и на хост, 0 — без лимита), keep-alive, TTL DNS-кеша, таймауты обычных вызовов и загрузок
+BOT_API_URL = os.getenv("BOT_API_URL", "")
+BOT_API_LOCAL = os.getenv("BOT_API_LOCAL", "false").lower() == "true"
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "100"))
+HTTP_POOL_PER_HOST = int(os.getenv("HTTP_POOL_PER_HOST", "0"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "30"))
+HTTP_DNS_TTL_SECONDS = int(os.getenv("HTTP_DNS_TTL_SECONDS", "300"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "15"))
+HTTP_UPLOAD_TIMEOUT_SECONDS = float(os.getenv("HTTP_UPLOAD_TIMEOUT_SECONDS", "120"))
+
+# Профиль среды выполнения: "standard" (asyncio + json) или "fast" (uvloop + orjson, если установлены)
+RUNTIME_PROFILE = os.getenv("RUNTIME_PROFILE", "standard").lower()
+
+# Лимиты отправки через Bot API
+SEND_RATE_LIMIT = float(os.getenv("SEND_RATE_LIMIT", "25"))  # сообщений в секунду на весь бот
+# RetryAfter откладывает отправки только в свой чат; лимит в N чатах сразу считается общим и приостанавливает все
+RETRY_AFTER_GLOBAL_CHATS = int(os.getenv("RETRY_AFTER_GLOBAL_CHATS", "3"))
+ADMIN_MAX_TARGETS = int(os.getenv("ADMIN_MAX_TARGETS", "500"))  # максимум получателей в одной команде
+# Команда админа на большее число получателей идет полосой bulk и не обгоняет ответы при регистрации
+ADMIN_INTERACTIVE_TARGETS = int(os.getenv("ADMIN_INTERACTIVE_TARGETS", "5"))
+
+# Исполнение апдейтов: не больше N обработчиков одновременно, не больше M апдейтов в ожидании (сверх — отбрасываются)
+UPDATE_MAX_CONCURRENCY = int(os.getenv("UPDATE_MAX_CONCURRENCY", "64"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+
+# Сервис доставки: число воркеров на каждую полосу приоритета и размер очереди полосы
+DELIVERY_WORKERS = {
+    "interactive": int(os.getenv("DELIVERY_WORKERS_INTERACTIVE", "4")),
+    "registration": int(os.getenv("DELIVERY_WORKERS_REGISTRATION", "4")),
+    "bulk": int(os.getenv("DELIVERY_WORKERS_BULK", "8")),
+}
+DELIVERY_QUEUE_SIZE = int(os.getenv("DELIVERY_QUEUE_SIZE", "1000"))
+
+# Журнал доставок: запись пачками по N строк или раз в T мс; ключи идемпотентности хранятся в памяти TTL часов
+DELIVERY_LOG_BATCH_SIZE = int(os.getenv("DELIVERY_LOG_BATCH_SIZE", "200"))
+DELIVERY_LOG_FLUSH_MS = int(os.getenv("DELIVERY_LOG_FLUSH_MS", "1000"))
+DELIVERY_KEY_TTL_HOURS = int(os.getenv("DELIVERY_KEY_TTL_HOURS", "24"))
+# Записи журнала доставок старше N дней удаляются (проверка раз в час)
+DELIVERY_RETENTION_DAYS = int(os.getenv("DELIVERY_RETENTION_DAYS", "30"))
+
+# Уведомления в админский чат: копятся и отправляются одной сводкой раз в N секунд, в буфере не больше M строк на тему
+ADMIN_NOTIFY_FLUSH_SECONDS = float(os.getenv("ADMIN_NOTIFY_FLUSH_SECONDS", "30"))
+ADMIN_NOTIFY_MAX_ITEMS = int(os.getenv("ADMIN_NOTIFY_MAX_ITEMS", "1000"))
+
+# Индекс зарегистрированных ID в памяти для /start: полное перечитывание из БД раз в N минут
+REGISTERED_INDEX_REFRESH_MINUTES = float(os.getenv("REGISTERED_INDEX_REFRESH_MINUTES", "30"))
+
+# Сегменты рассылки: кеш агрегатов для предпросмотра размера (секунды) и размер страницы получателей
+SEGMENT_STATS_TTL_SECONDS = int(os.getenv("SEGMENT_STATS_TTL_SECONDS", "300"))
+SEGMENT_PAGE_SIZE = int(os.getenv("SEGMENT_PAGE_SIZE", "1000"))
+
+# Снимок прогреваемых кешей (file_id GIF, каталоги языков, индекс регистраций, агрегаты сегментов) для теплого
+# перезапуска: пишется раз в N минут и при остановке, при запуске принимается, если не старше M минут. Пусто — выключен
+WARM_SNAPSHOT_PATH = os.getenv("WARM_SNAPSHOT_PATH", "warm_snapshot.bin")
+WARM_SNAPSHOT_INTERVAL_MINUTES = float(os.getenv("WARM_SNAPSHOT_INTERVAL_MINUTES", "5"))
+WARM_SNAPSHOT_MAX_AGE_MINUTES = float(os.getenv("WARM_SNAPSHOT_MAX_AGE_MINUTES", "1440"))
+
+# Доступность пользователей: повторная проверка заблокировавших бота раз в N часов, не чаще чем через M дней после ошибки
+REACHABILITY_PROBE_INTERVAL_HOURS = float(os.getenv("REACHABILITY_PROBE_INTERVAL_HOURS", "6"))
+REACHABILITY_REPROBE_AFTER_DAYS = float(os.getenv("REACHABILITY_REPROBE_AFTER_DAYS", "7"))
+REACHABILITY_PROBE_BATCH = int(os.getenv("REACHABILITY_PROBE_BATCH", "100"))
+
+# Мониторинг event loop: период пульса и порог, после которого снимается стек блокирующего вызова
+LOOP_MONITOR_INTERVAL_MS = int(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100"))
+LOOP_BLOCK_THRESHOLD_MS = int(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "250"))
+
+# Профилирование по команде /profile: период сэмплирования и максимальная длительность окна
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "120"))
+
+# Трассировка апдейтов: TRACE_EXPORT = "" (выключена), "file" (JSON lines в TRACE_FILE) или "otlp" (OTLP/HTTP JSON)
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))  # доля обычных трасс
+TRACE_SLOW_MS = int(os.getenv("TRACE_SLOW_MS", "1000"))  # трассы дольше порога сохраняются всегда
+
+# Агрегация ошибок: ротируемый errors.log, одна запись на отпечаток за окно, сводка в админский чат
+ERROR_LOG_FILE = os.getenv("ERROR_LOG_FILE", "errors.log")
+ERROR_LOG_MAX_BYTES = int(os.getenv("ERROR_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+ERROR_LOG_BACKUPS = int(os.getenv("ERROR_LOG_BACKUPS", "3"))
+ERROR_WINDOW_SECONDS = int(os.getenv("ERROR_WINDOW_SECONDS", "300"))
+ERROR_DIGEST_INTERVAL_SECONDS = int(os.getenv("ERROR_DIGEST_INTERVAL_SECONDS", "600"))
+ERROR_FINGERPRINTS_MAX = int(os.getenv("ERROR_FINGERPRINTS_MAX", "500"))
 
 MESSAGES = {
     "enter_password": {"ru": "🔐 Введите пароль:"},
@@ -1,11 +1,82 @@
+import time
+import asyncio
+import itertools
+import threading
+from collections import OrderedDict, deque
 import psycopg2
-from config import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD
+import psycopg2.extensions
+from psycopg2.extras import execute_values
+from config import (
+    DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD, DB_BATCH_SIZE,
+    DB_REPLICA_DSNS, DB_REPLICA_MAX_LAG_SECONDS, DB_REPLICA_CHECK_SECONDS, DB_BACKEND, SQLITE_PATH,
+    DB_CONNECT_TIMEOUT_SECONDS, DB_STATEMENT_TIMEOUT_MS, DB_BREAKER_FAILURES, DB_BREAKER_RESET_SECONDS,
+    DB_USER_CACHE_SIZE, DB_WRITE_QUEUE_SIZE, DB_REPLAY_INTERVAL_SECONDS
+)
+from tracing import traced
+from circuit_breaker import CircuitBreaker
+import metrics
 import logging
 
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
-    """Устанавливает соединение с базой данных и проверяет/создает таблицу users."""
+# Схема проверяется один раз за процесс, а не при каждом подключении
+_schema_ready = False
+
+# Размыкатель цепи основного сервера: при недоступности Postgres запросы сразу получают отказ
+db_breaker = CircuitBreaker("db", DB_BREAKER_FAILURES, DB_BREAKER_RESET_SECONDS)
+
+class BreakerCursor(psycopg2.extensions.cursor):
+    """Курсор основного сервера: ошибки соединения и таймауты запросов засчитываются размыкателю.
+
+    Успехом считается только выполненный запрос: соединение с перегруженным сервером
+    устанавливается, а запросы на нем падают по statement_timeout.
+    """
+
+    def execute(self, query, vars=None):
+        try:
+            result = super().execute(query, vars)
+        except psycopg2.OperationalError:
+            db_breaker.failure()
+            raise
+        db_breaker.success()
+        return result
+
+# Последние прочитанные/сохраненные пользователи: из них отвечают get_user/get_users, пока БД недоступна
+_user_cache = OrderedDict()
+_cache_lock = threading.Lock()
+# Регистрации, принятые при недоступной БД; записываются при восстановлении (run_write_replay)
+_pending_writes = deque()
+
+def _cache_users(rows):
+    with _cache_lock:
+        for row in rows:
+            _user_cache[row[0]] = row
+            _user_cache.move_to_end(row[0])
+        while len(_user_cache) > DB_USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+
+def _cached_users(ids):
+    with _cache_lock:
+        users = {user_id: _user_cache[user_id] for user_id in ids if user_id in _user_cache}
+    metrics.inc("db.cache_hits", len(users))
+    return users
+
+metrics.register_gauge("db.pending_writes", lambda: len(_pending_writes))
+
+@traced("db.connect")
+def get_db_connection(read_only=False, pinned_ids=()):
+    """Устанавливает соединение с базой данных и проверяет/создает таблицу users.
+
+    read_only=True разрешает обслужить запрос репликой, если ни один из pinned_ids
+    не записывался недавно (чтение после записи всегда идет на основной сервер).
+    """
+    if read_only and DB_REPLICA_DSNS and not any(_recently_written(user_id) for user_id in pinned_ids):
+        conn = _replica_connection()
+        if conn:
+            return conn
+    if not db_breaker.allow():
+        logger.warning("DB circuit open, skipping connection")
+        return None
     try:
         logger.info("Connecting to DB")
         conn = psycopg2.connect(
@@ -13,21 +84,96 @@ def get_db_connection():
             port=DB_PORT,
             database=DB_NAME,
             user=DB_USER,
-            password=DB_PASSWORD
+            password=DB_PASSWORD,
+            connect_timeout=DB_CONNECT_TIMEOUT_SECONDS,
+            options=f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}",
+            cursor_factory=BreakerCursor
         )
         logger.info("DB connected")
-        # Проверяем и создаем таблицу users
-        if ensure_users_table(conn):
-            logger.info("Table 'users' is ready")
-        else:
-            logger.error("Failed to ensure 'users' table")
-            conn.close()
-            return None
+        global _schema_ready
+        if not _schema_ready:
+            # Проверяем и создаем таблицы users и deliveries
+            if ensure_users_table(conn) and ensure_deliveries_table(conn):
+                logger.info("Tables 'users' and 'deliveries' are ready")
+                _schema_ready = True
+            else:
+                logger.error("Failed to ensure tables")
+                conn.close()
+                return None
         return conn
     except Exception as e:
+        db_breaker.failure()
         logger.error(f"DB connection error: {e}")
         return None
 
+class ReplicaConnection(psycopg2.extensions.connection):
+    """Соединение с репликой (только чтение)."""
+
+# Состояние реплик: DSN -> (исправна, время последней проверки); round-robin по исправным.
+# _replicas и _replica_cycle читаются и меняются только под _replica_lock
+_replicas = {dsn: (True, 0.0) for dsn in DB_REPLICA_DSNS}
+_replica_cycle = itertools.cycle(DB_REPLICA_DSNS)
+_replica_lock = threading.Lock()
+# telegram_id -> время записи; пока не истек DB_REPLICA_MAX_LAG_SECONDS, чтения идут на основной сервер
+_recent_writes = {}
+
+def _mark_written(telegram_id):
+    now = time.monotonic()
+    with _replica_lock:
+        _recent_writes[telegram_id] = now
+        if len(_recent_writes) > 10000:
+            for user_id, written_at in list(_recent_writes.items()):
+                if now - written_at > DB_REPLICA_MAX_LAG_SECONDS:
+                    del _recent_writes[user_id]
+
+def _recently_written(telegram_id):
+    written_at = _recent_writes.get(telegram_id)
+    return written_at is not None and time.monotonic() - written_at <= DB_REPLICA_MAX_LAG_SECONDS
+
+def _replica_lag(conn):
+    """Отставание реплики в секундах (0, если все полученные WAL уже применены)."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT CASE
+                WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+            END
+        """)
+        return float(cur.fetchone()[0])
+
+def _replica_connection():
+    """Подключается к следующей исправной реплике; None, если подходящей нет."""
+    for _ in range(len(DB_REPLICA_DSNS)):
+        with _replica_lock:
+            dsn = next(_replica_cycle)
+            healthy, checked_at = _replicas[dsn]
+        now = time.monotonic()
+        due = now - checked_at >= DB_REPLICA_CHECK_SECONDS
+        if not healthy and not due:
+            continue
+        try:
+            conn = psycopg2.connect(dsn, connect_timeout=3, connection_factory=ReplicaConnection)
+        except Exception as e:
+            logger.warning(f"Replica unavailable: {e}")
+            with _replica_lock:
+                _replicas[dsn] = (False, now)
+            continue
+        if due:
+            # Периодическая проверка отставания: слишком отставшая реплика исключается до следующей проверки
+            try:
+                lag = _replica_lag(conn)
+            except Exception as e:
+                logger.warning(f"Replica lag check failed: {e}")
+                lag = float("inf")
+            with _replica_lock:
+                _replicas[dsn] = (lag <= DB_REPLICA_MAX_LAG_SECONDS, now)
+            if lag > DB_REPLICA_MAX_LAG_SECONDS:
+                logger.warning(f"Replica lag {lag:.1f}s exceeds {DB_REPLICA_MAX_LAG_SECONDS}s, skipping")
+                conn.close()
+                continue
+        return conn
+    return None
+
 def ensure_users_table(conn):
     """Проверяет наличие таблицы users и создает её, если она отсутствует."""
     try:
@@ -55,75 +201,193 @@ def ensure_users_table(conn):
                 """)
                 conn.commit()
                 logger.info("Table 'users' created successfully")
+            # Доступность пользователя: active, blocked (бот заблокирован), deactivated (аккаунт удален)
+            cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS status VARCHAR(16) NOT NULL DEFAULT 'active'")
+            cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS last_error_at TIMESTAMPTZ")
+            cur.execute("CREATE INDEX IF NOT EXISTS users_unreachable_idx ON users (telegram_id) WHERE status <> 'active'")
+            # Дата регистрации для сегментов рассылки; у пользователей, сохраненных до появления колонки, — NULL
+            cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS registered_at TIMESTAMPTZ")
+            cur.execute("ALTER TABLE users ALTER COLUMN registered_at SET DEFAULT now()")
+            cur.execute("CREATE INDEX IF NOT EXISTS users_segment_idx ON users (country, status, registered_at)")
+            conn.commit()
             return True
     except Exception as e:
         logger.error(f"Error ensuring 'users' table: {e}")
         return False
 
+def ensure_deliveries_table(conn):
+    """Создает журнал доставок deliveries, если он отсутствует."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS deliveries (
+                    id BIGSERIAL PRIMARY KEY,
+                    recipient BIGINT NOT NULL,
+                    kind VARCHAR(32) NOT NULL,
+                    asset TEXT,
+                    status VARCHAR(16) NOT NULL,
+                    error TEXT,
+                    idempotency_key VARCHAR(255) UNIQUE,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS deliveries_recipient_idx ON deliveries (recipient, created_at DESC)")
+            # Загрузка недавних ключей при запуске и удаление старых записей (prune_deliveries)
+            cur.execute("CREATE INDEX IF NOT EXISTS deliveries_created_idx ON deliveries (created_at)")
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Error ensuring 'deliveries' table: {e}")
+        return False
+
+# Вставка без дубликатов, работающая и с секционированной таблицей (migrate_partitions.py):
+# там первичный ключ (telegram_id, country), и ON CONFLICT (telegram_id) невозможен.
+# Проверка NOT EXISTS сама по себе — гонка: два одновременных /start вставили бы две строки
+# в разные секции. Поэтому вставка идет под транзакционной advisory-блокировкой на каждый
+# telegram_id (ключ блокировки — сам ID; в порядке возрастания, чтобы пачки не взаимоблокировались)
+LOCK_USER_IDS = "SELECT pg_advisory_xact_lock(id) FROM unnest(%s::bigint[]) AS id ORDER BY id"
+INSERT_USER = (
+    "INSERT INTO users (telegram_id, username, phone, country) "
+    "SELECT v.telegram_id, v.username, v.phone, v.country FROM (VALUES %s) AS v (telegram_id, username, phone, country) "
+    "WHERE NOT EXISTS (SELECT 1 FROM users u WHERE u.telegram_id = v.telegram_id) ON CONFLICT DO NOTHING"
+)
+INSERT_USER_TEMPLATE = "(%s::bigint, %s, %s, %s)"
+
+@traced("db.save_user")
 def save_user(telegram_id, username, phone, country):
     """Сохраняет пользователя в базу данных."""
     logger.info(f"Saving user_id={telegram_id}")
+    row = (telegram_id, username, phone, country)
     conn = get_db_connection()
     if not conn:
-        logger.error(f"No DB for user_id={telegram_id}")
-        return False
+        return _queue_write(row)
     try:
         with conn.cursor() as cur:
-            cur.execute(
-                "INSERT INTO users (telegram_id, username, phone, country) VALUES (%s, %s, %s, %s) ON CONFLICT (telegram_id) DO NOTHING",
-                (telegram_id, username, phone, country)
-            )
+            cur.execute(LOCK_USER_IDS, ([telegram_id],))
+            execute_values(cur, INSERT_USER, [row], template=INSERT_USER_TEMPLATE)
             conn.commit()
+            _mark_written(telegram_id)
+            _cache_users([row])
             logger.info(f"User {telegram_id} saved")
             return cur.rowcount > 0
+    except psycopg2.OperationalError as e:
+        logger.error(f"Save error for user_id={telegram_id}: {e}")
+        return _queue_write(row)
     except Exception as e:
         logger.error(f"Save error for user_id={telegram_id}: {e}")
         return False
     finally:
         conn.close()
 
-def get_user(telegram_id):
+def _queue_write(row):
+    """Откладывает регистрацию до восстановления БД; False, если очередь заполнена или пользователь уже известен."""
+    with _cache_lock:
+        if row[0] in _user_cache:
+            return False
+        if len(_pending_writes) >= DB_WRITE_QUEUE_SIZE:
+            metrics.inc("db.writes_dropped")
+            logger.error(f"Write queue full, user_id={row[0]} not saved")
+            return False
+        _pending_writes.append(row)
+    _cache_users([row])
+    metrics.inc("db.writes_queued")
+    logger.warning(f"DB unavailable, user_id={row[0]} queued for replay ({len(_pending_writes)} pending)")
+    return True
+
+def replay_pending_writes():
+    """Записывает отложенные регистрации одной пачкой; при ошибке они остаются в очереди."""
+    with _cache_lock:
+        rows = list(_pending_writes)
+    if not rows:
+        return 0
+    conn = get_db_connection()
+    if not conn:
+        return 0
+    try:
+        with conn.cursor() as cur:
+            cur.execute(LOCK_USER_IDS, ([row[0] for row in rows],))
+            execute_values(cur, INSERT_USER, rows, template=INSERT_USER_TEMPLATE)
+            conn.commit()
+        with _cache_lock:
+            for _ in rows:
+                _pending_writes.popleft()
+        for row in rows:
+            _mark_written(row[0])
+        metrics.inc("db.writes_replayed", len(rows))
+        logger.warning(f"Replayed {len(rows)} queued registrations")
+        return len(rows)
+    except Exception as e:
+        logger.error(f"Write replay error: {e}")
+        return 0
+    finally:
+        conn.close()
+
+async def run_write_replay():
+    """Фоновая задача: повторяет отложенные записи, как только размыкатель пропускает запросы."""
+    while True:
+        await asyncio.sleep(DB_REPLAY_INTERVAL_SECONDS)
+        if _pending_writes and db_breaker.ready():
+            await asyncio.to_thread(replay_pending_writes)
+
+@traced("db.get_user")
+def get_user(telegram_id, read_only=True):
     """Получает данные пользователя по telegram_id."""
     logger.info(f"Fetching user_id={telegram_id}")
-    conn = get_db_connection()
+    conn = get_db_connection(read_only=read_only, pinned_ids=(telegram_id,))
     if not conn:
-        logger.error(f"No DB for user_id={telegram_id}")
-        return None
+        logger.error(f"No DB for user_id={telegram_id}, using cache")
+        return _cached_users([telegram_id]).get(telegram_id)
     try:
         with conn.cursor() as cur:
             cur.execute("SELECT telegram_id, username, phone, country FROM users WHERE telegram_id = %s", (telegram_id,))
             user = cur.fetchone()
+            if user is None and isinstance(conn, ReplicaConnection):
+                # Реплика могла еще не получить запись — промах перепроверяем на основном сервере
+                return get_user(telegram_id, read_only=False)
+            if user:
+                _cache_users([user])
             logger.info(f"User {telegram_id}: {user}")
             return user
     except Exception as e:
         logger.error(f"Fetch error for user_id={telegram_id}: {e}")
-        return None
+        return _cached_users([telegram_id]).get(telegram_id)
     finally:
         conn.close()
 
-def check_user_registration(telegram_id):
-    """Проверяет, зарегистрирован ли пользователь."""
-    logger.info(f"Checking user_id={telegram_id}")
-    conn = get_db_connection()
+@traced("db.get_users")
+def get_users(ids, batch_size=DB_BATCH_SIZE):
+    """Получает пользователей по списку telegram_id: один запрос = ANY(...) на пачку, результат — словарь по ID."""
+    ids = list(dict.fromkeys(int(user_id) for user_id in ids))
+    if not ids:
+        return {}
+    logger.info(f"Fetching {len(ids)} users in batches of {batch_size}")
+    conn = get_db_connection(read_only=True, pinned_ids=ids)
     if not conn:
-        logger.error(f"No DB for user_id={telegram_id}")
-        return False
+        logger.error("No DB connection, using cache")
+        return _cached_users(ids)
     try:
+        users = {}
         with conn.cursor() as cur:
-            cur.execute("SELECT 1 FROM users WHERE telegram_id = %s", (telegram_id,))
-            exists = cur.fetchone() is not None
-            logger.info(f"Registration for user_id={telegram_id}: {exists}")
-            return exists
+            for start in range(0, len(ids), batch_size):
+                cur.execute(
+                    "SELECT telegram_id, username, phone, country FROM users WHERE telegram_id = ANY(%s)",
+                    (ids[start:start + batch_size],)
+                )
+                users.update((row[0], row) for row in cur.fetchall())
+        _cache_users(users.values())
+        logger.info(f"Found {len(users)}/{len(ids)} users")
+        return users
     except Exception as e:
-        logger.error(f"Check error for user_id={telegram_id}: {e}")
-        return False
+        logger.error(f"Users batch fetch error: {e}")
+        return _cached_users(ids)
     finally:
         conn.close()
 
+@traced("db.get_all_users")
 def get_all_users():
     """Получает список всех пользователей."""
     logger.info("Fetching all users")
-    conn = get_db_connection()
+    conn = get_db_connection(read_only=True)
     if not conn:
         logger.error("No DB connection")
         return []
@@ -139,40 +403,330 @@ def get_all_users():
     finally:
         conn.close()
 
-def get_all_countries():
-    """Получает список уникальных стран из базы данных."""
-    logger.info("Fetching all countries")
+@traced("db.stream_users")
+def stream_users(consume, chunk_size=DB_BATCH_SIZE * 10):
+    """Читает всех пользователей по возрастанию ID серверным курсором
+    и передает их в consume(rows) пачками, не загружая всю таблицу в память."""
+    conn = get_db_connection(read_only=True)
+    if not conn:
+        logger.error("No DB connection")
+        return False
+    try:
+        with conn.cursor(name="stream_users") as cur:
+            cur.itersize = chunk_size
+            cur.execute("SELECT telegram_id, username, phone, country FROM users ORDER BY telegram_id")
+            while rows := cur.fetchmany(chunk_size):
+                consume(rows)
+        return True
+    except Exception as e:
+        logger.error(f"Users stream error: {e}")
+        return False
+    finally:
+        conn.close()
+
+@traced("db.stream_registered")
+def stream_registered(consume, chunk_size=DB_BATCH_SIZE * 10):
+    """Читает (telegram_id, country) всех пользователей по возрастанию ID серверным курсором
+    и передает их в consume(rows) пачками, не загружая всю таблицу в память."""
+    conn = get_db_connection(read_only=True)
+    if not conn:
+        logger.error("No DB connection")
+        return False
+    try:
+        with conn.cursor(name="stream_registered") as cur:
+            cur.itersize = chunk_size
+            cur.execute("SELECT telegram_id, country FROM users ORDER BY telegram_id")
+            while rows := cur.fetchmany(chunk_size):
+                consume(rows)
+        return True
+    except Exception as e:
+        logger.error(f"Registered users stream error: {e}")
+        return False
+    finally:
+        conn.close()
+
+# Запросы сегментов (общие с bench_partitions.py)
+SEGMENT_COUNTS = (
+    "SELECT country, status, (registered_at AT TIME ZONE 'UTC')::date AS day, count(*) "
+    "FROM users GROUP BY country, status, day"
+)
+SEGMENT_PAGE = "SELECT telegram_id FROM users WHERE telegram_id > %s AND ({where}) ORDER BY telegram_id LIMIT %s"
+
+@traced("db.get_segment_counts")
+def get_segment_counts():
+    """Агрегаты для предпросмотра сегментов: (country, status, день регистрации по UTC, количество)."""
+    conn = get_db_connection(read_only=True)
+    if not conn:
+        logger.error("No DB connection")
+        return None
+    try:
+        with conn.cursor() as cur:
+            # GROUP BY содержит ключ секционирования (migrate_partitions.py): каждая секция агрегируется
+            # отдельно и параллельно, без общей хеш-таблицы на всю таблицу. Без секций настройка ни на что не влияет
+            cur.execute("SET LOCAL enable_partitionwise_aggregate = on")
+            cur.execute(SEGMENT_COUNTS)
+            return cur.fetchall()
+    except Exception as e:
+        logger.error(f"Segment counts fetch error: {e}")
+        return None
+    finally:
+        conn.close()
+
+@traced("db.get_segment_page")
+def get_segment_page(where, params, after_id, limit):
+    """Страница telegram_id сегмента (условие из segments.compile_segment) с ID больше after_id."""
+    conn = get_db_connection(read_only=True)
+    if not conn:
+        logger.error("No DB connection")
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute(SEGMENT_PAGE.format(where=where), [after_id, *params, limit])
+            return [row[0] for row in cur.fetchall()]
+    except Exception as e:
+        logger.error(f"Segment page fetch error after_id={after_id}: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+
+@traced("db.find_users")
+def find_users(ids, usernames, ranges, limit):
+    """Находит не больше limit пользователей по списку ID, username и диапазонам ID одним запросом."""
+    if not ids and not usernames and not ranges:
+        return []
+    logger.info(f"Resolving users: ids={len(ids)}, usernames={len(usernames)}, ranges={len(ranges)}")
+    conn = get_db_connection(read_only=True, pinned_ids=ids)
+    if not conn:
+        logger.error("No DB connection")
+        return []
+    try:
+        conditions = ["telegram_id = ANY(%s)", "lower(username) = ANY(%s)"]
+        params = [list(ids), [username.lower() for username in usernames]]
+        for start, end in ranges:
+            conditions.append("telegram_id BETWEEN %s AND %s")
+            params.extend((start, end))
+        with conn.cursor() as cur:
+            cur.execute(
+                f"SELECT telegram_id, username, phone, country FROM users WHERE {' OR '.join(conditions)} LIMIT %s",
+                [*params, limit]
+            )
+            users = cur.fetchall()
+            logger.info(f"Resolved {len(users)} users")
+            return users
+    except Exception as e:
+        logger.error(f"Users resolve error: {e}")
+        return []
+    finally:
+        conn.close()
+
+
+@traced("db.save_deliveries")
+def save_deliveries(rows):
+    """Пачкой записывает строки журнала доставок (recipient, kind, asset, status, error, key, created_at).
+
+    Строка с ключом, зарезервированным claim_deliveries, обновляет резерв.
+    """
+    conn = get_db_connection()
+    if not conn:
+        logger.error("No DB connection")
+        return False
+    # В одной команде ON CONFLICT DO UPDATE не может обновить строку дважды
+    keyed = {row[5]: row for row in rows if row[5]}
+    rows = [row for row in rows if not row[5]] + list(keyed.values())
+    try:
+        with conn.cursor() as cur:
+            execute_values(
+                cur,
+                "INSERT INTO deliveries (recipient, kind, asset, status, error, idempotency_key, created_at) "
+                "VALUES %s ON CONFLICT (idempotency_key) DO UPDATE SET "
+                "asset = EXCLUDED.asset, status = EXCLUDED.status, error = EXCLUDED.error, created_at = EXCLUDED.created_at",
+                rows
+            )
+            conn.commit()
+            logger.info(f"Saved {len(rows)} deliveries")
+            return True
+    except Exception as e:
+        logger.error(f"Deliveries save error: {e}")
+        return False
+    finally:
+        conn.close()
+
+@traced("db.claim_deliveries")
+def claim_deliveries(kind, claims):
+    """Резервирует ключи идемпотентности (recipient, key) строками pending; возвращает множество
+    зарезервированных сейчас ключей (уже занятые — доставлены ранее) или None при ошибке БД."""
+    conn = get_db_connection()
+    if not conn:
+        logger.error("No DB connection")
+        return None
+    try:
+        with conn.cursor() as cur:
+            claimed = execute_values(
+                cur,
+                "INSERT INTO deliveries (recipient, kind, status, idempotency_key) VALUES %s "
+                "ON CONFLICT (idempotency_key) DO NOTHING RETURNING idempotency_key",
+                [(recipient, kind, key) for recipient, key in claims],
+                template="(%s, %s, 'pending', %s)",
+                fetch=True
+            )
+            conn.commit()
+            return {row[0] for row in claimed}
+    except Exception as e:
+        logger.error(f"Deliveries claim error: {e}")
+        return None
+    finally:
+        conn.close()
+
+@traced("db.release_deliveries")
+def release_deliveries(keys):
+    """Снимает резерв pending с ключей неудачных доставок, чтобы их можно было повторить."""
+    conn = get_db_connection()
+    if not conn:
+        logger.error("No DB connection")
+        return False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM deliveries WHERE idempotency_key = ANY(%s) AND status = 'pending'", (list(keys),))
+            conn.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Deliveries release error: {e}")
+        return False
+    finally:
+        conn.close()
+
+@traced("db.prune_deliveries")
+def prune_deliveries(before, batch_size=10000):
+    """Удаляет записи журнала доставок старше before пачками по batch_size; возвращает число удаленных."""
+    conn = get_db_connection()
+    if not conn:
+        logger.error("No DB connection")
+        return 0
+    deleted = 0
+    try:
+        with conn.cursor() as cur:
+            while True:
+                # Короткие транзакции: журнал не блокируется надолго
+                cur.execute(
+                    "DELETE FROM deliveries WHERE id IN "
+                    "(SELECT id FROM deliveries WHERE created_at < %s ORDER BY created_at LIMIT %s)",
+                    (before, batch_size)
+                )
+                conn.commit()
+                deleted += cur.rowcount
+                if cur.rowcount < batch_size:
+                    break
+        logger.info(f"Pruned {deleted} deliveries")
+        return deleted
+    except Exception as e:
+        logger.error(f"Deliveries prune error: {e}")
+        return deleted
+    finally:
+        conn.close()
+
+@traced("db.get_delivery_keys")
+def get_delivery_keys(since):
+    """Возвращает ключи идемпотентности успешных доставок начиная с момента since.
+
+    Ключи рассылок не загружаются: их проверяет claim_deliveries на стороне БД.
+    """
     conn = get_db_connection()
     if not conn:
         logger.error("No DB connection")
         return []
     try:
         with conn.cursor() as cur:
-            cur.execute("SELECT DISTINCT country FROM users WHERE country IS NOT NULL AND country != 'Unknown'")
-            countries = [row[0] for row in cur.fetchall()]
-            logger.info(f"Found {len(countries)} countries: {countries}")
-            return countries
+            cur.execute(
+                "SELECT idempotency_key, created_at FROM deliveries "
+                "WHERE created_at >= %s AND idempotency_key IS NOT NULL AND kind <> 'broadcast' AND status = 'sent' "
+                "ORDER BY created_at",
+                (since,)
+            )
+            keys = cur.fetchall()
+            logger.info(f"Loaded {len(keys)} delivery keys")
+            return keys
     except Exception as e:
-        logger.error(f"Countries fetch error: {e}")
+        logger.error(f"Delivery keys fetch error: {e}")
         return []
     finally:
         conn.close()
 
-def get_users_by_country(country):
-    """Получает список telegram_id пользователей для указанной страны."""
-    logger.info(f"Fetching users for country={country}")
+@traced("db.get_deliveries")
+def get_deliveries(recipient, limit=10):
+    """Возвращает последние записи журнала доставок для пользователя."""
+    conn = get_db_connection(read_only=True)
+    if not conn:
+        logger.error("No DB connection")
+        return []
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT kind, asset, status, error, created_at FROM deliveries "
+                "WHERE recipient = %s ORDER BY created_at DESC LIMIT %s",
+                (recipient, limit)
+            )
+            return cur.fetchall()
+    except Exception as e:
+        logger.error(f"Deliveries fetch error for recipient={recipient}: {e}")
+        return []
+    finally:
+        conn.close()
+
+
+
+@traced("db.get_unreachable_users")
+def get_unreachable_users():
+    """Возвращает (telegram_id, status, last_error_at) всех недоступных пользователей."""
     conn = get_db_connection()
     if not conn:
         logger.error("No DB connection")
         return []
     try:
         with conn.cursor() as cur:
-            cur.execute("SELECT telegram_id FROM users WHERE country = %s", (country,))
-            user_ids = [row[0] for row in cur.fetchall()]
-            logger.info(f"Found {len(user_ids)} users for country={country}")
-            return user_ids
+            cur.execute("SELECT telegram_id, status, last_error_at FROM users WHERE status <> 'active'")
+            users = cur.fetchall()
+            logger.info(f"Found {len(users)} unreachable users")
+            return users
     except Exception as e:
-        logger.error(f"Users fetch error for country={country}: {e}")
+        logger.error(f"Unreachable users fetch error: {e}")
         return []
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+@traced("db.update_reachability")
+def update_reachability(rows):
+    """Пачкой обновляет статус доступности: строки (telegram_id, status, last_error_at)."""
+    conn = get_db_connection()
+    if not conn:
+        logger.error("No DB connection")
+        return False
+    try:
+        with conn.cursor() as cur:
+            execute_values(
+                cur,
+                "UPDATE users SET status = v.status, last_error_at = COALESCE(v.last_error_at, users.last_error_at) "
+                "FROM (VALUES %s) AS v (telegram_id, status, last_error_at) WHERE users.telegram_id = v.telegram_id",
+                rows,
+                template="(%s::bigint, %s, %s::timestamptz)"
+            )
+            conn.commit()
+            logger.info(f"Updated reachability for {len(rows)} users")
+            return True
+    except Exception as e:
+        logger.error(f"Reachability update error: {e}")
+        return False
+    finally:
+        conn.close()
+
+# Встроенный бэкенд: те же имена модуля указывают на методы SQLiteStorage
+if DB_BACKEND == "sqlite":
+    from storage import STORAGE_API
+    from storage_sqlite import SQLiteStorage
+
+    storage = SQLiteStorage(SQLITE_PATH)
+    for _name in STORAGE_API:
+        globals()[_name] = getattr(storage, _name)
+elif DB_BACKEND != "postgres":
+    raise ValueError(f"Unknown DB_BACKEND: {DB_BACKEND}")
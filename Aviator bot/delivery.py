@@ -0,0 +1,401 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import FSInputFile
+from config import TOTAL_DIR, DELIVERY_WORKERS, DELIVERY_QUEUE_SIZE
+from database import get_user, get_users, claim_deliveries, release_deliveries
+from languages import load_language_messages, get_user_language
+from rate_limit import bot_api_limiter
+from delivery_log import delivery_log
+from reachability import reachability
+from tracing import tracer
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Полосы приоритета: интерактивные действия админа и ответы при регистрации
+# всегда обслуживаются раньше массовых рассылок
+INTERACTIVE = "interactive"
+REGISTRATION = "registration"
+BULK = "bulk"
+LANE_PRIORITY = {INTERACTIVE: 0, REGISTRATION: 1, BULK: 2}
+
+class DeliveryService:
+    """Единая очередь отправок в Bot API с полосами приоритета и пулом воркеров на полосу."""
+
+    def __init__(self, workers: dict[str, int], queue_size: int):
+        self.bot = None
+        self.workers = workers
+        self.queue_size = queue_size
+        self._queues = {}
+        self._tasks = []
+        self._in_flight = {lane: 0 for lane in LANE_PRIORITY}
+        self._waits = {lane: deque(maxlen=1000) for lane in LANE_PRIORITY}
+
+    async def start(self, bot: Bot):
+        """Запускает воркеры всех полос."""
+        self.bot = bot
+        for lane in LANE_PRIORITY:
+            self._queues[lane] = asyncio.Queue(maxsize=self.queue_size)
+            for _ in range(self.workers.get(lane, 1)):
+                self._tasks.append(asyncio.create_task(self._worker(lane)))
+            self._register_metrics(lane)
+        logger.info(f"Сервис доставки запущен: воркеры={self.workers}, очередь={self.queue_size}")
+
+    async def stop(self):
+        """Останавливает воркеры; неотправленные задания отменяются."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        for queue in self._queues.values():
+            while not queue.empty():
+                future, *_ = queue.get_nowait()
+                future.cancel()
+        logger.info("Сервис доставки остановлен")
+
+    def _register_metrics(self, lane: str):
+        metrics.register_gauge(f"delivery.{lane}.depth", lambda: self._queues[lane].qsize())
+        metrics.register_gauge(f"delivery.{lane}.in_flight", lambda: self._in_flight[lane])
+        metrics.register_gauge(f"delivery.{lane}.wait_p50_ms", lambda: metrics.percentile(self._waits[lane], 50) * 1000)
+        metrics.register_gauge(f"delivery.{lane}.wait_p95_ms", lambda: metrics.percentile(self._waits[lane], 95) * 1000)
+
+    async def submit(self, lane: str, method, *args, **kwargs) -> asyncio.Future:
+        """Ставит вызов метода Bot API в очередь полосы и возвращает future с результатом.
+
+        Если очередь полосы заполнена, ожидает свободного места (backpressure).
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queues[lane].put((future, method, args, kwargs, time.monotonic(), tracer.current()))
+        metrics.inc(f"delivery.{lane}.submitted")
+        return future
+
+    async def call(self, lane: str, method, *args, **kwargs):
+        """Выполняет вызов метода Bot API через очередь полосы и возвращает результат."""
+        return await (await self.submit(lane, method, *args, **kwargs))
+
+    async def _worker(self, lane: str):
+        queue = self._queues[lane]
+        while True:
+            future, method, args, kwargs, enqueued_at, parent = await queue.get()
+            try:
+                if future.done():
+                    continue
+                self._in_flight[lane] += 1
+                try:
+                    queued_ms = round((time.monotonic() - enqueued_at) * 1000, 1)
+                    with tracer.attach(parent), tracer.span(f"delivery.{lane}", queued_ms=queued_ms):
+                        result = await self._execute(lane, method, args, kwargs, enqueued_at)
+                except Exception as e:
+                    metrics.inc(f"delivery.{lane}.failed")
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    metrics.inc(f"delivery.{lane}.sent")
+                    if not future.done():
+                        future.set_result(result)
+                finally:
+                    self._in_flight[lane] -= 1
+            finally:
+                queue.task_done()
+
+    async def _execute(self, lane: str, method, args, kwargs, enqueued_at: float):
+        chat_id = _target_chat(method, args, kwargs)
+        while True:
+            if chat_id is not None:
+                # Чат под RetryAfter ждет сам, не занимая общий бюджет
+                await bot_api_limiter.wait_chat(chat_id)
+            await bot_api_limiter.acquire(LANE_PRIORITY[lane])
+            self._waits[lane].append(time.monotonic() - enqueued_at)
+            try:
+                return await method(*args, **kwargs)
+            except TelegramRetryAfter as e:
+                logger.warning(f"Лимит Telegram, ожидание {e.retry_after} секунд (чат {chat_id})")
+                if chat_id is None:
+                    bot_api_limiter.pause(e.retry_after)
+                else:
+                    bot_api_limiter.pause_chat(chat_id, e.retry_after)
+                enqueued_at = time.monotonic()
+
+def _target_chat(method, args, kwargs):
+    """Чат, в который отправляет вызов: chat_id метода Bot или чат сообщения для message.answer/reply/edit_text."""
+    if "chat_id" in kwargs:
+        return kwargs["chat_id"]
+    owner = getattr(method, "__self__", None)
+    if isinstance(owner, Bot):
+        chat_id = args[0] if args else None
+        return chat_id if isinstance(chat_id, (int, str)) else None
+    chat = getattr(owner, "chat", None)
+    return chat.id if chat else None
+
+# Манифест GIF для тоталов
+class AssetCache:
+    """Список GIF из TOTAL_DIR и file_id, полученные от Telegram после первой загрузки."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.file_ids = {}
+        self._paths = None
+
+    def paths(self) -> list[str]:
+        """Сканирует папку один раз и возвращает пути ко всем GIF/MP4."""
+        if self._paths is None:
+            if not os.path.exists(self.directory):
+                logger.error(f"Папка {self.directory} не найдена")
+                return []
+            self._paths = sorted(
+                os.path.join(self.directory, f)
+                for f in os.listdir(self.directory)
+                if f.lower().endswith((".gif", ".mp4"))
+            )
+            logger.info(f"Найдено {len(self._paths)} GIF в папке {self.directory}")
+        return self._paths
+
+    def input_file(self, path: str):
+        """file_id, если файл уже загружался, иначе файл с диска."""
+        return self.file_ids.get(path) or FSInputFile(path)
+
+    def remember(self, path: str, message):
+        """Запоминает file_id из ответа Telegram, чтобы не загружать файл повторно."""
+        if path not in self.file_ids and message and message.animation:
+            self.file_ids[path] = message.animation.file_id
+
+    def export(self) -> dict:
+        """Манифест для снимка кешей: mtime папки, список файлов и file_id с размером и mtime файла."""
+        files = {}
+        for path, file_id in list(self.file_ids.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files[path] = [stat.st_size, stat.st_mtime_ns, file_id]
+        try:
+            directory_mtime = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            directory_mtime = None
+        return {"directory_mtime": directory_mtime, "paths": self._paths, "files": files}
+
+    def restore(self, manifest: dict) -> int:
+        """Принимает манифест из снимка: список файлов — если папка не менялась, file_id — если не менялся файл."""
+        if self._paths is None and manifest["paths"] is not None:
+            try:
+                if os.stat(self.directory).st_mtime_ns == manifest["directory_mtime"]:
+                    self._paths = manifest["paths"]
+            except OSError:
+                pass
+        restored = 0
+        for path, (size, mtime_ns, file_id) in manifest["files"].items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns):
+                self.file_ids.setdefault(path, file_id)
+                restored += 1
+        return restored
+
+delivery = DeliveryService(DELIVERY_WORKERS, DELIVERY_QUEUE_SIZE)
+assets = AssetCache(TOTAL_DIR)
+metrics.register_gauge("rate_limit.waiting", bot_api_limiter.waiting)
+
+def escape_markdown_v2(text: str) -> str:
+    chars = r'_[]()~`>#+-=|{}.!'
+    for char in chars:
+        text = text.replace(char, f'\\{char}')
+    return text
+
+# Получение случайного GIF
+def get_random_total_gif() -> str | None:
+    """Возвращает путь к случайному GIF."""
+    try:
+        paths = assets.paths()
+        if not paths:
+            logger.error(f"Нет GIF или MP4 в папке {TOTAL_DIR}")
+            return None
+        gif_path = random.choice(paths)
+        logger.debug(f"Выбран GIF: {gif_path}")
+        return gif_path
+    except Exception as e:
+        logger.error(f"Ошибка получения случайного GIF: {e}", exc_info=True)
+        return None
+
+def _finish(user_id: int, kind: str, asset: str | None, ok: bool, error: str | None = None, key: str | None = None):
+    """Пишет результат отправки в журнал и освобождает ключ при неудаче."""
+    delivery_log.record(user_id, kind, asset, ok, error, key)
+    if ok:
+        reachability.report_ok(user_id)
+    elif key:
+        delivery_log.release(key)
+
+# Функция отправки тотала
+async def send_total(user_id: int, gif_path: str | None = None, user: tuple | None = None, lane: str = INTERACTIVE,
+                     key: str | None = None) -> bool:
+    """Отправляет одиночный тотал пользователю под спойлером.
+
+    key — ключ идемпотентности: повторный вызов с тем же ключом ничего не отправляет.
+    """
+    if key and not delivery_log.claim(key):
+        return True
+    gif_path = gif_path or get_random_total_gif()
+    logger.info(f"Попытка отправки тотала: user_id={user_id}, gif_path={gif_path}")
+    try:
+        if not gif_path or not os.path.exists(gif_path):
+            logger.error(f"GIF не найден: {gif_path}")
+            _finish(user_id, "total", gif_path, False, "gif not found", key)
+            return False
+
+        user = user or await asyncio.to_thread(get_user, user_id)
+        if not user:
+            logger.error(f"Пользователь {user_id} не найден")
+            _finish(user_id, "total", gif_path, False, "user not found", key)
+            return False
+
+        country = user[3] or "Unknown"
+        messages = load_language_messages(get_user_language(country))
+        message_text = escape_markdown_v2(random.choice(messages["total"]) or "Ваш тотал готов!")
+        sent = await delivery.call(
+            lane,
+            delivery.bot.send_animation,
+            chat_id=user_id,
+            animation=assets.input_file(gif_path),
+            caption=f"||{message_text}||",
+            parse_mode="MarkdownV2",
+            has_spoiler=True
+        )
+        assets.remember(gif_path, sent)
+        logger.info(f"Тотал успешно отправлен пользователю user_id={user_id}")
+        _finish(user_id, "total", gif_path, True, key=key)
+        return True
+    except TelegramForbiddenError as e:
+        logger.warning(f"Пользователь {user_id} заблокировал бота")
+        reachability.report_error(user_id, e)
+        _finish(user_id, "total", gif_path, False, str(e), key)
+        return False
+    except Exception as e:
+        logger.error(f"Ошибка отправки тотала пользователю user_id={user_id}: {e}", exc_info=True)
+        _finish(user_id, "total", gif_path, False, str(e), key)
+        return False
+
+# Функция отправки ошибки
+async def send_error(user_id: int, user: tuple | None = None, lane: str = INTERACTIVE, key: str | None = None) -> bool:
+    """Отправляет сообщение об ошибке пользователю."""
+    if key and not delivery_log.claim(key):
+        return True
+    logger.info(f"Попытка отправки ошибки: user_id={user_id}")
+    try:
+        user = user or await asyncio.to_thread(get_user, user_id)
+        if not user:
+            logger.error(f"Пользователь {user_id} не найден")
+            _finish(user_id, "error", None, False, "user not found", key)
+            return False
+
+        country = user[3] or "Unknown"
+        messages = load_language_messages(get_user_language(country))
+        message_text = random.choice(messages["error"]) or "Произошла ошибка. Попробуйте позже."
+        await delivery.call(lane, delivery.bot.send_message, user_id, message_text)
+        logger.info(f"Ошибка отправлена user_id={user_id}")
+        _finish(user_id, "error", None, True, key=key)
+        return True
+    except TelegramForbiddenError as e:
+        logger.warning(f"Пользователь {user_id} заблокировал бота")
+        reachability.report_error(user_id, e)
+        _finish(user_id, "error", None, False, str(e), key)
+        return False
+    except Exception as e:
+        logger.error(f"Ошибка отправки ошибки user_id={user_id}: {e}", exc_info=True)
+        _finish(user_id, "error", None, False, str(e), key)
+        return False
+
+# Функция отправки серии тоталов
+async def send_total_series(user_id: int, delay: int = 60, count: int = 10, user: tuple | None = None,
+                            key: str | None = None):
+    """Отправляет серию из 10 тоталов пользователю с интервалом в 1 минуту."""
+    logger.info(f"Запуск серии из {count} тоталов с интервалом {delay}с для user_id={user_id}")
+    try:
+        # Данные пользователя загружаются один раз на всю серию
+        user = user or (await asyncio.to_thread(get_users, [user_id])).get(user_id)
+        if not user:
+            logger.error(f"Пользователь {user_id} не найден, серия отменена")
+            return
+        for i in range(count):
+            if not reachability.is_reachable(user_id):
+                logger.warning(f"Серия для user_id={user_id} остановлена: пользователь недоступен")
+                reachability.skipped(count - i)
+                break
+            success = await send_total(user_id, user=user, lane=BULK, key=key and f"{key}:{i}")
+            if success:
+                logger.info(f"Тотал {i+1}/{count} отправлен, user_id={user_id}")
+            else:
+                logger.error(f"Ошибка тотала {i+1}/{count}, user_id={user_id}")
+            if i < count - 1:  # Не ждем после последнего тотала
+                await asyncio.sleep(delay)
+    except Exception as e:
+        logger.error(f"Ошибка серии, user_id={user_id}: {e}", exc_info=True)
+
+# Массовая рассылка
+async def broadcast(user_ids, text: str, media: dict | None = None, key: str | None = None) -> tuple[int, int]:
+    """Рассылает сообщение (с фото/видео по file_id) через полосу bulk, возвращает (доставлено, получателей).
+
+    user_ids — список ID или асинхронный итератор страниц ID (segments.iter_segment):
+    страница отправляется целиком, прежде чем читается следующая.
+    key — ключ рассылки: получатели, которым рассылка с этим ключом уже доставлена,
+    пропускаются и засчитываются как доставленные. Ключи получателей резервируются
+    в БД по странице за раз (claim_deliveries), в памяти процесса не хранятся.
+    """
+    if not hasattr(user_ids, "__aiter__"):
+        return await _broadcast_page(list(user_ids), text, media, key), len(user_ids)
+    success_count = total = 0
+    async for page in user_ids:
+        success_count += await _broadcast_page(page, text, media, key)
+        total += len(page)
+    return success_count, total
+
+async def _broadcast_page(user_ids: list[int], text: str, media: dict | None, key: str | None) -> int:
+    bot = delivery.bot
+    if media and media["type"] == "photo":
+        method, kwargs = bot.send_photo, {"photo": media["file_id"], "caption": text}
+    elif media and media["type"] == "video":
+        method, kwargs = bot.send_video, {"video": media["file_id"], "caption": text}
+    else:
+        method, kwargs = bot.send_message, {"text": text}
+
+    asset = media and media["file_id"]
+    success_count = 0
+    claimed = None
+    if key:
+        claimed = await asyncio.to_thread(claim_deliveries, "broadcast", [(user_id, f"{key}:{user_id}") for user_id in user_ids])
+        if claimed is None:
+            raise RuntimeError(f"Не удалось зарезервировать ключи рассылки {key}")
+    pending = []
+    for user_id in user_ids:
+        user_key = key and f"{key}:{user_id}"
+        if user_key and user_key not in claimed:
+            success_count += 1
+            continue
+        pending.append((user_id, user_key, await delivery.submit(BULK, method, chat_id=user_id, **kwargs)))
+
+    results = await asyncio.gather(*(future for _, _, future in pending), return_exceptions=True)
+    for (user_id, user_key, _), result in zip(pending, results):
+        if isinstance(result, TelegramForbiddenError):
+            logger.warning(f"Пользователь {user_id} заблокировал бота при рассылке")
+            reachability.report_error(user_id, result)
+        elif isinstance(result, BaseException):
+            logger.error(f"Ошибка отправки пользователю {user_id}: {result}")
+        else:
+            success_count += 1
+        ok = not isinstance(result, BaseException)
+        _finish(user_id, "broadcast", asset, ok, None if ok else str(result), user_key)
+    failed_keys = [user_key for (_, user_key, _), result in zip(pending, results) if user_key and isinstance(result, BaseException)]
+    if failed_keys:
+        await asyncio.to_thread(release_deliveries, failed_keys)
+    return success_count
+
+# Проверка доступности чата без отправки сообщения
+async def probe_chat(user_id: int):
+    """Отправляет действие «печатает»; для заблокировавшего бота бросает TelegramForbiddenError."""
+    await delivery.call(BULK, delivery.bot.send_chat_action, user_id, "typing")
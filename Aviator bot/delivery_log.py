@@ -0,0 +1,114 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+from config import DELIVERY_LOG_BATCH_SIZE, DELIVERY_LOG_FLUSH_MS, DELIVERY_KEY_TTL_HOURS, DELIVERY_RETENTION_DAYS
+from database import save_deliveries, get_delivery_keys, prune_deliveries
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class DeliveryLog:
+    """Журнал доставок: строки копятся в памяти и пишутся в БД пачками в фоне.
+
+    Ключи идемпотентности команд админа проверяются по памяти, поэтому ни запись
+    журнала, ни проверка дубликатов не добавляют запросов к БД на пути отправки.
+    Ключи рассылок (по одному на получателя) в памяти не хранятся — их резервирует
+    БД пачками на страницу (claim_deliveries). Записи старше retention_days удаляются.
+    """
+
+    def __init__(self, batch_size: int, flush_interval_ms: int, key_ttl_hours: int, retention_days: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.key_ttl = key_ttl_hours * 3600
+        self.retention = timedelta(days=retention_days)
+        self._rows = deque(maxlen=batch_size * 50)
+        self._keys = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._prune_task = None
+
+    async def start(self):
+        """Загружает ключи недавних доставок и запускает фоновую запись."""
+        since = datetime.now(timezone.utc) - timedelta(seconds=self.key_ttl)
+        for key, created_at in await asyncio.to_thread(get_delivery_keys, since):
+            self._keys[key] = created_at.timestamp()
+        metrics.register_gauge("delivery_log.pending", lambda: len(self._rows))
+        metrics.register_gauge("delivery_log.keys", lambda: len(self._keys))
+        self._task = asyncio.create_task(self._run())
+        self._prune_task = asyncio.create_task(self._run_prune())
+        logger.info(f"Журнал доставок запущен, ключей в памяти: {len(self._keys)}")
+
+    async def stop(self):
+        """Останавливает фоновую запись и сбрасывает остаток журнала."""
+        tasks = [task for task in (self._task, self._prune_task) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = self._prune_task = None
+        await self.flush()
+
+    def claim(self, key: str) -> bool:
+        """Резервирует ключ идемпотентности; False — отправка с этим ключом уже была."""
+        self._expire()
+        if key in self._keys:
+            metrics.inc("delivery_log.duplicates")
+            logger.info(f"Повторная отправка пропущена: key={key}")
+            return False
+        self._keys[key] = time.time()
+        return True
+
+    def release(self, key: str):
+        """Освобождает ключ после неудачной отправки, чтобы ее можно было повторить."""
+        self._keys.pop(key, None)
+
+    def record(self, recipient: int, kind: str, asset: str | None, ok: bool, error: str | None = None, key: str | None = None):
+        """Добавляет строку в журнал без обращения к БД."""
+        if len(self._rows) == self._rows.maxlen:
+            metrics.inc("delivery_log.dropped")
+        self._rows.append((
+            recipient, kind, asset, "sent" if ok else "failed", error,
+            key if ok else None, datetime.now(timezone.utc)
+        ))
+        if len(self._rows) >= self.batch_size:
+            self._wakeup.set()
+
+    def _expire(self):
+        deadline = time.time() - self.key_ttl
+        while self._keys:
+            key, claimed_at = next(iter(self._keys.items()))
+            if claimed_at >= deadline:
+                break
+            self._keys.popitem(last=False)
+
+    async def flush(self):
+        """Записывает накопленные строки в БД; при ошибке строки остаются до следующей попытки."""
+        while self._rows:
+            batch = [self._rows.popleft() for _ in range(min(self.batch_size, len(self._rows)))]
+            if not await asyncio.to_thread(save_deliveries, batch):
+                self._rows.extendleft(reversed(batch))
+                return
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи журнала доставок: {e}", exc_info=True)
+
+    async def _run_prune(self):
+        while True:
+            try:
+                deleted = await asyncio.to_thread(prune_deliveries, datetime.now(timezone.utc) - self.retention)
+                metrics.inc("delivery_log.pruned", deleted)
+            except Exception as e:
+                logger.error(f"Ошибка очистки журнала доставок: {e}", exc_info=True)
+            await asyncio.sleep(3600)
+
+delivery_log = DeliveryLog(DELIVERY_LOG_BATCH_SIZE, DELIVERY_LOG_FLUSH_MS, DELIVERY_KEY_TTL_HOURS, DELIVERY_RETENTION_DAYS)
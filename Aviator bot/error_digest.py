@@ -0,0 +1,109 @@
+import os
+import html
+import time
+import asyncio
+import logging
+import traceback
+from collections import OrderedDict
+from logging.handlers import RotatingFileHandler
+from config import (
+    CHAT_ID, ERROR_LOG_FILE, ERROR_LOG_MAX_BYTES, ERROR_LOG_BACKUPS,
+    ERROR_WINDOW_SECONDS, ERROR_DIGEST_INTERVAL_SECONDS, ERROR_FINGERPRINTS_MAX
+)
+from notifier import split_message
+import metrics
+
+def fingerprint(record: logging.LogRecord) -> str:
+    """Отпечаток ошибки: тип исключения и место его возникновения, плюс место вызова логгера."""
+    site = f"{record.module}:{record.lineno}"
+    if record.exc_info and record.exc_info[0]:
+        exc_type, _, tb = record.exc_info
+        frames = traceback.extract_tb(tb)
+        origin = f"{os.path.basename(frames[-1].filename)}:{frames[-1].lineno}" if frames else "?"
+        return f"{exc_type.__name__}@{origin} ← {site}"
+    return f"{record.levelname}@{site}"
+
+class ErrorAggregator(logging.Handler):
+    """Корневой обработчик логов, схлопывающий повторяющиеся ошибки.
+
+    Записи ниже ERROR уходят в консоль как есть. Ошибки группируются по отпечатку:
+    в консоль и в errors.log попадает только первая за окно window секунд,
+    остальные лишь увеличивают счетчик. Счетчики живут в ограниченном LRU-буфере
+    и раз в digest_interval секунд отправляются сводкой в админский чат.
+    """
+
+    def __init__(self, console: logging.Handler, file: logging.Handler, window: int, capacity: int):
+        super().__init__()
+        self.console = console
+        self.file = file
+        self.window = window
+        self.capacity = capacity
+        # отпечаток -> [начало окна, повторов в окне, всего с прошлой сводки, пример сообщения]
+        self._entries = OrderedDict()
+
+    def emit(self, record: logging.LogRecord):
+        if record.levelno < logging.ERROR:
+            self.console.handle(record)
+            return
+        key = fingerprint(record)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            entry[2] += 1
+            if now - entry[0] < self.window:
+                entry[1] += 1
+                metrics.inc("errors.suppressed")
+                return
+            if entry[1]:
+                record.msg = f"{record.msg} (за прошлое окно повторялось еще {entry[1]} раз)"
+            entry[0], entry[1] = now, 0
+        else:
+            self._entries[key] = [now, 0, 1, record.getMessage()[:200]]
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        self.console.handle(record)
+        self.file.handle(record)
+
+    def take_digest(self) -> list[tuple[str, int, str]]:
+        """Возвращает (отпечаток, число, пример) за период с прошлой сводки и обнуляет счетчики."""
+        self.acquire()
+        try:
+            digest = [(key, entry[2], entry[3]) for key, entry in self._entries.items() if entry[2]]
+            for entry in self._entries.values():
+                entry[2] = 0
+        finally:
+            self.release()
+        return sorted(digest, key=lambda item: item[1], reverse=True)
+
+def setup_logging(level=logging.DEBUG) -> ErrorAggregator:
+    """Настраивает корневой логгер: консоль + ротируемый errors.log через агрегатор ошибок."""
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    console = logging.StreamHandler()
+    console.setFormatter(formatter)
+    file = RotatingFileHandler(ERROR_LOG_FILE, maxBytes=ERROR_LOG_MAX_BYTES, backupCount=ERROR_LOG_BACKUPS, encoding="utf-8")
+    file.setFormatter(formatter)
+    aggregator = ErrorAggregator(console, file, ERROR_WINDOW_SECONDS, ERROR_FINGERPRINTS_MAX)
+    logging.basicConfig(level=level, handlers=[aggregator])
+    return aggregator
+
+def format_digest(digest: list[tuple[str, int, str]], limit: int = 20) -> list[str]:
+    """Сводка ошибок, разбитая на сообщения в пределах лимита длины Telegram."""
+    header = f"🧯 Сводка ошибок за {ERROR_DIGEST_INTERVAL_SECONDS // 60} мин: {sum(count for _, count, _ in digest)}"
+    lines = [f"{count}× <code>{html.escape(key)}</code>\n    {html.escape(sample)}" for key, count, sample in digest[:limit]]
+    if len(digest) > limit:
+        lines.append(f"...и еще {len(digest) - limit} видов ошибок")
+    return split_message(header, lines)
+
+async def run_digest(aggregator: ErrorAggregator, send):
+    """Периодически отправляет сводку ошибок через send(text)."""
+    while True:
+        await asyncio.sleep(ERROR_DIGEST_INTERVAL_SECONDS)
+        digest = aggregator.take_digest()
+        if not digest:
+            continue
+        for text in format_digest(digest):
+            try:
+                await send(text)
+            except Exception as e:
+                logging.getLogger(__name__).error(f"Ошибка отправки сводки ошибок в CHAT_ID={CHAT_ID}: {e}")
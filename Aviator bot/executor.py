@@ -0,0 +1,74 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import nullcontext
+from aiogram import BaseMiddleware
+from config import CHAT_ID
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class UpdateExecutor(BaseMiddleware):
+    """Исполнитель апдейтов: по одному за раз на пользователя, не больше max_concurrency всего.
+
+    Апдейты одного пользователя выполняются строго в порядке поступления (двойное
+    нажатие «Synchronize» не запустит обработчик дважды параллельно). Ожидающих
+    не больше queue_size: сверх этого апдейты пользователей отбрасываются.
+    Апдейты админского чата принимаются всегда и не занимают общих слотов, чтобы
+    админ мог управлять ботом, даже когда все слоты заняты пользователями.
+    Обработчики не должны держать слот и очередь пользователя во время долгих
+    пауз — длинные сценарии (анимации, рассылки, bulk-отправки админа)
+    запускаются отдельной задачей.
+    """
+
+    def __init__(self, max_concurrency: int, queue_size: int):
+        self.queue_size = queue_size
+        self._slots = asyncio.Semaphore(max_concurrency)
+        # user_id -> [блокировка, число апдейтов пользователя в работе и в ожидании]
+        self._users = {}
+        self._waiting = 0
+        self._running = 0
+        self._waits = deque(maxlen=1000)
+        metrics.register_gauge("updates.waiting", lambda: self._waiting)
+        metrics.register_gauge("updates.running", lambda: self._running)
+        metrics.register_gauge("updates.wait_p50_ms", lambda: metrics.percentile(self._waits, 50) * 1000)
+        metrics.register_gauge("updates.wait_p95_ms", lambda: metrics.percentile(self._waits, 95) * 1000)
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        chat = data.get("event_chat")
+        admin = bool(chat and chat.id == CHAT_ID)
+        if self._waiting >= self.queue_size and not admin:
+            metrics.inc("updates.shed")
+            logger.debug(f"Очередь апдейтов переполнена, апдейт {event.update_id} отброшен")
+            return None
+        # Апдейты без пользователя не упорядочиваются между собой
+        key = user.id if user else f"update:{event.update_id}"
+        entry = self._users.get(key)
+        if entry is None:
+            entry = self._users[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        self._waiting += 1
+        enqueued_at = time.monotonic()
+        started = False
+        try:
+            async with entry[0], (nullcontext() if admin else self._slots):
+                self._waiting -= 1
+                started = True
+                self._running += 1
+                self._waits.append(time.monotonic() - enqueued_at)
+                # Состояние FSM прочитано до ожидания — предыдущий апдейт пользователя мог его сменить
+                if "state" in data:
+                    data["raw_state"] = await data["state"].get_state()
+                try:
+                    return await handler(event, data)
+                finally:
+                    self._running -= 1
+        finally:
+            if not started:
+                # Отменен во время ожидания
+                self._waiting -= 1
+            entry[1] -= 1
+            if not entry[1]:
+                del self._users[key]
@@ -0,0 +1,91 @@
+import os
+import logging
+from runtime import json_loads
+
+logger = logging.getLogger(__name__)
+
+# Маппинг стран на языки
+COUNTRY_TO_LANG = {
+    "Russia": "ru",
+    "United States": "en",
+    "United Kingdom": "en",
+    "Spain": "es",
+    # Добавьте другие страны и языки по необходимости
+}
+
+# Папка с JSON-переводами
+LANG_DIR = "lang"
+
+# Разобранные каталоги: путь -> (размер, mtime_ns, сообщения). Файл разбирается заново только после изменения
+_catalogs = {}
+
+def _file_key(file_path: str) -> tuple[int, int]:
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+def load_language_messages(lang_code):
+    """Загружает сообщения из JSON для указанного языка, дефолт — английский.
+
+    Каталог общий для всех вызовов — изменять его нельзя.
+    """
+    try:
+        file_path = os.path.join(LANG_DIR, f"{lang_code}.json")
+        if not os.path.exists(file_path):
+            logger.warning(f"Язык {lang_code} не найден, использую en")
+            file_path = os.path.join(LANG_DIR, "en.json")
+        key = _file_key(file_path)
+        cached = _catalogs.get(file_path)
+        if cached and cached[:2] == key:
+            return cached[2]
+        with open(file_path, "rb") as f:
+            messages = json_loads(f.read())
+        _catalogs[file_path] = (*key, messages)
+        return messages
+    except Exception as e:
+        logger.error(f"Ошибка загрузки языка {lang_code}: {e}")
+        return {
+            "welcome": "@{username}, you have successfully registered in Aviator Predictor! Contact the operator for further instructions.",
+            "final_welcome": "🎉 You have successfully registered in Aviator Bot!",
+            "already_registered": "🔍 You are already registered!",
+            "enter_password": "🔐 Enter password:",
+            "password_correct": "✅ Password correct! Synchronize your account:",
+            "password_incorrect": "❌ Wrong password. Try again:",
+            "sync": "🔄 Synchronize your account",
+            "total": [
+                "🎯 Here's your total!",
+                "🚀 Catch the moment!",
+                "✅ Your total is ready!",
+                "🔥 Total delivered!",
+                "💥 Check this out!",
+                "🌟 Your result is here!",
+                "⚡ Total incoming!",
+                "🎰 Ready for the total?",
+                "🏆 Here it comes!",
+                "🎉 Total for you!"
+            ],
+            "error": [
+                "🤖 Neural networks can make mistakes, it's okay!",
+                "⚠️ Something went wrong, try again!",
+                "📞 Contact support."
+            ]
+        }
+
+def export_catalogs() -> dict:
+    """Разобранные каталоги для снимка кешей (snapshot.py)."""
+    return {path: list(entry) for path, entry in _catalogs.items()}
+
+def restore_catalogs(catalogs: dict) -> int:
+    """Принимает каталоги из снимка, если файл с тех пор не менялся; возвращает число принятых."""
+    restored = 0
+    for file_path, (size, mtime_ns, messages) in catalogs.items():
+        try:
+            if _file_key(file_path) == (size, mtime_ns):
+                _catalogs[file_path] = (size, mtime_ns, messages)
+                restored += 1
+        except OSError:
+            continue
+    return restored
+
+def get_user_language(country):
+    """Определяет язык пользователя на основе страны."""
+    return COUNTRY_TO_LANG.get(country, "en")
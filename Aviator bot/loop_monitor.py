@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+from config import LOOP_MONITOR_INTERVAL_MS, LOOP_BLOCK_THRESHOLD_MS
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Кадры из файлов бота считаются «виновником» блокировки, библиотечные — нет
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class LoopMonitor:
+    """Измеряет задержку event loop и ловит синхронные вызовы, блокирующие его дольше порога.
+
+    Корутина-пульс каждые interval мс отмечает время и задержку своего пробуждения.
+    Сторожевой поток, если пульса нет дольше threshold мс, снимает стек потока
+    event loop и приписывает блокировку обработчику (задаче) и строке кода бота.
+    """
+
+    def __init__(self, interval_ms: int, threshold_ms: int):
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self._lags = deque(maxlen=3000)
+        self._heartbeat = time.monotonic()
+        self._loop = None
+        self._loop_thread_id = None
+        self._task = None
+        self._stop = threading.Event()
+        self._watchdog = None
+
+    def start(self):
+        """Запускает пульс в текущем event loop и сторожевой поток."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._pulse())
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        for q in (50, 95, 99):
+            metrics.register_gauge(f"loop.lag_p{q}_ms", lambda q=q: metrics.percentile(self._lags, q) * 1000)
+        metrics.register_gauge("loop.lag_max_ms", lambda: max(self._lags, default=0.0) * 1000)
+        logger.info(f"Мониторинг event loop запущен: интервал={self.interval}с, порог={self.threshold}с")
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _pulse(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._lags.append(max(0.0, now - expected))
+            self._heartbeat = now
+
+    def _watch(self):
+        reported = None
+        while not self._stop.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat
+            if stalled < self.threshold + self.interval or heartbeat == reported:
+                continue
+            # Об одной блокировке сообщаем один раз
+            reported = heartbeat
+            try:
+                self._report(stalled)
+            except Exception as e:
+                logger.error(f"Ошибка сторожа event loop: {e}", exc_info=True)
+
+    def _report(self, stalled: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)
+        task = asyncio.current_task(self._loop)
+        handler = task.get_coro().__qualname__ if task else "-"
+        culprit = next(
+            (f for f in reversed(stack) if f.filename.startswith(PROJECT_DIR) and f.filename != __file__),
+            stack[-1]
+        )
+        where = f"{os.path.basename(culprit.filename)}:{culprit.name}:{culprit.lineno}"
+        metrics.inc("loop.stalls")
+        metrics.inc(f"loop.stalls.{handler}@{where}")
+        logger.warning(
+            f"Event loop заблокирован {stalled * 1000:.0f}мс: обработчик={handler}, место={where}\n"
+            + "".join(traceback.format_list(stack[-15:]))
+        )
+
+loop_monitor = LoopMonitor(LOOP_MONITOR_INTERVAL_MS, LOOP_BLOCK_THRESHOLD_MS)
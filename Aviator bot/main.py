@@ -1,25 +1,69 @@
 import asyncio
 import logging
+import runtime
 from aiogram import Bot, Dispatcher
-from config import BOT_TOKEN
+from config import BOT_TOKEN, CHAT_ID, UPDATE_MAX_CONCURRENCY, UPDATE_QUEUE_SIZE
 from admin_bot import register_admin_handlers
 from user_bot import register_user_handlers
+from delivery import delivery, probe_chat, INTERACTIVE
+from delivery_log import delivery_log
+from reachability import reachability
+from loop_monitor import loop_monitor
+from tracing import tracer, setup_tracing
+from transport import create_session
+from executor import UpdateExecutor
+from error_digest import setup_logging, run_digest
+from notifier import admin_notifier
+from registered_index import registered_index
+from database import run_write_replay
+from snapshot import warm_snapshot
 
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+error_aggregator = setup_logging(logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 async def main():
+    bot = None
     try:
-        bot = Bot(token=BOT_TOKEN)
+        # Снимок кешей читается до старта сервисов: индекс регистраций и file_id доступны с первого апдейта
+        warm_snapshot.restore()
+        loop_monitor.start()
+        bot = Bot(token=BOT_TOKEN, session=create_session())
         dp = Dispatcher()
+        setup_tracing(dp, bot)
+        dp.update.outer_middleware(UpdateExecutor(UPDATE_MAX_CONCURRENCY, UPDATE_QUEUE_SIZE))
+        await tracer.start()
+        await delivery_log.start()
+        await delivery.start(bot)
+        await reachability.start(probe_chat)
+        await registered_index.start()
+        await warm_snapshot.start()
+
+        async def send_admin(text: str):
+            await delivery.call(INTERACTIVE, bot.send_message, CHAT_ID, text, parse_mode="HTML")
+
+        await admin_notifier.start(send_admin)
         register_admin_handlers(dp, bot)
         register_user_handlers(dp, bot)
+        asyncio.create_task(run_digest(error_aggregator, send_admin))
+        asyncio.create_task(run_write_replay())
         logger.info("Бот запущен, начинаем polling")
         await dp.start_polling(bot)
     except Exception as e:
         logger.error(f"Ошибка запуска бота: {e}")
     finally:
-        await bot.session.close()
+        # Каждый сервис останавливается независимо: ошибка одного не мешает остановить остальные
+        stops = [
+            warm_snapshot.stop, admin_notifier.stop, delivery.stop, reachability.stop,
+            registered_index.stop, delivery_log.stop,
+        ]
+        if bot:
+            stops.append(bot.session.close)
+        stops += [tracer.stop, loop_monitor.stop]
+        for stop in stops:
+            try:
+                await stop()
+            except Exception as e:
+                logger.error(f"Ошибка остановки {stop.__qualname__}: {e}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    runtime.run(main())
\ No newline at end of file
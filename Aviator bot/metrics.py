@@ -0,0 +1,43 @@
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Счетчики (монотонно растут) и гейджи (значение вычисляется при снятии снимка)
+_counters = defaultdict(int)
+_gauges = {}
+
+def inc(name: str, value: int = 1):
+    """Увеличивает счетчик."""
+    _counters[name] += value
+
+def register_gauge(name: str, fn):
+    """Регистрирует функцию, возвращающую текущее значение метрики."""
+    _gauges[name] = fn
+
+def percentile(values, q: float) -> float:
+    """Возвращает q-й перцентиль (0..100) для последовательности значений."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def snapshot() -> dict:
+    """Снимок всех метрик: счетчики и текущие значения гейджей."""
+    result = dict(_counters)
+    for name, fn in _gauges.items():
+        try:
+            result[name] = fn()
+        except Exception as e:
+            logger.error(f"Ошибка метрики {name}: {e}")
+    return dict(sorted(result.items()))
+
+def format_snapshot() -> str:
+    """Текстовое представление снимка метрик для админского чата."""
+    lines = []
+    for name, value in snapshot().items():
+        if isinstance(value, float):
+            value = f"{value:.2f}"
+        lines.append(f"{name} = {value}")
+    return "\n".join(lines) or "Нет метрик."
@@ -0,0 +1,105 @@
+"""Необязательная миграция: users -> таблица, секционированная по стране (PARTITION BY LIST (country)).
+
+Крупнейшие страны получают отдельные секции, остальные попадают в секцию по умолчанию.
+Страницы сегментов по стране читают только свои секции, агрегаты сегментов считаются по секциям.
+Первичный ключ секционированной таблицы — (telegram_id, country): уникальный индекс
+обязан содержать ключ секционирования. Уникальность telegram_id обеспечивает
+database.save_user — вставка с проверкой под advisory-блокировкой по telegram_id
+(LOCK_USER_IDS). Поиск по telegram_id проверяет индекс каждой секции. Пустая страна
+заменяется на Unknown.
+
+Миграция выполняется в одной транзакции под эксклюзивной блокировкой users (бот на
+это время нужно остановить). Прежняя таблица остается как users_unpartitioned,
+с --drop-old удаляется.
+
+Запуск: python migrate_partitions.py [--countries N] [--drop-old]
+"""
+import sys
+import argparse
+import logging
+from psycopg2 import sql
+from config import DB_PARTITION_COUNTRIES
+from database import get_db_connection
+
+logger = logging.getLogger("migrate_partitions")
+
+def is_partitioned(cur) -> bool:
+    cur.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('users'))")
+    return cur.fetchone()[0]
+
+def partition_users(conn, countries: int, drop_old: bool = False) -> list[str]:
+    """Переводит users текущей схемы на секционирование; возвращает страны с отдельными секциями."""
+    with conn.cursor() as cur:
+        if is_partitioned(cur):
+            raise RuntimeError("users уже секционирована")
+        # Перенос таблицы дольше обычного DB_STATEMENT_TIMEOUT_MS
+        cur.execute("SET LOCAL statement_timeout = 0")
+        cur.execute("LOCK TABLE users IN ACCESS EXCLUSIVE MODE")
+        cur.execute(
+            "SELECT country FROM users WHERE country IS NOT NULL AND country != 'Unknown' "
+            "GROUP BY country ORDER BY count(*) DESC LIMIT %s",
+            (countries,)
+        )
+        largest = [row[0] for row in cur.fetchall()]
+
+        # Имена индексов уникальны в схеме: старые индексы переименовываются вместе с таблицей
+        cur.execute("ALTER TABLE users RENAME TO users_unpartitioned")
+        cur.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = 'users_unpartitioned'")
+        for (index,) in cur.fetchall():
+            cur.execute(sql.SQL("ALTER INDEX {} RENAME TO {}").format(sql.Identifier(index), sql.Identifier(f"{index}_old")))
+
+        cur.execute("""
+            CREATE TABLE users (
+                telegram_id BIGINT NOT NULL,
+                username VARCHAR(255),
+                phone VARCHAR(50),
+                country VARCHAR(100) NOT NULL DEFAULT 'Unknown',
+                status VARCHAR(16) NOT NULL DEFAULT 'active',
+                last_error_at TIMESTAMPTZ,
+                registered_at TIMESTAMPTZ DEFAULT now(),
+                PRIMARY KEY (telegram_id, country)
+            ) PARTITION BY LIST (country)
+        """)
+        for number, country in enumerate(largest, 1):
+            cur.execute(
+                sql.SQL("CREATE TABLE {} PARTITION OF users FOR VALUES IN (%s)").format(sql.Identifier(f"users_p{number}")),
+                (country,)
+            )
+        cur.execute("CREATE TABLE users_default PARTITION OF users DEFAULT")
+        cur.execute("""
+            INSERT INTO users (telegram_id, username, phone, country, status, last_error_at, registered_at)
+            SELECT telegram_id, username, phone, COALESCE(country, 'Unknown'), status, last_error_at, registered_at
+            FROM users_unpartitioned
+        """)
+        moved = cur.rowcount
+        # Те же индексы, что создает ensure_users_table, — на каждой секции
+        cur.execute("CREATE INDEX users_unreachable_idx ON users (telegram_id) WHERE status <> 'active'")
+        cur.execute("CREATE INDEX users_segment_idx ON users (country, status, registered_at)")
+        if drop_old:
+            cur.execute("DROP TABLE users_unpartitioned")
+    conn.commit()
+    logger.info(f"users секционирована: {moved} строк, отдельные секции: {', '.join(largest) or 'нет'}")
+    return largest
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Секционирование users по стране")
+    parser.add_argument("--countries", type=int, default=DB_PARTITION_COUNTRIES, help="число стран с отдельной секцией")
+    parser.add_argument("--drop-old", action="store_true", help="удалить прежнюю таблицу users_unpartitioned")
+    args = parser.parse_args()
+    conn = get_db_connection()
+    if not conn:
+        logger.error("Нет подключения к БД")
+        return 1
+    try:
+        partition_users(conn, args.countries, args.drop_old)
+        return 0
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Миграция не выполнена: {e}")
+        return 1
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from config import ADMIN_NOTIFY_FLUSH_SECONDS, ADMIN_NOTIFY_MAX_ITEMS
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Лимит длины текста сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+def split_message(header: str, lines: list[str]) -> list[str]:
+    """Склеивает строки под заголовком в сообщения не длиннее MESSAGE_LIMIT (строки не разрываются)."""
+    messages, current = [], header
+    for line in lines:
+        if len(current) + len(line) + 1 > MESSAGE_LIMIT:
+            messages.append(current)
+            current = header + " (продолжение)"
+        current += "\n" + line
+    messages.append(current)
+    return messages
+
+class AdminNotifier:
+    """Уведомления в админский чат, склеенные в сводки.
+
+    notify() только кладет строку в буфер своей темы и сразу возвращается, поэтому
+    обработчики не ждут отправки и не упираются в лимит сообщений группового чата.
+    Раз в flush_interval секунд каждая непустая тема уходит одним сообщением
+    (или несколькими, если не помещается в лимит длины).
+    """
+
+    def __init__(self, flush_interval: float, max_items: int):
+        self.flush_interval = flush_interval
+        self.max_items = max_items
+        # тема -> [заголовок, строки, отброшено при переполнении]
+        self._topics = OrderedDict()
+        self._send = None
+        self._task = None
+
+    async def start(self, send):
+        """Запускает фоновую отправку сводок через send(text) (HTML-разметка)."""
+        self._send = send
+        metrics.register_gauge("notifier.pending", lambda: sum(len(topic[1]) for topic in self._topics.values()))
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Уведомления админам: сводка раз в {self.flush_interval}с")
+
+    async def stop(self):
+        """Останавливает фоновую отправку и отправляет остаток."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            await self.flush()
+
+    def notify(self, topic: str, title: str, line: str):
+        """Добавляет строку line в сводку темы topic с заголовком title."""
+        entry = self._topics.get(topic)
+        if entry is None:
+            entry = self._topics[topic] = [title, deque(maxlen=self.max_items), 0]
+        if len(entry[1]) == self.max_items:
+            entry[2] += 1
+            metrics.inc("notifier.dropped")
+        entry[1].append(line)
+        metrics.inc("notifier.queued")
+
+    def _messages(self, title: str, lines: list[str], dropped: int) -> list[str]:
+        header = f"{title}: {len(lines) + dropped}"
+        if dropped:
+            header += f" (последние {len(lines)})"
+        return split_message(header, lines)
+
+    async def flush(self):
+        """Отправляет накопленные сводки; при ошибке отправки сводка теряется, а не копится."""
+        if not self._send:
+            return
+        topics, self._topics = self._topics, OrderedDict()
+        for title, lines, dropped in topics.values():
+            if not lines:
+                continue
+            for text in self._messages(title, list(lines), dropped):
+                try:
+                    await self._send(text)
+                    metrics.inc("notifier.messages")
+                except Exception as e:
+                    logger.error(f"Ошибка отправки сводки «{title}» в админский чат: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+admin_notifier = AdminNotifier(ADMIN_NOTIFY_FLUSH_SECONDS, ADMIN_NOTIFY_MAX_ITEMS)
@@ -0,0 +1,101 @@
+import os
+import sys
+import asyncio
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Кадры, в которых event loop ждет событий (простой)
+IDLE_FUNCTIONS = {"select", "poll", "epoll", "_poll", "_run_once"}
+
+class SamplingProfiler:
+    """Сэмплирующий профайлер потока event loop с привязкой сэмплов к asyncio-задачам.
+
+    Поток-сэмплер существует только на время профилирования, поэтому вне окна
+    профилирования накладных расходов нет.
+    """
+
+    def __init__(self, interval_ms: float):
+        self.interval = interval_ms / 1000
+        self._stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self.samples = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    async def profile(self, seconds: float) -> Counter:
+        """Сэмплирует поток текущего event loop seconds секунд.
+
+        Возвращает счетчик стеков: ключ — (корень, кадры), кадр — (файл, первая строка
+        функции, имя функции, текущая строка).
+        """
+        loop = asyncio.get_running_loop()
+        self._stacks = Counter()
+        self.samples = 0
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._sample, args=(loop, threading.get_ident()), name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self._stop.set()
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+        return self._stacks
+
+    def _sample(self, loop, thread_id: int):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append((code.co_filename, code.co_firstlineno, code.co_name, frame.f_lineno))
+                frame = frame.f_back
+            frames.reverse()
+            task = asyncio.current_task(loop)
+            if task is not None:
+                root = f"task:{task.get_coro().__qualname__}"
+            elif frames and frames[-1][2] in IDLE_FUNCTIONS:
+                root = "idle"
+            else:
+                root = "loop"
+            self._stacks[(root, tuple(frames))] += 1
+            self.samples += 1
+
+def collapsed(stacks: Counter) -> str:
+    """Свернутые стеки в формате flamegraph.pl / speedscope: «кадр;кадр;... число», кадр — с текущей строкой."""
+    lines = []
+    for (root, frames), count in stacks.most_common():
+        names = [f"{name} ({os.path.basename(filename)}:{lineno})" for filename, _, name, lineno in frames]
+        lines.append(f"{';'.join([root] + names)} {count}")
+    return "\n".join(lines) + "\n"
+
+def top_functions(stacks: Counter, limit: int = 15) -> str:
+    """Топ функций по собственным сэмплам (self) и с учетом вложенных вызовов (total).
+
+    Сэмплы группируются по функции (файл, первая строка, имя), а не по текущей строке.
+    """
+    total_samples = sum(stacks.values()) or 1
+    own, inclusive = Counter(), Counter()
+    for (_, frames), count in stacks.items():
+        functions = [frame[:3] for frame in frames]
+        if functions:
+            own[functions[-1]] += count
+        for function in set(functions):
+            inclusive[function] += count
+    lines = [f"{'self%':>6} {'total%':>7}  функция"]
+    for (filename, firstlineno, name), count in own.most_common(limit):
+        lines.append(
+            f"{count * 100 / total_samples:>6.1f} {inclusive[(filename, firstlineno, name)] * 100 / total_samples:>7.1f}  "
+            f"{name} ({os.path.basename(filename)}:{firstlineno})"
+        )
+    return "\n".join(lines)
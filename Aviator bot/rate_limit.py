@@ -0,0 +1,88 @@
+import asyncio
+import heapq
+import itertools
+import time
+import logging
+from config import SEND_RATE_LIMIT, RETRY_AFTER_GLOBAL_CHATS
+
+logger = logging.getLogger(__name__)
+
+class RateLimiter:
+    """Токен-бакет: общий бюджет запросов к Bot API для всех отправок бота.
+
+    Ожидающие получают токены в порядке приоритета (меньше — раньше), поэтому
+    интерактивные отправки не стоят в очереди за массовой рассылкой.
+    RetryAfter при отправке в чат откладывает только этот чат (pause_chat); общая
+    пауза (pause) — когда чат неизвестен или лимит пришел сразу в global_chats чатах.
+    """
+
+    def __init__(self, rate: float, burst: int | None = None, global_chats: int = 3):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.global_chats = global_chats
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        # chat_id -> время окончания паузы по RetryAfter этого чата
+        self._chat_paused = {}
+        self._waiters = []
+        self._seq = itertools.count()
+        self._pump = None
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, priority: int = 0):
+        """Ждет, пока в бюджете появится токен, и забирает его."""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._grant())
+        await future
+
+    async def _grant(self):
+        while self._waiters:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill(now)
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._tokens -= 1
+                future.set_result(None)
+
+    def pause(self, seconds: float):
+        """Приостанавливает все отправки (после TelegramRetryAfter)."""
+        until = time.monotonic() + seconds
+        if until > self._paused_until:
+            logger.warning(f"Бюджет Bot API приостановлен на {seconds}с")
+            self._paused_until = until
+            self._tokens = 0.0
+
+    def pause_chat(self, chat_id, seconds: float):
+        """Откладывает отправки в один чат (TelegramRetryAfter при отправке в него)."""
+        now = time.monotonic()
+        self._chat_paused = {chat: until for chat, until in self._chat_paused.items() if until > now}
+        self._chat_paused[chat_id] = max(self._chat_paused.get(chat_id, 0.0), now + seconds)
+        if len(self._chat_paused) >= self.global_chats:
+            # Лимит сразу в нескольких чатах — это общий лимит бота, а не одного получателя
+            self.pause(seconds)
+        else:
+            logger.warning(f"Отправки в чат {chat_id} приостановлены на {seconds}с")
+
+    async def wait_chat(self, chat_id):
+        """Ждет окончания паузы чата, если она есть."""
+        while (delay := self._chat_paused.get(chat_id, 0.0) - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+    def waiting(self) -> int:
+        """Количество отправок, ожидающих токен."""
+        return len(self._waiters)
+
+# Глобальный бюджет отправок (Telegram допускает ~30 сообщений в секунду)
+bot_api_limiter = RateLimiter(SEND_RATE_LIMIT, global_chats=RETRY_AFTER_GLOBAL_CHATS)
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from aiogram.exceptions import TelegramForbiddenError
+from config import (
+    DELIVERY_LOG_FLUSH_MS, REACHABILITY_PROBE_INTERVAL_HOURS,
+    REACHABILITY_REPROBE_AFTER_DAYS, REACHABILITY_PROBE_BATCH
+)
+from database import get_unreachable_users, update_reachability
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = "active"
+BLOCKED = "blocked"
+DEACTIVATED = "deactivated"
+
+def classify_forbidden(error: Exception) -> str:
+    """Определяет статус по тексту TelegramForbiddenError."""
+    return DEACTIVATED if "deactivated" in str(error).lower() else BLOCKED
+
+class Reachability:
+    """Недоступные пользователи в памяти; изменения статуса пишутся в БД пачками в фоне."""
+
+    def __init__(self, flush_interval_ms: int, probe_interval_hours: float, reprobe_after_days: float, probe_batch: int):
+        self.flush_interval = flush_interval_ms / 1000
+        self.probe_interval = probe_interval_hours * 3600
+        self.reprobe_after = timedelta(days=reprobe_after_days)
+        self.probe_batch = probe_batch
+        self._unreachable = {}
+        self._pending = {}
+        self._tasks = []
+
+    async def start(self, probe):
+        """Загружает недоступных пользователей и запускает запись статусов и перепроверку.
+
+        probe(user_id) — корутина, которая бросает TelegramForbiddenError для недоступного чата.
+        """
+        for telegram_id, status, last_error_at in await asyncio.to_thread(get_unreachable_users):
+            self._unreachable[telegram_id] = (status, last_error_at or datetime.now(timezone.utc))
+        metrics.register_gauge("reachability.unreachable", lambda: len(self._unreachable))
+        self._tasks = [asyncio.create_task(self._flush_loop()), asyncio.create_task(self._probe_loop(probe))]
+        logger.info(f"Недоступных пользователей: {len(self._unreachable)}")
+
+    async def stop(self):
+        """Останавливает фоновые задачи и сбрасывает несохраненные статусы."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        await self.flush()
+
+    def is_reachable(self, user_id: int) -> bool:
+        return user_id not in self._unreachable
+
+    def report_error(self, user_id: int, error: Exception):
+        """Помечает пользователя недоступным по ошибке TelegramForbiddenError."""
+        status = classify_forbidden(error)
+        now = datetime.now(timezone.utc)
+        self._unreachable[user_id] = (status, now)
+        self._pending[user_id] = (status, now)
+        logger.info(f"Пользователь {user_id} помечен как {status}")
+
+    def report_ok(self, user_id: int):
+        """Возвращает пользователя в активные после успешной отправки или входящего сообщения."""
+        if self._unreachable.pop(user_id, None):
+            self._pending[user_id] = (ACTIVE, None)
+            logger.info(f"Пользователь {user_id} снова доступен")
+
+    def skipped(self, count: int):
+        """Учитывает отправки, которые не выполнялись из-за недоступности получателя."""
+        if count:
+            metrics.inc("reachability.skipped_sends", count)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        rows = [(user_id, status, last_error_at) for user_id, (status, last_error_at) in pending.items()]
+        if not await asyncio.to_thread(update_reachability, rows):
+            # Более свежие статусы, пришедшие во время записи, не перезаписываем
+            self._pending = {**pending, **self._pending}
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи статусов доступности: {e}", exc_info=True)
+
+    async def _probe_loop(self, probe):
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            deadline = datetime.now(timezone.utc) - self.reprobe_after
+            due = [user_id for user_id, (_, last_error_at) in self._unreachable.items() if last_error_at <= deadline]
+            due = due[:self.probe_batch]
+            logger.info(f"Перепроверка доступности: {len(due)} пользователей")
+            for user_id in due:
+                try:
+                    await probe(user_id)
+                    self.report_ok(user_id)
+                    metrics.inc("reachability.recovered")
+                except TelegramForbiddenError as e:
+                    self.report_error(user_id, e)
+                except Exception as e:
+                    logger.error(f"Ошибка перепроверки user_id={user_id}: {e}")
+
+reachability = Reachability(
+    DELIVERY_LOG_FLUSH_MS, REACHABILITY_PROBE_INTERVAL_HOURS, REACHABILITY_REPROBE_AFTER_DAYS, REACHABILITY_PROBE_BATCH
+)
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left
+from config import REGISTERED_INDEX_REFRESH_MINUTES
+from database import stream_registered
+from languages import get_user_language
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class RegisteredIndex:
+    """Индекс зарегистрированных telegram_id в памяти процесса.
+
+    ID хранятся отсортированным массивом int64, рядом — массив uint8 с номером языка
+    пользователя, так что /start решается без запроса к БД: 9 байт на пользователя.
+    Новые регистрации попадают в небольшой словарь и вливаются в массивы при
+    фоновом обновлении. Пока индекс не загружен, loaded == False и вызывающий код
+    идет в БД.
+    """
+
+    def __init__(self, refresh_minutes: float):
+        self.refresh_interval = refresh_minutes * 60
+        self.loaded = False
+        self._ids = array("q")
+        self._langs = array("B")
+        self._lang_codes = []
+        self._added = {}
+        self._task = None
+
+    async def start(self):
+        """Загружает индекс и запускает фоновое обновление.
+
+        Индекс, восстановленный из снимка (restore), работает сразу, а перечитывание
+        из БД выполняется в фоне.
+        """
+        metrics.register_gauge("registered_index.size", lambda: len(self))
+        metrics.register_gauge("registered_index.bytes", self.memory_bytes)
+        restored = self.loaded
+        if not restored:
+            await self.refresh()
+        self._task = asyncio.create_task(self._run(refresh_first=restored))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def __len__(self) -> int:
+        return len(self._ids) + len(self._added)
+
+    def language(self, telegram_id: int) -> str | None:
+        """Код языка зарегистрированного пользователя или None, если он не зарегистрирован."""
+        lang = self._added.get(telegram_id)
+        if lang is not None:
+            return lang
+        i = bisect_left(self._ids, telegram_id)
+        if i < len(self._ids) and self._ids[i] == telegram_id:
+            return self._lang_codes[self._langs[i]]
+        return None
+
+    def add(self, telegram_id: int, country: str):
+        """Отмечает пользователя зарегистрированным (после успешного save_user)."""
+        self._added[telegram_id] = get_user_language(country)
+
+    def memory_bytes(self) -> int:
+        """Память под массивы индекса (без небольшого словаря новых регистраций)."""
+        return self._ids.itemsize * len(self._ids) + self._langs.itemsize * len(self._langs)
+
+    def export(self) -> tuple[array, array, list, dict] | None:
+        """Состояние для снимка кешей. Массивы после загрузки не изменяются, поэтому копия не нужна."""
+        if not self.loaded:
+            return None
+        return self._ids, self._langs, list(self._lang_codes), dict(self._added)
+
+    def restore(self, ids: array, langs: array, lang_codes: list, added: dict):
+        """Принимает индекс из снимка; до первого перечитывания из БД он может отставать."""
+        self._ids, self._langs, self._lang_codes = ids, langs, lang_codes
+        self._added.update(added)
+        self.loaded = True
+
+    def _load(self) -> tuple[array, array, list] | None:
+        ids, langs, codes, positions = array("q"), array("B"), [], {}
+
+        def consume(rows):
+            for telegram_id, country in rows:
+                lang = get_user_language(country)
+                position = positions.get(lang)
+                if position is None:
+                    position = positions[lang] = len(codes)
+                    codes.append(lang)
+                ids.append(telegram_id)
+                langs.append(position)
+
+        return (ids, langs, codes) if stream_registered(consume) else None
+
+    async def refresh(self):
+        """Перечитывает индекс из БД; регистрации, сделанные во время чтения, сохраняются."""
+        added_before = set(self._added)
+        loaded = await asyncio.to_thread(self._load)
+        if loaded is None:
+            logger.error("Не удалось загрузить индекс регистраций, /start проверяет БД")
+            return
+        self._ids, self._langs, self._lang_codes = loaded
+        # Добавленные до начала чтения уже есть в выборке, добавленные во время — могли не попасть
+        for telegram_id in added_before:
+            self._added.pop(telegram_id, None)
+        self.loaded = True
+        metrics.inc("registered_index.refreshes")
+        per_million = self.memory_bytes() / max(len(self._ids), 1) * 1_000_000 / 2**20
+        logger.info(
+            f"Индекс регистраций: {len(self._ids)} ID, {self.memory_bytes() / 2**20:.1f} МБ "
+            f"({per_million:.1f} МБ на миллион)"
+        )
+
+    async def _run(self, refresh_first: bool = False):
+        while True:
+            if not refresh_first:
+                await asyncio.sleep(self.refresh_interval)
+            refresh_first = False
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Ошибка обновления индекса регистраций: {e}")
+
+registered_index = RegisteredIndex(REGISTERED_INDEX_REFRESH_MINUTES)
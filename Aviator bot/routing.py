@@ -0,0 +1,35 @@
+import inspect
+import logging
+from aiogram import F, Router, types
+
+logger = logging.getLogger(__name__)
+
+class CallbackRegistry:
+    """Обработчики inline-кнопок по точному значению callback_data.
+
+    Вместо цепочки фильтров вида lambda c: c.data == "..." роутер получает один
+    обработчик, который находит нужную функцию поиском в словаре, поэтому
+    стоимость маршрутизации не растет с числом кнопок.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+
+    def __call__(self, data: str):
+        """Декоратор: регистрирует обработчик для callback_data == data."""
+        def decorator(handler):
+            params = inspect.signature(handler).parameters
+            accepted = None if any(p.kind is p.VAR_KEYWORD for p in params.values()) else set(list(params)[1:])
+            self._handlers[data] = (handler, accepted)
+            return handler
+        return decorator
+
+    def attach(self, router: Router):
+        """Подключает реестр к роутеру одним обработчиком callback_query."""
+        router.callback_query.register(self._dispatch, F.data.in_(self._handlers))
+
+    async def _dispatch(self, callback: types.CallbackQuery, **data):
+        handler, accepted = self._handlers[callback.data]
+        if accepted is not None:
+            data = {name: value for name, value in data.items() if name in accepted}
+        return await handler(callback, **data)
@@ -0,0 +1,49 @@
+import json
+import asyncio
+import logging
+from config import RUNTIME_PROFILE
+
+logger = logging.getLogger(__name__)
+
+# Профиль "fast": event loop uvloop и JSON через orjson. Недостающий пакет заменяется стандартным
+# вариантом, поэтому профиль можно включать и там, где пакеты не установлены
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+FAST = RUNTIME_PROFILE == "fast"
+USE_ORJSON = FAST and orjson is not None
+USE_UVLOOP = FAST and uvloop is not None
+
+if USE_ORJSON:
+    def json_loads(data: str | bytes):
+        return orjson.loads(data)
+
+    def json_dumps(obj) -> str:
+        # aiogram ожидает str; NON_STR_KEYS — как json.dumps со словарями с int-ключами
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+else:
+    json_loads = json.loads
+    json_dumps = json.dumps
+
+def describe() -> str:
+    return (
+        f"профиль {RUNTIME_PROFILE}: event loop {'uvloop' if USE_UVLOOP else 'asyncio'}, "
+        f"JSON {'orjson' if USE_ORJSON else 'json'}"
+    )
+
+def run(main):
+    """Запускает корутину main в event loop выбранного профиля."""
+    if FAST and not (USE_UVLOOP and USE_ORJSON):
+        missing = [name for name, module in (("uvloop", uvloop), ("orjson", orjson)) if module is None]
+        logger.warning(f"RUNTIME_PROFILE=fast, но не установлены: {', '.join(missing)} — используется стандартная реализация")
+    logger.info(f"Среда выполнения: {describe()}")
+    if USE_UVLOOP:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return asyncio.run(main)
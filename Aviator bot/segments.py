@@ -0,0 +1,201 @@
+import json
+import time
+import shlex
+import asyncio
+import logging
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from config import DB_BACKEND, SEGMENT_PAGE_SIZE, SEGMENT_STATS_TTL_SECONDS
+from database import get_segment_counts, get_segment_page
+from languages import COUNTRY_TO_LANG, get_user_language
+from reachability import ACTIVE, BLOCKED, DEACTIVATED
+
+logger = logging.getLogger(__name__)
+
+STATUSES = (ACTIVE, BLOCKED, DEACTIVATED)
+# Язык пользователей из стран, которых нет в COUNTRY_TO_LANG
+DEFAULT_LANG = get_user_language(None)
+
+SEGMENT_HELP = (
+    "Сегмент: /broadcast <страна> или набор условий\n"
+    "  country=Russia,Spain — страны (с пробелами в кавычках: country=\"United States\")\n"
+    "  lang=ru,es — языки по COUNTRY_TO_LANG\n"
+    "  since=2025-01-01 until=2025-06-30 — дата регистрации (включительно)\n"
+    "  status=active|blocked|deactivated|all — доступность (по умолчанию active)"
+)
+
+class Segment:
+    """Аудитория рассылки: пересечение условий по стране, языку, дате регистрации и доступности."""
+    __slots__ = ("countries", "languages", "since", "until", "statuses")
+
+    def __init__(self, countries=(), languages=(), since: date | None = None, until: date | None = None, statuses=(ACTIVE,)):
+        self.countries = tuple(countries)
+        self.languages = tuple(languages)
+        self.since = since
+        self.until = until
+        self.statuses = tuple(statuses)
+
+    def describe(self) -> str:
+        parts = []
+        if self.countries:
+            parts.append("страны: " + ", ".join(self.countries))
+        if self.languages:
+            parts.append("языки: " + ", ".join(self.languages))
+        if self.since or self.until:
+            parts.append(f"регистрация: {self.since or '…'} — {self.until or '…'}")
+        parts.append("статус: " + (", ".join(self.statuses) if self.statuses else "все"))
+        return "; ".join(parts)
+
+    def matches(self, country: str | None, status: str, day: date | None) -> bool:
+        """То же условие, что и compile_segment, для строки агрегатов (страна, статус, день регистрации)."""
+        if self.countries and country not in self.countries:
+            return False
+        if self.languages and get_user_language(country) not in self.languages:
+            return False
+        if self.statuses and status not in self.statuses:
+            return False
+        if self.since and (day is None or day < self.since):
+            return False
+        if self.until and (day is None or day > self.until):
+            return False
+        return True
+
+def parse_segment(text: str) -> Segment:
+    """Разбирает выражение сегмента; текст без «=» — одна страна (прежний синтаксис /broadcast <country>).
+
+    Бросает ValueError с понятным администратору сообщением.
+    """
+    text = text.strip()
+    if "=" not in text:
+        return Segment(countries=[text])
+    options = {}
+    try:
+        tokens = shlex.split(text)
+    except ValueError as e:
+        raise ValueError(f"Не удалось разобрать условия: {e}")
+    for token in tokens:
+        key, sep, value = token.partition("=")
+        if not sep or not value:
+            raise ValueError(f"Ожидалось условие вида ключ=значение: {token}")
+        options[key.lower()] = [item.strip() for item in value.split(",") if item.strip()]
+    unknown = set(options) - {"country", "lang", "since", "until", "status"}
+    if unknown:
+        raise ValueError(f"Неизвестные условия: {', '.join(sorted(unknown))}")
+    try:
+        since = date.fromisoformat(options["since"][0]) if "since" in options else None
+        until = date.fromisoformat(options["until"][0]) if "until" in options else None
+    except ValueError:
+        raise ValueError("Дата должна быть в формате ГГГГ-ММ-ДД")
+    if since and until and since > until:
+        raise ValueError("since позже until")
+    statuses = [status.lower() for status in options.get("status", [ACTIVE])]
+    if statuses == ["all"]:
+        statuses = []
+    elif set(statuses) - set(STATUSES):
+        raise ValueError(f"Статус: {', '.join(STATUSES)} или all")
+    languages = [lang.lower() for lang in options.get("lang", [])]
+    known_languages = set(COUNTRY_TO_LANG.values()) | {DEFAULT_LANG}
+    if set(languages) - known_languages:
+        raise ValueError(f"Известные языки: {', '.join(sorted(known_languages))}")
+    return Segment(options.get("country", []), languages, since, until, statuses)
+
+def compile_segment(segment: Segment, dialect: str = DB_BACKEND) -> tuple[str, list]:
+    """Условие WHERE и параметры для Postgres (%s, ANY) или SQLite (?, json_each)."""
+    if dialect == "sqlite":
+        placeholder = "?"
+        def in_list(column, values):
+            return f"{column} IN (SELECT value FROM json_each(?))", [json.dumps(list(values))]
+        def day_param(day):
+            return datetime.combine(day, dt_time.min, timezone.utc).isoformat()
+    else:
+        placeholder = "%s"
+        def in_list(column, values):
+            return f"{column} = ANY(%s)", [list(values)]
+        def day_param(day):
+            return datetime.combine(day, dt_time.min, timezone.utc)
+
+    conditions, params = [], []
+    countries = list(segment.countries)
+    if segment.languages:
+        if countries:
+            # Язык сужает явный список стран
+            countries = [country for country in countries if get_user_language(country) in segment.languages]
+            if not countries:
+                return "FALSE", []
+        elif DEFAULT_LANG in segment.languages:
+            # Язык по умолчанию — все страны, кроме явно сопоставленных другим языкам
+            excluded = [country for country, lang in COUNTRY_TO_LANG.items() if lang not in segment.languages]
+            sql, values = in_list("country", excluded)
+            conditions.append(f"(country IS NULL OR NOT {sql})")
+            params += values
+        else:
+            countries = [country for country, lang in COUNTRY_TO_LANG.items() if lang in segment.languages]
+    if countries:
+        sql, values = in_list("country", countries)
+        conditions.append(sql)
+        params += values
+    if segment.statuses:
+        sql, values = in_list("status", segment.statuses)
+        conditions.append(sql)
+        params += values
+    if segment.since:
+        conditions.append(f"registered_at >= {placeholder}")
+        params.append(day_param(segment.since))
+    if segment.until:
+        conditions.append(f"registered_at < {placeholder}")
+        params.append(day_param(segment.until + timedelta(days=1)))
+    if not conditions:
+        return "TRUE", []
+    return " AND ".join(conditions), params
+
+class SegmentStats:
+    """Кеш агрегатов users по (страна, статус, день регистрации) для мгновенного предпросмотра размера сегмента."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._rows = []
+        self._loaded_at = None
+        self._lock = asyncio.Lock()
+
+    async def rows(self) -> list[tuple]:
+        async with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+                rows = await asyncio.to_thread(get_segment_counts)
+                if rows is not None:
+                    self._rows, self._loaded_at = rows, time.monotonic()
+            return self._rows
+
+    async def countries(self) -> list[str]:
+        return sorted({country for country, _, _, _ in await self.rows() if country and country != "Unknown"})
+
+    async def preview(self, segment: Segment) -> int:
+        return sum(count for country, status, day, count in await self.rows() if segment.matches(country, status, day))
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def export(self) -> tuple[list[tuple], float] | None:
+        """Агрегаты и их возраст в секундах для снимка кешей."""
+        if self._loaded_at is None:
+            return None
+        return self._rows, time.monotonic() - self._loaded_at
+
+    def restore(self, rows: list[tuple], age: float):
+        """Принимает агрегаты из снимка с их возрастом: устаревают в тот же срок, что и загруженные из БД."""
+        if age < self.ttl:
+            self._rows, self._loaded_at = rows, time.monotonic() - age
+
+segment_stats = SegmentStats(SEGMENT_STATS_TTL_SECONDS)
+
+async def iter_segment(segment: Segment, page_size: int = SEGMENT_PAGE_SIZE):
+    """Асинхронно выдает telegram_id сегмента страницами по возрастанию ID (keyset-пагинация по первичному ключу)."""
+    where, params = compile_segment(segment)
+    after = 0
+    while True:
+        page = await asyncio.to_thread(get_segment_page, where, params, after, page_size)
+        if page is None:
+            raise RuntimeError(f"Не удалось прочитать сегмент после telegram_id={after}")
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        after = page[-1]
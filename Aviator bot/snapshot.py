@@ -0,0 +1,227 @@
+import os
+import sys
+import mmap
+import time
+import zlib
+import struct
+import asyncio
+import logging
+from array import array
+from datetime import date
+from config import BOT_TOKEN, WARM_SNAPSHOT_PATH, WARM_SNAPSHOT_INTERVAL_MINUTES, WARM_SNAPSHOT_MAX_AGE_MINUTES
+from runtime import json_loads, json_dumps
+from languages import export_catalogs, restore_catalogs
+from delivery import assets
+from registered_index import registered_index
+from segments import segment_stats
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Формат файла: заголовок, таблица секций, данные секций. CRC32 покрывает все после заголовка.
+# При любом изменении содержимого секций SNAPSHOT_VERSION увеличивается — старые снимки отбрасываются
+SNAPSHOT_MAGIC = b"AVSNAP"
+SNAPSHOT_VERSION = 1
+_HEADER = struct.Struct("<6sHHIQd")  # магия, версия, число секций, CRC32, длина после заголовка, время записи
+_SECTION = struct.Struct("<16sQQ")  # имя, смещение от начала файла, длина
+
+class WarmSnapshot:
+    """Снимок прогреваемых кешей процесса для теплого перезапуска.
+
+    Сохраняет file_id GIF (AssetCache), разобранные каталоги языков, индекс
+    регистраций и агрегаты сегментов. Файл пишется атомарно (временный файл и
+    os.replace) раз в interval минут и при остановке. При запуске файл
+    отображается в память, проверяются магия, версия, длина, CRC32 и возраст;
+    каждый кеш дополнительно сверяет свои данные (mtime файлов, токен бота).
+    Непрошедший проверку снимок игнорируется — бот стартует холодным.
+    """
+
+    def __init__(self, path: str, interval_minutes: float, max_age_minutes: float):
+        self.path = path
+        self.interval = interval_minutes * 60
+        self.max_age = max_age_minutes * 60
+        self._task = None
+
+    def restore(self) -> bool:
+        """Читает снимок и раскладывает его по кешам; False — снимка нет или он отброшен."""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        started = time.perf_counter()
+        try:
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                sections, age = self._read(mapped)
+                if sections is None:
+                    return False
+                restored = self._apply(mapped, sections, age)
+        except Exception as e:
+            logger.warning(f"Снимок кешей {self.path} не прочитан: {e}")
+            metrics.inc("snapshot.rejected")
+            return False
+        metrics.inc("snapshot.restored")
+        logger.info(
+            f"Снимок кешей восстановлен за {(time.perf_counter() - started) * 1000:.0f} мс "
+            f"(возраст {age / 60:.1f} мин): {', '.join(f'{name}={count}' for name, count in restored.items())}"
+        )
+        return True
+
+    def _read(self, mapped) -> tuple[dict | None, float]:
+        """Проверяет файл и возвращает секции (имя -> смещение и длина) и возраст снимка."""
+        if len(mapped) < _HEADER.size:
+            return self._reject("файл короче заголовка")
+        magic, version, count, crc, length, created_at = _HEADER.unpack_from(mapped)
+        if magic != SNAPSHOT_MAGIC:
+            return self._reject("неизвестный формат")
+        if version != SNAPSHOT_VERSION:
+            return self._reject(f"версия {version}, ожидается {SNAPSHOT_VERSION}")
+        if len(mapped) != _HEADER.size + length:
+            return self._reject("длина не совпадает с заголовком (файл обрезан)")
+        age = time.time() - created_at
+        if not 0 <= age <= self.max_age:
+            return self._reject(f"возраст {age / 60:.0f} мин вне допустимого ({self.max_age / 60:.0f} мин)")
+        # CRC считается прямо по отображению, без чтения файла в память процесса
+        with memoryview(mapped) as view:
+            if zlib.crc32(view[_HEADER.size:]) != crc:
+                return self._reject("CRC32 не совпадает")
+        if _HEADER.size + count * _SECTION.size > len(mapped):
+            return self._reject("таблица секций за пределами файла")
+        sections = {}
+        for i in range(count):
+            name, offset, size = _SECTION.unpack_from(mapped, _HEADER.size + i * _SECTION.size)
+            if offset + size > len(mapped):
+                return self._reject(f"секция {name!r} за пределами файла")
+            sections[name.rstrip(b"\0").decode()] = (offset, size)
+        return sections, age
+
+    def _reject(self, reason: str) -> tuple[None, float]:
+        logger.warning(f"Снимок кешей {self.path} отброшен: {reason}")
+        metrics.inc("snapshot.rejected")
+        return None, 0.0
+
+    def _apply(self, mapped, sections: dict, age: float) -> dict:
+        def load(name: str):
+            offset, size = sections[name]
+            return json_loads(mapped[offset:offset + size])
+
+        def load_array(name: str, typecode: str) -> array:
+            offset, size = sections[name]
+            result = array(typecode)
+            # Срез memoryview освобождается сразу, иначе mmap нельзя будет закрыть
+            with memoryview(mapped) as view:
+                result.frombytes(view[offset:offset + size])
+            return result
+
+        meta = load("meta")
+        restored = {}
+        if meta["bot_id"] == _bot_id():
+            # file_id действительны только для того бота, который их получил
+            restored["assets"] = assets.restore(load("assets"))
+        restored["languages"] = restore_catalogs(load("languages"))
+        if "registered_ids" in sections:
+            ids = load_array("registered_ids", "q")
+            langs = load_array("registered_langs", "B")
+            if meta["byteorder"] != sys.byteorder:
+                ids.byteswap()
+            codes = meta["lang_codes"]
+            if len(ids) != len(langs) or (langs and max(langs) >= len(codes)):
+                raise ValueError("индекс регистраций не согласован")
+            added = {int(telegram_id): lang for telegram_id, lang in load("registered_added").items()}
+            registered_index.restore(ids, langs, codes, added)
+            restored["registered"] = len(registered_index)
+        if "segment_stats" in sections:
+            stats = load("segment_stats")
+            rows = [
+                (country, status, date.fromisoformat(day) if day else None, count)
+                for country, status, day, count in stats["rows"]
+            ]
+            segment_stats.restore(rows, stats["age"] + age)
+            restored["segment_rows"] = len(rows)
+        return restored
+
+    def _collect(self) -> dict:
+        """Собирает состояние кешей (в потоке event loop, без тяжелых копий)."""
+        meta = {"bot_id": _bot_id(), "byteorder": sys.byteorder, "lang_codes": []}
+        sections = {
+            "assets": json_dumps(assets.export()),
+            "languages": json_dumps(export_catalogs()),
+        }
+        index = registered_index.export()
+        if index:
+            ids, langs, meta["lang_codes"], added = index
+            # Массивы сериализуются уже в потоке записи
+            sections["registered_ids"] = ids
+            sections["registered_langs"] = langs
+            sections["registered_added"] = json_dumps({str(telegram_id): lang for telegram_id, lang in added.items()})
+        stats = segment_stats.export()
+        if stats:
+            rows, stats_age = stats
+            sections["segment_stats"] = json_dumps({
+                "age": stats_age,
+                "rows": [[country, status, day.isoformat() if day else None, count] for country, status, day, count in rows],
+            })
+        sections["meta"] = json_dumps(meta)
+        return sections
+
+    def _write(self, sections: dict) -> int:
+        """Пишет снимок во временный файл и атомарно подменяет прежний; возвращает размер файла."""
+        payloads = []
+        for name, data in sections.items():
+            if isinstance(data, array):
+                data = data.tobytes()
+            elif isinstance(data, str):
+                data = data.encode()
+            payloads.append((name, data))
+        table_end = _HEADER.size + _SECTION.size * len(payloads)
+        table, offset = [], table_end
+        for name, data in payloads:
+            table.append(_SECTION.pack(name.encode(), offset, len(data)))
+            offset += len(data)
+        body = [*table, *(data for _, data in payloads)]
+        crc = 0
+        for chunk in body:
+            crc = zlib.crc32(chunk, crc)
+        header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(payloads), crc, offset - _HEADER.size, time.time())
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(header)
+            for chunk in body:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        return offset
+
+    async def save(self) -> bool:
+        if not self.path:
+            return False
+        started = time.perf_counter()
+        try:
+            size = await asyncio.to_thread(self._write, self._collect())
+        except Exception as e:
+            logger.error(f"Ошибка записи снимка кешей {self.path}: {e}")
+            return False
+        metrics.inc("snapshot.saves")
+        logger.info(f"Снимок кешей записан: {size / 2**20:.1f} МБ за {(time.perf_counter() - started) * 1000:.0f} мс")
+        return True
+
+    async def start(self):
+        """Запускает периодическую запись снимка."""
+        if self.path:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает периодическую запись и сохраняет финальный снимок."""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            await self.save()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.save()
+
+def _bot_id() -> str:
+    return (BOT_TOKEN or "").split(":", 1)[0]
+
+warm_snapshot = WarmSnapshot(WARM_SNAPSHOT_PATH, WARM_SNAPSHOT_INTERVAL_MINUTES, WARM_SNAPSHOT_MAX_AGE_MINUTES)
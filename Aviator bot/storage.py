@@ -0,0 +1,51 @@
+from typing import Protocol
+from datetime import datetime
+
+# Функции хранилища, которые экспортирует database.py для остального кода бота
+STORAGE_API = (
+    "save_user", "get_user", "get_users", "get_all_users", "stream_users",
+    "stream_registered", "get_segment_counts", "get_segment_page", "find_users",
+    "save_deliveries", "claim_deliveries", "release_deliveries", "prune_deliveries", "get_delivery_keys", "get_deliveries",
+    "get_unreachable_users", "update_reachability",
+)
+
+class Storage(Protocol):
+    """Интерфейс хранилища пользователей и журнала доставок.
+
+    Пользователь — кортеж (telegram_id, username, phone, country). Реализации:
+    Postgres (функции database.py) и встроенный SQLite (storage_sqlite.SQLiteStorage).
+    """
+
+    def save_user(self, telegram_id: int, username: str, phone: str, country: str) -> bool: ...
+
+    def get_user(self, telegram_id: int, read_only: bool = ...) -> tuple | None: ...
+
+    def get_users(self, ids, batch_size: int = ...) -> dict[int, tuple]: ...
+
+    def get_all_users(self) -> list[tuple]: ...
+
+    def stream_users(self, consume, chunk_size: int = ...) -> bool: ...
+
+    def stream_registered(self, consume, chunk_size: int = ...) -> bool: ...
+
+    def get_segment_counts(self) -> list[tuple] | None: ...
+
+    def get_segment_page(self, where: str, params: list, after_id: int, limit: int) -> list[int] | None: ...
+
+    def find_users(self, ids, usernames, ranges, limit: int) -> list[tuple]: ...
+
+    def save_deliveries(self, rows) -> bool: ...
+
+    def claim_deliveries(self, kind: str, claims) -> set[str] | None: ...
+
+    def release_deliveries(self, keys) -> bool: ...
+
+    def prune_deliveries(self, before: datetime, batch_size: int = ...) -> int: ...
+
+    def get_delivery_keys(self, since: datetime) -> list[tuple[str, datetime]]: ...
+
+    def get_deliveries(self, recipient: int, limit: int = 10) -> list[tuple]: ...
+
+    def get_unreachable_users(self) -> list[tuple]: ...
+
+    def update_reachability(self, rows) -> bool: ...
@@ -0,0 +1,344 @@
+import json
+import queue
+import sqlite3
+import logging
+import threading
+from concurrent.futures import Future
+from datetime import date, datetime, timezone
+from config import DB_BATCH_SIZE
+from tracing import traced
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    telegram_id INTEGER PRIMARY KEY,
+    username TEXT,
+    phone TEXT,
+    country TEXT,
+    status TEXT NOT NULL DEFAULT 'active',
+    last_error_at TEXT,
+    registered_at TEXT
+);
+CREATE INDEX IF NOT EXISTS users_username_idx ON users (lower(username));
+CREATE TABLE IF NOT EXISTS deliveries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    asset TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    idempotency_key TEXT UNIQUE,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deliveries_recipient_idx ON deliveries (recipient, created_at DESC);
+CREATE INDEX IF NOT EXISTS deliveries_created_idx ON deliveries (created_at);
+"""
+
+# Индексы по колонкам, добавленным в уже существующие базы
+INDEXES = """
+CREATE INDEX IF NOT EXISTS users_segment_idx ON users (country, status, registered_at);
+"""
+
+USER_COLUMNS = "telegram_id, username, phone, country"
+
+def _timestamp(value: datetime | None) -> str | None:
+    return value.astimezone(timezone.utc).isoformat() if value else None
+
+def _datetime(value: str | None) -> datetime | None:
+    return datetime.fromisoformat(value) if value else None
+
+class SQLiteStorage:
+    """Встроенное хранилище на SQLite в режиме WAL.
+
+    Чтения идут через соединения, по одному на поток (WAL позволяет читать
+    параллельно с записью), а все записи выполняет один поток-писатель, поэтому
+    блокировок записи SQLite не возникает. SQL-тексты постоянные, и sqlite3
+    переиспользует подготовленные выражения из кеша соединения.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = queue.Queue()
+        writer = self._connect()
+        writer.executescript(SCHEMA)
+        if "registered_at" not in {row[1] for row in writer.execute("PRAGMA table_info(users)")}:
+            writer.execute("ALTER TABLE users ADD COLUMN registered_at TEXT")
+        writer.executescript(INDEXES)
+        threading.Thread(target=self._writer, args=(writer,), name="sqlite-writer", daemon=True).start()
+        logger.info(f"SQLite storage ready: {path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _writer(self, conn: sqlite3.Connection):
+        while True:
+            fn, future = self._writes.get()
+            try:
+                with conn:
+                    result = fn(conn)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def _write(self, fn):
+        """Выполняет fn(conn) в потоке-писателе в отдельной транзакции и возвращает результат."""
+        future = Future()
+        self._writes.put((fn, future))
+        return future.result()
+
+    @traced("db.save_user")
+    def save_user(self, telegram_id, username, phone, country):
+        """Сохраняет пользователя в базу данных."""
+        try:
+            registered_at = _timestamp(datetime.now(timezone.utc))
+            saved = self._write(lambda conn: conn.execute(
+                "INSERT OR IGNORE INTO users (telegram_id, username, phone, country, registered_at) VALUES (?, ?, ?, ?, ?)",
+                (telegram_id, username, phone, country, registered_at)
+            ).rowcount > 0)
+            logger.info(f"User {telegram_id} saved: {saved}")
+            return saved
+        except Exception as e:
+            logger.error(f"Save error for user_id={telegram_id}: {e}")
+            return False
+
+    @traced("db.get_user")
+    def get_user(self, telegram_id, read_only=True):
+        """Получает данные пользователя по telegram_id.
+
+        read_only — для совместимости с Postgres: реплик нет, читатели видят все зафиксированные записи.
+        """
+        try:
+            return self._reader().execute(
+                f"SELECT {USER_COLUMNS} FROM users WHERE telegram_id = ?", (telegram_id,)
+            ).fetchone()
+        except Exception as e:
+            logger.error(f"Fetch error for user_id={telegram_id}: {e}")
+            return None
+
+    @traced("db.get_users")
+    def get_users(self, ids, batch_size=DB_BATCH_SIZE):
+        """Получает пользователей по списку telegram_id пачками, результат — словарь по ID."""
+        ids = list(dict.fromkeys(int(user_id) for user_id in ids))
+        try:
+            conn = self._reader()
+            users = {}
+            for start in range(0, len(ids), batch_size):
+                rows = conn.execute(
+                    f"SELECT {USER_COLUMNS} FROM users WHERE telegram_id IN (SELECT value FROM json_each(?))",
+                    (json.dumps(ids[start:start + batch_size]),)
+                )
+                users.update((row[0], row) for row in rows)
+            return users
+        except Exception as e:
+            logger.error(f"Users batch fetch error: {e}")
+            return {}
+
+    @traced("db.get_all_users")
+    def get_all_users(self):
+        """Получает список всех пользователей."""
+        try:
+            return self._reader().execute(f"SELECT {USER_COLUMNS} FROM users").fetchall()
+        except Exception as e:
+            logger.error(f"Users fetch error: {e}")
+            return []
+
+    @traced("db.stream_users")
+    def stream_users(self, consume, chunk_size=DB_BATCH_SIZE * 10):
+        """Передает всех пользователей по возрастанию ID в consume(rows) пачками."""
+        try:
+            cur = self._reader().execute(f"SELECT {USER_COLUMNS} FROM users ORDER BY telegram_id")
+            while rows := cur.fetchmany(chunk_size):
+                consume(rows)
+            return True
+        except Exception as e:
+            logger.error(f"Users stream error: {e}")
+            return False
+
+    @traced("db.stream_registered")
+    def stream_registered(self, consume, chunk_size=DB_BATCH_SIZE * 10):
+        """Передает (telegram_id, country) всех пользователей по возрастанию ID в consume(rows) пачками."""
+        try:
+            cur = self._reader().execute("SELECT telegram_id, country FROM users ORDER BY telegram_id")
+            while rows := cur.fetchmany(chunk_size):
+                consume(rows)
+            return True
+        except Exception as e:
+            logger.error(f"Registered users stream error: {e}")
+            return False
+
+    @traced("db.get_segment_counts")
+    def get_segment_counts(self):
+        """Агрегаты для предпросмотра сегментов: (country, status, день регистрации по UTC, количество)."""
+        try:
+            rows = self._reader().execute(
+                "SELECT country, status, date(registered_at) AS day, count(*) FROM users GROUP BY country, status, day"
+            )
+            return [(country, status, date.fromisoformat(day) if day else None, count) for country, status, day, count in rows]
+        except Exception as e:
+            logger.error(f"Segment counts fetch error: {e}")
+            return None
+
+    @traced("db.get_segment_page")
+    def get_segment_page(self, where, params, after_id, limit):
+        """Страница telegram_id сегмента (условие из segments.compile_segment) с ID больше after_id."""
+        try:
+            rows = self._reader().execute(
+                f"SELECT telegram_id FROM users WHERE telegram_id > ? AND ({where}) ORDER BY telegram_id LIMIT ?",
+                [after_id, *params, limit]
+            )
+            return [row[0] for row in rows]
+        except Exception as e:
+            logger.error(f"Segment page fetch error after_id={after_id}: {e}")
+            return None
+
+    @traced("db.find_users")
+    def find_users(self, ids, usernames, ranges, limit):
+        """Находит не больше limit пользователей по списку ID, username и диапазонам ID одним запросом."""
+        if not ids and not usernames and not ranges:
+            return []
+        conditions = [
+            "telegram_id IN (SELECT value FROM json_each(?))",
+            "lower(username) IN (SELECT value FROM json_each(?))",
+        ]
+        params = [json.dumps(list(ids)), json.dumps([username.lower() for username in usernames])]
+        for start, end in ranges:
+            conditions.append("telegram_id BETWEEN ? AND ?")
+            params.extend((start, end))
+        try:
+            return self._reader().execute(
+                f"SELECT {USER_COLUMNS} FROM users WHERE {' OR '.join(conditions)} LIMIT ?", [*params, limit]
+            ).fetchall()
+        except Exception as e:
+            logger.error(f"Users resolve error: {e}")
+            return []
+
+    @traced("db.save_deliveries")
+    def save_deliveries(self, rows):
+        """Пачкой записывает строки журнала доставок; строка с зарезервированным ключом обновляет резерв."""
+        rows = [(*row[:6], _timestamp(row[6])) for row in rows]
+        try:
+            self._write(lambda conn: conn.executemany(
+                "INSERT INTO deliveries "
+                "(recipient, kind, asset, status, error, idempotency_key, created_at) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (idempotency_key) DO UPDATE SET "
+                "asset = excluded.asset, status = excluded.status, error = excluded.error, created_at = excluded.created_at",
+                rows
+            ))
+            return True
+        except Exception as e:
+            logger.error(f"Deliveries save error: {e}")
+            return False
+
+    @traced("db.claim_deliveries")
+    def claim_deliveries(self, kind, claims):
+        """Резервирует ключи идемпотентности строками pending; возвращает зарезервированные сейчас ключи."""
+        created_at = _timestamp(datetime.now(timezone.utc))
+        try:
+            return self._write(lambda conn: {row[0] for row in conn.execute(
+                "INSERT OR IGNORE INTO deliveries (recipient, kind, status, idempotency_key, created_at) "
+                "SELECT json_extract(value, '$[0]'), ?, 'pending', json_extract(value, '$[1]'), ? FROM json_each(?) "
+                "RETURNING idempotency_key",
+                (kind, created_at, json.dumps(list(claims)))
+            )})
+        except Exception as e:
+            logger.error(f"Deliveries claim error: {e}")
+            return None
+
+    @traced("db.release_deliveries")
+    def release_deliveries(self, keys):
+        """Снимает резерв pending с ключей неудачных доставок."""
+        try:
+            self._write(lambda conn: conn.execute(
+                "DELETE FROM deliveries WHERE idempotency_key IN (SELECT value FROM json_each(?)) AND status = 'pending'",
+                (json.dumps(list(keys)),)
+            ))
+            return True
+        except Exception as e:
+            logger.error(f"Deliveries release error: {e}")
+            return False
+
+    @traced("db.prune_deliveries")
+    def prune_deliveries(self, before, batch_size=10000):
+        """Удаляет записи журнала доставок старше before пачками; возвращает число удаленных."""
+        deleted = 0
+        try:
+            while True:
+                count = self._write(lambda conn: conn.execute(
+                    "DELETE FROM deliveries WHERE id IN "
+                    "(SELECT id FROM deliveries WHERE created_at < ? ORDER BY created_at LIMIT ?)",
+                    (_timestamp(before), batch_size)
+                ).rowcount)
+                deleted += count
+                if count < batch_size:
+                    return deleted
+        except Exception as e:
+            logger.error(f"Deliveries prune error: {e}")
+            return deleted
+
+    @traced("db.get_delivery_keys")
+    def get_delivery_keys(self, since):
+        """Возвращает ключи идемпотентности успешных доставок начиная с момента since."""
+        try:
+            rows = self._reader().execute(
+                "SELECT idempotency_key, created_at FROM deliveries "
+                "WHERE created_at >= ? AND idempotency_key IS NOT NULL AND kind <> 'broadcast' AND status = 'sent' "
+                "ORDER BY created_at",
+                (_timestamp(since),)
+            )
+            return [(key, _datetime(created_at)) for key, created_at in rows]
+        except Exception as e:
+            logger.error(f"Delivery keys fetch error: {e}")
+            return []
+
+    @traced("db.get_deliveries")
+    def get_deliveries(self, recipient, limit=10):
+        """Возвращает последние записи журнала доставок для пользователя."""
+        try:
+            rows = self._reader().execute(
+                "SELECT kind, asset, status, error, created_at FROM deliveries "
+                "WHERE recipient = ? ORDER BY created_at DESC LIMIT ?",
+                (recipient, limit)
+            )
+            return [(*row[:4], _datetime(row[4])) for row in rows]
+        except Exception as e:
+            logger.error(f"Deliveries fetch error for recipient={recipient}: {e}")
+            return []
+
+    @traced("db.get_unreachable_users")
+    def get_unreachable_users(self):
+        """Возвращает (telegram_id, status, last_error_at) всех недоступных пользователей."""
+        try:
+            rows = self._reader().execute(
+                "SELECT telegram_id, status, last_error_at FROM users WHERE status <> 'active'"
+            )
+            return [(telegram_id, status, _datetime(last_error_at)) for telegram_id, status, last_error_at in rows]
+        except Exception as e:
+            logger.error(f"Unreachable users fetch error: {e}")
+            return []
+
+    @traced("db.update_reachability")
+    def update_reachability(self, rows):
+        """Пачкой обновляет статус доступности: строки (telegram_id, status, last_error_at)."""
+        rows = [(status, _timestamp(last_error_at), telegram_id) for telegram_id, status, last_error_at in rows]
+        try:
+            self._write(lambda conn: conn.executemany(
+                "UPDATE users SET status = ?, last_error_at = COALESCE(?, last_error_at) WHERE telegram_id = ?",
+                rows
+            ))
+            return True
+        except Exception as e:
+            logger.error(f"Reachability update error: {e}")
+            return False
@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import functools
+import contextvars
+from contextlib import contextmanager
+import aiohttp
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from config import TRACE_EXPORT, TRACE_FILE, TRACE_OTLP_ENDPOINT, TRACE_SAMPLE_RATE, TRACE_SLOW_MS
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "aviator-bot"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    """Участок трассы: имя, время начала/конца, атрибуты, родитель."""
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, parent: "Span | None", attributes: dict):
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": {"stringValue": str(value)}} for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+class Tracer:
+    """Собирает спаны одной трассы (апдейта) и решает, экспортировать ли ее, когда закрывается корневой спан.
+
+    Сохраняются случайная доля sample_rate трасс, все трассы дольше slow_ms и все трассы с ошибкой.
+    """
+
+    def __init__(self, export: str, sample_rate: float, slow_ms: int):
+        self.enabled = bool(export)
+        self.export = export
+        self.sample_rate = sample_rate
+        self.slow_ns = slow_ms * 1_000_000
+        self._traces = {}
+        self._ready = []
+        self._task = None
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Открывает дочерний спан текущей трассы (или корневой, если трассы нет)."""
+        if not self.enabled:
+            yield None
+            return
+        parent = _current_span.get()
+        span = Span(name, parent, attributes)
+        if parent is None:
+            self._traces[span.trace_id] = []
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            self._finish(span)
+
+    @contextmanager
+    def attach(self, span: "Span | None"):
+        """Делает span текущим (для работы, выполняемой в другой задаче, например в воркере доставки)."""
+        token = _current_span.set(span)
+        try:
+            yield
+        finally:
+            _current_span.reset(token)
+
+    def current(self) -> "Span | None":
+        return _current_span.get()
+
+    def _finish(self, span: Span):
+        spans = self._traces.get(span.trace_id)
+        if spans is None:
+            # Трасса уже закрыта (спан из фоновой задачи, пережившей апдейт)
+            return
+        spans.append(span)
+        if span.parent_id is not None:
+            return
+        del self._traces[span.trace_id]
+        duration = span.end_ns - span.start_ns
+        if duration >= self.slow_ns or any(s.error for s in spans) or random.random() < self.sample_rate:
+            self._ready.append(spans)
+            metrics.inc("tracing.exported")
+        else:
+            metrics.inc("tracing.dropped")
+
+    async def start(self):
+        if self.enabled:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Трассировка включена: экспорт={self.export}, доля={self.sample_rate}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            await self.flush()
+
+    def _payload(self, traces: list) -> dict:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": [s.to_otlp() for spans in traces for s in spans]}],
+        }]}
+
+    async def flush(self):
+        """Экспортирует накопленные трассы в файл (JSON lines в формате OTLP) или в OTLP/HTTP."""
+        if not self._ready:
+            return
+        traces, self._ready = self._ready, []
+        payload = self._payload(traces)
+        if self.export == "otlp":
+            async with aiohttp.ClientSession() as session:
+                async with session.post(TRACE_OTLP_ENDPOINT, json=payload) as response:
+                    if response.status >= 300:
+                        logger.error(f"OTLP экспорт отклонен: HTTP {response.status}")
+        else:
+            line = json.dumps(payload, ensure_ascii=False) + "\n"
+            await asyncio.to_thread(_append, TRACE_FILE, line)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(1)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка экспорта трасс: {e}")
+
+def _append(path: str, line: str):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line)
+
+tracer = Tracer(TRACE_EXPORT, TRACE_SAMPLE_RATE, TRACE_SLOW_MS)
+
+def traced(name: str):
+    """Декоратор: каждый вызов синхронной функции — отдельный спан (для запросов к БД)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class UpdateTracingMiddleware(BaseMiddleware):
+    """Корневой спан на каждый апдейт."""
+
+    async def __call__(self, handler, event, data):
+        with tracer.span("update", update_id=event.update_id, type=event.event_type):
+            return await handler(event, data)
+
+class HandlerTracingMiddleware(BaseMiddleware):
+    """Спан выполнения конкретного обработчика."""
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "handler"
+        user = data.get("event_from_user")
+        with tracer.span(f"handler.{name}", user_id=user.id if user else None):
+            return await handler(event, data)
+
+class RequestTracingMiddleware(BaseRequestMiddleware):
+    """Спан каждого исходящего запроса к Bot API."""
+
+    async def __call__(self, make_request, bot, method):
+        with tracer.span(f"bot.{type(method).__name__}", chat_id=getattr(method, "chat_id", None)):
+            return await make_request(bot, method)
+
+def setup_tracing(dp, bot):
+    """Подключает middleware трассировки к диспетчеру и сессии бота."""
+    if not tracer.enabled:
+        return
+    dp.update.outer_middleware(UpdateTracingMiddleware())
+    dp.message.middleware(HandlerTracingMiddleware())
+    dp.callback_query.middleware(HandlerTracingMiddleware())
+    bot.session.middleware(RequestTracingMiddleware())
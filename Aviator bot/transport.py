@@ -0,0 +1,62 @@
+import logging
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer, PRODUCTION
+from aiogram.types import InputFile
+from runtime import json_loads, json_dumps
+from config import (
+    BOT_API_URL, BOT_API_LOCAL, HTTP_POOL_SIZE, HTTP_POOL_PER_HOST, HTTP_KEEPALIVE_SECONDS,
+    HTTP_DNS_TTL_SECONDS, HTTP_TIMEOUT_SECONDS, HTTP_UPLOAD_TIMEOUT_SECONDS, DELIVERY_WORKERS
+)
+
+logger = logging.getLogger(__name__)
+
+def _has_upload(method) -> bool:
+    """Есть ли в запросе загружаемый файл (в полях метода или в элементах медиагруппы)."""
+    for value in method.__dict__.values():
+        if isinstance(value, InputFile):
+            return True
+        if isinstance(value, list) and any(isinstance(getattr(item, "media", None), InputFile) for item in value):
+            return True
+    return False
+
+class TunedSession(AiohttpSession):
+    """Сессия Bot API с настраиваемым пулом соединений и раздельными таймаутами.
+
+    Обычные вызовы ограничены коротким таймаутом сессии, загрузки файлов — отдельным
+    upload_timeout. Явный request_timeout (long polling) имеет приоритет.
+    """
+
+    def __init__(self, pool_size: int, per_host: int, keepalive: float, dns_ttl: int,
+                 timeout: float, upload_timeout: float, api: TelegramAPIServer = PRODUCTION):
+        super().__init__(api=api, limit=pool_size, timeout=timeout, json_loads=json_loads, json_dumps=json_dumps)
+        self._connector_init.update(
+            limit_per_host=per_host,
+            keepalive_timeout=keepalive,
+            ttl_dns_cache=dns_ttl,
+        )
+        self.upload_timeout = upload_timeout
+
+    async def make_request(self, bot, method, timeout=None):
+        if timeout is None and _has_upload(method):
+            timeout = self.upload_timeout
+        return await super().make_request(bot, method, timeout=timeout)
+
+def create_session(pool_size: int = HTTP_POOL_SIZE, api_url: str = BOT_API_URL) -> TunedSession:
+    """Сессия для Bot(...) по настройкам из config; api_url — локальный Bot API сервер или заглушка."""
+    api = TelegramAPIServer.from_base(api_url, is_local=BOT_API_LOCAL) if api_url else PRODUCTION
+    workers = sum(DELIVERY_WORKERS.values())
+    if pool_size < workers:
+        logger.warning(f"HTTP_POOL_SIZE={pool_size} меньше числа воркеров доставки ({workers}): воркеры будут ждать соединений")
+    logger.info(
+        f"Bot API: {api_url or 'api.telegram.org'}, пул {pool_size} (на хост {HTTP_POOL_PER_HOST or 'без лимита'}), "
+        f"keep-alive {HTTP_KEEPALIVE_SECONDS}с, таймауты {HTTP_TIMEOUT_SECONDS}/{HTTP_UPLOAD_TIMEOUT_SECONDS}с"
+    )
+    return TunedSession(
+        pool_size=pool_size,
+        per_host=HTTP_POOL_PER_HOST,
+        keepalive=HTTP_KEEPALIVE_SECONDS,
+        dns_ttl=HTTP_DNS_TTL_SECONDS,
+        timeout=HTTP_TIMEOUT_SECONDS,
+        upload_timeout=HTTP_UPLOAD_TIMEOUT_SECONDS,
+        api=api,
+    )
@@ -1,78 +1,29 @@
-import json
-import os
+import html
+import asyncio
 import logging
-from aiogram import Dispatcher, types
-from aiogram.filters import CommandStart, BaseFilter
+from aiogram import Dispatcher, Router, F, types
+from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove
-from config import SECRET_PASSWORD, CHAT_ID
-from database import save_user, check_user_registration, get_user
+from config import SECRET_PASSWORD
+from database import save_user, get_user
 from phonenumbers import geocoder
 import phonenumbers
 from animations import loading_animation, fake_console_logs
+from routing import CallbackRegistry
+from languages import load_language_messages, get_user_language
+from delivery import delivery, REGISTRATION
+from reachability import reachability
+from notifier import admin_notifier
+from registered_index import registered_index
 
 logger = logging.getLogger(__name__)
 
-# Фильтр для исключения админского чата
-class NotAdminChatFilter(BaseFilter):
-    async def __call__(self, message: types.Message) -> bool:
-        return str(message.chat.id) != CHAT_ID
-
 class AuthState(StatesGroup):
     waiting_for_password = State()
     waiting_for_sync = State()
 
-# Маппинг стран на языки
-COUNTRY_TO_LANG = {
-    "Russia": "ru",
-    "United States": "en",
-    "United Kingdom": "en",
-    "Spain": "es",
-    # Добавьте другие страны и языки по необходимости
-}
-
-# Папка с JSON-переводами
-LANG_DIR = "lang"
-
-def load_language_messages(lang_code):
-    """Загружает сообщения из JSON для указанного языка, дефолт — английский."""
-    try:
-        file_path = os.path.join(LANG_DIR, f"{lang_code}.json")
-        if not os.path.exists(file_path):
-            logger.warning(f"Язык {lang_code} не найден, использую en")
-            file_path = os.path.join(LANG_DIR, "en.json")
-        with open(file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        logger.error(f"Ошибка загрузки языка {lang_code}: {e}")
-        return {
-            "welcome": "@{username}, you have successfully registered in Aviator Predictor! Contact the operator for further instructions.",
-            "final_welcome": "🎉 You have successfully registered in Aviator Bot!",
-            "already_registered": "🔍 You are already registered!",
-            "enter_password": "🔐 Enter password:",
-            "password_correct": "✅ Password correct! Synchronize your account:",
-            "password_incorrect": "❌ Wrong password. Try again:",
-            "sync": "🔄 Synchronize your account",
-            "total": [
-                "🎯 Here's your total!",
-                "🚀 Catch the moment!",
-                "✅ Your total is ready!",
-                "🔥 Total delivered!",
-                "💥 Check this out!",
-                "🌟 Your result is here!",
-                "⚡ Total incoming!",
-                "🎰 Ready for the total?",
-                "🏆 Here it comes!",
-                "🎉 Total for you!"
-            ],
-            "error": [
-                "🤖 Neural networks can make mistakes, it's okay!",
-                "⚠️ Something went wrong, try again!",
-                "📞 Contact support."
-            ]
-        }
-
 def get_country_name(phone_number):
     """Получает название страны по номеру телефона."""
     try:
@@ -84,41 +35,66 @@ def get_country_name(phone_number):
         logger.error(f"Ошибка определения страны для {phone_number}: {e}")
         return "Unknown"
 
-def get_user_language(country):
-    """Определяет язык пользователя на основе страны."""
-    return COUNTRY_TO_LANG.get(country, "en")
+# Выполняющиеся сценарии завершения регистрации (ссылки, чтобы задачи не собрал сборщик мусора)
+_background = set()
+
+async def finish_registration(message: types.Message, messages: dict, username: str):
+    """Анимация синхронизации и приветственные сообщения после сохранения пользователя."""
+    telegram_id = message.from_user.id
+    try:
+        await loading_animation(message)
+        await fake_console_logs(message)
+        logger.info(f"Анимация синхронизации показана для user_id={telegram_id}")
+    except Exception as e:
+        logger.error(f"Ошибка анимации для user_id={telegram_id}: {e}")
+    try:
+        # Отправляем сообщение с обращением к оператору
+        welcome_message = messages["welcome"].format(username=username)
+        await delivery.call(REGISTRATION, message.answer, welcome_message)
+        # Финальное сообщение о регистрации
+        await delivery.call(REGISTRATION, message.answer, messages["final_welcome"])
+        await delivery.call(REGISTRATION, message.answer, "✅ Registration complete!", reply_markup=ReplyKeyboardRemove())
+    except Exception as e:
+        logger.error(f"Ошибка завершения регистрации для user_id={telegram_id}: {e}")
 
 def register_user_handlers(dp: Dispatcher, bot):
     """Регистрирует пользовательские обработчики."""
     logger.info("Регистрация пользовательских обработчиков в user_bot.py")
 
-    @dp.message(NotAdminChatFilter(), CommandStart())
+    # Пользовательский сценарий работает только в личных чатах
+    router = Router(name="user")
+    router.message.filter(F.chat.type == "private")
+    router.callback_query.filter(F.message.chat.type == "private")
+    callbacks = CallbackRegistry()
+
+    @router.message(CommandStart())
     async def start_handler(message: types.Message, state: FSMContext):
         telegram_id = message.from_user.id
         logger.info(f"/start от user_id={telegram_id}, chat_id={message.chat.id}")
+        # Пользователь снова пишет боту — значит, разблокировал его
+        reachability.report_ok(telegram_id)
 
         try:
-            if check_user_registration(telegram_id):
-                user = get_user(telegram_id)
-                if not user:
-                    logger.error(f"Пользователь {telegram_id} зарегистрирован, но не найден")
-                    await message.answer("❌ Error, try again")
-                    return
-                country = user[3] or "Unknown"
-                lang_code = get_user_language(country)
+            # Индекс в памяти отвечает без БД; пока он не загружен — одна выборка строки
+            if registered_index.loaded:
+                lang_code = registered_index.language(telegram_id)
+            else:
+                user = await asyncio.to_thread(get_user, telegram_id)
+                lang_code = get_user_language(user[3] or "Unknown") if user else None
+            if lang_code:
                 messages = load_language_messages(lang_code)
-                await message.answer(messages["already_registered"])
+                await delivery.call(REGISTRATION, message.answer, messages["already_registered"])
                 return
 
             logger.info(f"Начало регистрации для user_id={telegram_id}")
             await state.set_state(AuthState.waiting_for_password)
             messages = load_language_messages("en")  # Используем английский для начального сообщения
-            await message.answer(messages["enter_password"])
+            await delivery.call(REGISTRATION, message.answer, messages["enter_password"])
         except Exception as e:
             logger.error(f"Ошибка обработки /start для user_id={telegram_id}: {e}")
-            await message.answer("❌ Error, try again")
+            await delivery.call(REGISTRATION, message.answer, "❌ Error, try again")
 
-    @dp.message(AuthState.waiting_for_password)
+    @router.message(AuthState.waiting_for_password)
     async def password_handler(message: types.Message, state: FSMContext):
         telegram_id = message.from_user.id
         logger.info(f"Пароль от user_id={telegram_id}")
@@ -131,14 +107,14 @@ def register_user_handlers(dp: Dispatcher, bot):
                         [InlineKeyboardButton(text="🔄 Synchronize", callback_data="request_sync")]
                     ]
                 )
-                await message.answer(messages["password_correct"], reply_markup=keyboard)
+                await delivery.call(REGISTRATION, message.answer, messages["password_correct"], reply_markup=keyboard)
             else:
-                await message.answer(messages["password_incorrect"])
+                await delivery.call(REGISTRATION, message.answer, messages["password_incorrect"])
         except Exception as e:
             logger.error(f"Ошибка обработки пароля для user_id={telegram_id}: {e}")
-            await message.answer("❌ Error, try again")
+            await delivery.call(REGISTRATION, message.answer, "❌ Error, try again")
 
-    @dp.callback_query(lambda c: c.data == "request_sync")
+    @callbacks("request_sync")
     async def request_sync_handler(callback: types.CallbackQuery, state: FSMContext):
         telegram_id = callback.from_user.id
         logger.info(f"Запрос синхронизации от user_id={telegram_id}")
@@ -150,16 +126,16 @@ def register_user_handlers(dp: Dispatcher, bot):
                 one_time_keyboard=True
             )
             # Отправляем новое сообщение вместо редактирования
-            await callback.message.answer(messages["sync"], reply_markup=keyboard)
+            await delivery.call(REGISTRATION, callback.message.answer, messages["sync"], reply_markup=keyboard)
             # Удаляем старое сообщение с inline-кнопкой
-            await callback.message.delete()
-            await callback.answer()
+            await delivery.call(REGISTRATION, callback.message.delete)
+            await delivery.call(REGISTRATION, callback.answer)
         except Exception as e:
             logger.error(f"Ошибка обработки синхронизации для user_id={telegram_id}: {e}")
-            await callback.message.answer("❌ Error, try again")
-            await callback.message.delete()
+            await delivery.call(REGISTRATION, callback.message.answer, "❌ Error, try again")
+            await delivery.call(REGISTRATION, callback.message.delete)
 
-    @dp.message(AuthState.waiting_for_sync)
+    @router.message(AuthState.waiting_for_sync)
     async def sync_handler(message: types.Message, state: FSMContext):
         telegram_id = message.from_user.id
         logger.info(f"Синхронизация от user_id={telegram_id}")
@@ -167,7 +143,7 @@ def register_user_handlers(dp: Dispatcher, bot):
             if not message.contact:
                 logger.warning(f"Нет контакта от user_id={telegram_id}")
                 messages = load_language_messages("en")  # Английский для ошибки
-                await message.answer(messages["sync"])
+                await delivery.call(REGISTRATION, message.answer, messages["sync"])
                 return
 
             phone = message.contact.phone_number
@@ -176,43 +152,31 @@ def register_user_handlers(dp: Dispatcher, bot):
             lang_code = get_user_language(country)
             messages = load_language_messages(lang_code)
 
-            if save_user(telegram_id, username, phone, country):
-                try:
-                    # Отправка уведомления в админский чат
-                    await bot.send_message(
-                        CHAT_ID,
-                        f"🎣 Новый пользователь зарегистрирован!\n"
-                        f"🆔 ID: <code>{telegram_id}</code>\n"
-                        f"👤 Username: @{username}\n"
-                        f"📱 Number: <code>{phone}</code>",
-                        parse_mode="HTML"
-                    )
-                    logger.info(f"Уведомление отправлено в CHAT_ID={CHAT_ID} для user_id={telegram_id}")
-                except Exception as e:
-                    logger.error(f"Ошибка уведомления в CHAT_ID={CHAT_ID} для user_id={telegram_id}: {e}")
-
-                # Показываем анимацию синхронизации
-                try:
-                    await loading_animation(message)
-                    await fake_console_logs(message)
-                    logger.info(f"Анимация синхронизации показана для user_id={telegram_id}")
-                except Exception as e:
-                    logger.error(f"Ошибка анимации для user_id={telegram_id}: {e}")
-
-                # Отправляем сообщение с обращением к оператору
-                welcome_message = messages["welcome"].format(username=username)
-                await message.answer(welcome_message)
-
-                # Финальное сообщение о регистрации
-                await message.answer(messages["final_welcome"])
+            # Запись в БД — в потоке: медленный основной сервер не останавливает цикл событий при наплыве регистраций
+            if await asyncio.to_thread(save_user, telegram_id, username, phone, country):
+                registered_index.add(telegram_id, country)
+                # Уведомление в админский чат уходит сводкой, обработчик его не ждет
+                admin_notifier.notify(
+                    "registrations",
+                    "🎣 Новые пользователи",
+                    f"🆔 <code>{telegram_id}</code> 👤 @{html.escape(username)} 📱 <code>{html.escape(phone)}</code>"
+                )
+
+                await state.clear()
+                # Анимация идет около полутора минут — отдельной задачей, чтобы не держать слот исполнителя апдейтов
+                task = asyncio.create_task(finish_registration(message, messages, username))
+                _background.add(task)
+                task.add_done_callback(_background.discard)
             else:
                 logger.warning(f"Ошибка сохранения user_id={telegram_id}, возможно дубликат")
-                await message.answer(messages["already_registered"])
-
-            await state.clear()
-            await message.answer("✅ Registration complete!", reply_markup=ReplyKeyboardRemove())
+                await delivery.call(REGISTRATION, message.answer, messages["already_registered"])
+                await state.clear()
+                await delivery.call(REGISTRATION, message.answer, "✅ Registration complete!", reply_markup=ReplyKeyboardRemove())
         except Exception as e:
             logger.error(f"Ошибка обработки синхронизации для user_id={telegram_id}: {e}")
-            await message.answer("❌ Error, try again")
+            await delivery.call(REGISTRATION, message.answer, "❌ Error, try again")
             await state.clear()
-            await message.answer("❌ Registration failed!", reply_markup=ReplyKeyboardRemove())
\ No newline at end of file
+            await delivery.call(REGISTRATION, message.answer, "❌ Registration failed!", reply_markup=ReplyKeyboardRemove())
+
+    callbacks.attach(router)
+    dp.include_router(router)